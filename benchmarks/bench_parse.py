@@ -0,0 +1,67 @@
+"""Compare `dockside.io._parse_ts` against the original dataframe/lambda chain
+
+Usage: python benchmarks/bench_parse.py [n_values]
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+import pandas as pd
+import pandas.testing as pdtest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import synthetic  # noqa: E402
+
+from dockside import io  # noqa: E402
+
+
+def legacy_parse_ts(ts, daily):
+    param = ts["variable"]["variableName"]
+    if daily:
+        stat = ts["variable"]["options"]["option"][0]["value"]
+    else:
+        stat = None
+
+    col_levels = {False: ["param", "var"], True: ["param", "stat", "var"]}
+    sep = "xxxxx"
+
+    return (
+        pd.DataFrame(ts["values"][0]["value"])
+        .rename(columns=lambda c: "_orig_" + c)
+        .assign(datetime=lambda df: pd.to_datetime(df["_orig_dateTime"]))
+        .assign(qual=lambda df: df["_orig_qualifiers"].map(lambda x: ",".join(x)))
+        .assign(value=lambda df: df["_orig_value"].astype(float))
+        .loc[:, lambda df: df.columns.map(lambda c: not c.startswith("_orig"))]
+        .set_index("datetime")
+        .rename(columns=lambda c: sep.join(filter(lambda x: bool(x), [param, stat, c])))
+        .rename_axis("var", axis="columns")
+        .pipe(io._expand_columns, col_levels[daily], sep=sep)
+    )
+
+
+def main(n=35040):
+    for daily in (False, True):
+        ts = synthetic.timeseries("01234567", 0, "2010-01-01", n, daily=daily)
+        pdtest.assert_frame_equal(io._parse_ts(ts, daily), legacy_parse_ts(ts, daily))
+
+        timings = {}
+        for name, func in [("legacy", legacy_parse_ts), ("columnar", io._parse_ts)]:
+            runs = timeit.repeat(lambda: func(ts, daily), number=3, repeat=5)
+            timings[name] = min(runs) / 3
+
+        label = "daily" if daily else "insta"
+        print(
+            "{:>6} n={:<8d} legacy {:8.1f} ms   columnar {:8.1f} ms   {:5.1f}x".format(
+                label,
+                n,
+                timings["legacy"] * 1e3,
+                timings["columnar"] * 1e3,
+                timings["legacy"] / timings["columnar"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,290 @@
+"""Benchmark suite for the fetch, parse and cache hot paths
+
+Every case is timed (best of several runs) and its peak traced memory is
+recorded in a separate run. Network cases talk to a local stand-in for NWIS
+serving synthetic responses (see `synthetic.py`), so results only depend on
+this machine.
+
+Usage:
+    python benchmarks/run.py                  # quick sizes, a few minutes at most
+    python benchmarks/run.py --full           # up to 10 years, 20 parameters, 1000 sites
+    python benchmarks/run.py -k read_cache    # only cases whose name contains "read_cache"
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --compare baseline.json --tolerance 0.25
+
+With --compare, the exit status is 1 when any case got slower or used more
+memory than the baseline by more than the tolerance.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pandas
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import synthetic  # noqa: E402
+
+from dockside import io, nwis, stats, store  # noqa: E402
+from dockside.client import Client  # noqa: E402
+from dockside.tests.util import FakeNWIS  # noqa: E402
+
+CASES = {}
+
+
+def case(name, full=False):
+    """Register a benchmark
+
+    The decorated function is a context manager that does the setup and
+    yields the zero-argument callable to measure.
+    """
+
+    def decorator(func):
+        CASES[name] = (contextmanager(func), full)
+        return func
+
+    return decorator
+
+
+@contextmanager
+def stand_in_server():
+    """FakeNWIS serving synthetic responses matching the requested sites"""
+
+    bodies = {}
+
+    def body(path):
+        query = parse_qs(urlsplit(path).query)
+        sites = tuple(query["sites"][0].split(","))
+        daily = urlsplit(path).path.endswith("/dv")
+        key = (sites, daily)
+        if key not in bodies:
+            bodies[key] = synthetic.response_bytes(sites, params=1, days=1, daily=daily)
+        return bodies[key]
+
+    with FakeNWIS(default=(200, body, {"Content-Type": "application/json"})) as srv:
+        yield srv
+
+
+# -- parsing ------------------------------------------------------------------
+
+for _days, _full in [(1, False), (30, False), (365, False), (3650, True)]:
+
+    @case("parse_ts/iv/{}d".format(_days), full=_full)
+    def _parse_ts_iv(days=_days):
+        ts = synthetic.timeseries("01234567", 0, "2010-01-01", days * 96)
+        yield lambda: io._parse_ts(ts, daily=False)
+
+
+@case("parse_ts/dv/3650d")
+def _parse_ts_dv():
+    ts = synthetic.timeseries("01234567", 0, "2010-01-01", 3650, daily=True)
+    yield lambda: io._parse_ts(ts, daily=True)
+
+
+for _days, _params, _full in [
+    (30, 1, False),
+    (30, 5, False),
+    (30, 20, False),
+    (365, 20, True),
+    (3650, 1, True),
+]:
+
+    @case("read_nwis/iv/{}d/{}p".format(_days, _params), full=_full)
+    def _read_nwis(days=_days, params=_params):
+        site_json = synthetic.response(params=params, days=days)
+        yield lambda: io.read_nwis(site_json, daily=False)
+
+    @case("read_nwis_stream/iv/{}d/{}p".format(_days, _params), full=_full)
+    def _read_nwis_stream(days=_days, params=_params):
+        body = synthetic.response_bytes(params=params, days=days)
+        chunks = [body[i : i + 65536] for i in range(0, len(body), 65536)]
+        yield lambda: io.read_nwis_stream(chunks, daily=False)
+
+    # parsing from the response body, so that JSON decoding is included
+    @case("read_body/json/iv/{}d/{}p".format(_days, _params), full=_full)
+    def _read_body_json(days=_days, params=_params):
+        body = synthetic.response_bytes(params=params, days=days)
+        yield lambda: io.read_nwis(json.loads(body), daily=False)
+
+    @case("read_body/rdb/iv/{}d/{}p".format(_days, _params), full=_full)
+    def _read_body_rdb(days=_days, params=_params):
+        body = synthetic.response_rdb(params=params, days=days).encode("utf-8")
+        yield lambda: io.read_nwis_rdb(body, daily=False)
+
+
+@case("read_nwis/iv/365d/20p/4workers", full=True)
+def _read_nwis_workers():
+    site_json = synthetic.response(params=20, days=365)
+    yield lambda: io.read_nwis(site_json, daily=False, workers=4)
+
+
+for _days, _params, _full in [(30, 5, False), (365, 20, True)]:
+
+    @case("aggregate/iv/{}d/{}p".format(_days, _params), full=_full)
+    def _aggregate(days=_days, params=_params):
+        df = io.read_nwis(synthetic.response(params=params, days=days))
+        yield lambda: stats.aggregate(df, stats=list(stats.STATISTICS))
+
+
+# -- cache I/O ----------------------------------------------------------------
+
+for _fmt in ["csv", "parquet", "feather"]:
+    for _days, _params, _full in [(30, 5, False), (365, 20, True)]:
+
+        @case("read_cache/{}/{}d/{}p".format(_fmt, _days, _params), full=_full)
+        def _read_cache(fmt=_fmt, days=_days, params=_params):
+            df = io.read_nwis(synthetic.response(params=params, days=days))
+            with tempfile.TemporaryDirectory() as td:
+                fpath = io.write_cache(df, Path(td) / ("cache." + fmt))
+                yield lambda: io.read_cache(fpath)
+
+        @case("write_cache/{}/{}d/{}p".format(_fmt, _days, _params), full=_full)
+        def _write_cache(fmt=_fmt, days=_days, params=_params):
+            df = io.read_nwis(synthetic.response(params=params, days=days))
+            with tempfile.TemporaryDirectory() as td:
+                yield lambda: io.write_cache(df, Path(td) / ("cache." + fmt))
+
+
+for _days, _params, _full in [(30, 5, False), (365, 20, True)]:
+
+    # one week out of the stored window
+    @case("store_read/{}d/{}p".format(_days, _params), full=_full)
+    def _store_read(days=_days, params=_params):
+        df = io.read_nwis(synthetic.response(params=params, days=days))
+        start = df.index[0].normalize().tz_localize(None)
+        end = start + (days // 2 + 6) * pandas.Timedelta(days=1)
+        with tempfile.TemporaryDirectory() as td:
+            arrays = store.ArrayStore(td)
+            arrays.write("01234567", df)
+            yield lambda: arrays.read("01234567", end - pandas.Timedelta(days=6), end)
+
+
+# -- network ------------------------------------------------------------------
+
+for _fmt in ["csv", "parquet"]:
+
+    @case("get_data/{}/30d/5p".format(_fmt))
+    def _get_data(fmt=_fmt):
+        body = synthetic.response_bytes(params=5, days=30)
+        with FakeNWIS(default=(200, body, None)) as srv:
+            with Client(
+                base_url=srv.url
+            ) as client, tempfile.TemporaryDirectory() as td:
+                station = nwis.Station(
+                    "01234567",
+                    "2010-01-01",
+                    "2010-01-30",
+                    savepath=td,
+                    client=client,
+                    cache_format=fmt,
+                )
+                yield lambda: station.get_data(save=True, force=True)
+
+
+for _sites, _full in [(10, False), (100, False), (1000, True)]:
+
+    @case("fetch_many/iv/{}sites".format(_sites), full=_full)
+    def _fetch_many(n=_sites):
+        sites = ["{:08d}".format(i) for i in range(n)]
+        with stand_in_server() as srv:
+            with Client(base_url=srv.url, pool_size=8) as client:
+                yield lambda: io.fetch_many(
+                    sites, "2010-01-01", "2010-01-01", max_workers=8, client=client
+                )
+
+    @case("fetch_batched/iv/{}sites".format(_sites), full=_full)
+    def _fetch_batched(n=_sites):
+        sites = ["{:08d}".format(i) for i in range(n)]
+        with stand_in_server() as srv:
+            with Client(base_url=srv.url, pool_size=8) as client:
+                yield lambda: io.fetch_batched(
+                    sites, "2010-01-01", "2010-01-01", max_workers=8, client=client
+                )
+
+
+# -- runner -------------------------------------------------------------------
+
+
+def measure(func, min_runs=3, min_seconds=1.0):
+    """Best wall time over several runs, and peak traced memory of one run"""
+
+    func()  # warm up
+    times = []
+    started = time.perf_counter()
+    while len(times) < min_runs or time.perf_counter() - started < min_seconds:
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+        if len(times) >= 100:
+            break
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "peak_bytes": peak, "runs": len(times)}
+
+
+def compare(results, baseline, tolerance):
+    """Names and descriptions of the cases that regressed"""
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("seconds", "peak_bytes"):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(
+                    "{}: {} {:.4g} -> {:.4g}".format(name, key, base[key], result[key])
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--full", action="store_true", help="include the large cases")
+    parser.add_argument("-k", dest="select", default="", help="substring filter")
+    parser.add_argument("--save", type=Path, help="write the results to this file")
+    parser.add_argument("--compare", type=Path, help="baseline results to compare")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = {}
+    print("{:<40} {:>12} {:>12} {:>6}".format("case", "time (ms)", "peak (MB)", "runs"))
+    for name, (setup, full) in CASES.items():
+        if (full and not args.full) or args.select not in name:
+            continue
+        with setup() as func:
+            results[name] = measure(func)
+        r = results[name]
+        print(
+            "{:<40} {:>12.2f} {:>12.2f} {:>6d}".format(
+                name, r["seconds"] * 1e3, r["peak_bytes"] / 2**20, r["runs"]
+            )
+        )
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2))
+
+    if args.compare:
+        regressions = compare(
+            results, json.loads(args.compare.read_text()), args.tolerance
+        )
+        for line in regressions:
+            print("REGRESSION " + line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Synthetic NWIS JSON and RDB responses with the same structure as the real
+service
+
+The values are random but the layout of each `timeSeries` (sourceInfo,
+variable, values, name) mirrors what the `dv` and `iv` services return, so the
+parsers do the same amount of work as they would on real responses. The RDB
+responses hold the same values as the JSON ones.
+"""
+
+import json
+import zlib
+
+import numpy
+import pandas as pd
+
+PARAMETERS = [
+    ("00060", "Streamflow, ft&#179;/s", "ft3/s"),
+    ("00065", "Gage height, ft", "ft"),
+    ("00010", "Temperature, water, &#176;C", "deg C"),
+    (
+        "00095",
+        "Specific conductance, water, unfiltered, microsiemens per centimeter at 25&#176;C",
+        "uS/cm @25C",
+    ),
+    ("00300", "Dissolved oxygen, water, unfiltered, mg/L", "mg/l"),
+    ("00400", "pH, water, unfiltered, field, standard units", "std units"),
+    (
+        "63680",
+        "Turbidity, water, unfiltered, monochrome near infra-red LED light, "
+        "780-900 nm, detection angle 90 +-2.5 degrees, "
+        "formazin nephelometric units (FNU)",
+        "FNU",
+    ),
+    ("00045", "Precipitation, total, in", "in"),
+    ("72019", "Depth to water level, ft below land surface", "ft"),
+    ("00062", "Elevation of reservoir water surface above datum, ft", "ft"),
+]
+STATISTICS = [("00003", "Mean"), ("00001", "Maximum"), ("00002", "Minimum")]
+QUALIFIERS = [["A"], ["A"], ["A"], ["P"], ["P", "e"], ["A", "e"]]
+
+
+def parameter(i):
+    """Code, name and unit of the i-th synthetic parameter (wrapping around)"""
+    code, name, unit = PARAMETERS[i % len(PARAMETERS)]
+    if i >= len(PARAMETERS):
+        name = "{}, sensor {}".format(name, i // len(PARAMETERS) + 1)
+    return code, name, unit
+
+
+def timeseries(site, param, start, periods, daily=False, stat=0, seed=0):
+    """A single `timeSeries` object
+
+    Parameters
+    ----------
+    site : string
+    param : int
+        Index into `PARAMETERS`.
+    start : date-like
+    periods : int
+        Number of values.
+    daily : bool (default is False)
+        Daily values (one per day) or instantaneous values (every 15 minutes,
+        with a fixed -05:00 offset).
+    stat : int (default is 0)
+        Index into `STATISTICS`, only used for daily values.
+    seed : int (default is 0)
+
+    Returns
+    -------
+    dict
+
+    """
+
+    rng = numpy.random.default_rng(seed)
+    code, name, unit = parameter(param)
+    if daily:
+        times = pd.date_range(start, periods=periods, freq="D")
+        stamps = times.strftime("%Y-%m-%dT%H:%M:%S.000")
+        stat_code, stat_name = STATISTICS[stat % len(STATISTICS)]
+        option = {"value": stat_name, "name": "Statistic", "optionCode": stat_code}
+    else:
+        times = pd.date_range(start, periods=periods, freq="15min")
+        stamps = times.strftime("%Y-%m-%dT%H:%M:%S.000-05:00")
+        stat_code = "00000"
+        option = {"name": "Statistic", "optionCode": stat_code}
+
+    values = numpy.round(rng.gamma(2.0, 25.0, size=periods), 2)
+    quals = rng.integers(0, len(QUALIFIERS), size=periods)
+    return {
+        "sourceInfo": {
+            "siteName": "SYNTHETIC CREEK NO {}".format(site),
+            "siteCode": [{"value": site, "network": "NWIS", "agencyCode": "USGS"}],
+            "timeZoneInfo": {
+                "defaultTimeZone": {"zoneOffset": "-05:00", "zoneAbbreviation": "EST"},
+                "siteUsesDaylightSavingsTime": False,
+            },
+            "geoLocation": {
+                "geogLocation": {
+                    "srs": "EPSG:4326",
+                    "latitude": 45.0,
+                    "longitude": -122.0,
+                }
+            },
+        },
+        "variable": {
+            "variableCode": [
+                {"value": code, "network": "NWIS", "vocabulary": "NWIS:UnitValues"}
+            ],
+            "variableName": name,
+            "unit": {"unitCode": unit},
+            "noDataValue": -999999.0,
+            "options": {"option": [option]},
+        },
+        "values": [
+            {
+                "value": [
+                    {
+                        "value": "{:.2f}".format(v),
+                        "qualifiers": QUALIFIERS[q],
+                        "dateTime": t,
+                    }
+                    for v, q, t in zip(values, quals, stamps)
+                ],
+                "qualifier": [],
+                "method": [{"methodDescription": "", "methodID": 100 + param}],
+            }
+        ],
+        "name": "USGS:{}:{}:{}".format(site, code, stat_code),
+    }
+
+
+def response(sites=("01234567",), params=1, days=1, daily=False, start="2010-01-01"):
+    """A complete NWIS JSON response
+
+    Parameters
+    ----------
+    sites : sequence of strings
+    params : int
+        Number of parameters per site.
+    days : int
+        Length of the period.
+    daily : bool (default is False)
+    start : date-like
+
+    Returns
+    -------
+    dict
+
+    """
+
+    periods = days if daily else days * 96
+    series = [
+        timeseries(
+            site,
+            p,
+            start,
+            periods,
+            daily=daily,
+            seed=zlib.crc32("{}:{}".format(site, p).encode()),
+        )
+        for site in sites
+        for p in range(params)
+    ]
+    return {
+        "name": "ns1:timeSeriesResponseType",
+        "declaredType": "org.cuahsi.waterml.TimeSeriesResponseType",
+        "scope": "javax.xml.bind.JAXBElement$GlobalScope",
+        "value": {
+            "queryInfo": {
+                "queryURL": "http://nwis.waterservices.usgs.gov/nwis/{}/".format(
+                    "dv" if daily else "iv"
+                ),
+                "criteria": {"locationParam": "[ALL:{}]".format(",".join(sites))},
+                "note": [],
+            },
+            "timeSeries": series,
+        },
+        "nil": False,
+        "globalScope": True,
+        "typeSubstituted": False,
+    }
+
+
+def response_bytes(*args, **kwargs):
+    """`response` serialized to UTF-8 JSON"""
+    return json.dumps(response(*args, **kwargs)).encode("utf-8")
+
+
+def response_rdb(
+    sites=("01234567",), params=1, days=1, daily=False, start="2010-01-01"
+):
+    """The same data as `response`, in the tab-delimited RDB format
+
+    Returns
+    -------
+    string
+
+    """
+
+    by_site = {}
+    for ts in response(sites, params, days, daily, start)["value"]["timeSeries"]:
+        by_site.setdefault(ts["sourceInfo"]["siteCode"][0]["value"], []).append(ts)
+
+    lines = ["# ---------------------------------- WARNING ---------------------"]
+    for site, series in by_site.items():
+        lines += [
+            "#",
+            "# Data provided for site {}".format(site),
+            (
+                "#    TS_ID  Parameter Statistic     Description"
+                if daily
+                else "#            TS   parameter     Description"
+            ),
+        ]
+        columns = ["agency_cd", "site_no", "datetime"] + ([] if daily else ["tz_cd"])
+        table = None
+        for ts in series:
+            ts_id = ts["values"][0]["method"][0]["methodID"]
+            code = ts["variable"]["variableCode"][0]["value"]
+            option = ts["variable"]["options"]["option"][0]
+            name = ts["variable"]["variableName"]
+            if daily:
+                column = "{}_{}_{}".format(ts_id, code, option["optionCode"])
+                lines.append(
+                    "#    {:>5}      {}     {}     {} ({})".format(
+                        ts_id, code, option["optionCode"], name, option["value"]
+                    )
+                )
+            else:
+                column = "{}_{}".format(ts_id, code)
+                lines.append(
+                    "#         {:>5}       {}     {}".format(ts_id, code, name)
+                )
+            columns += [column, column + "_cd"]
+
+            records = ts["values"][0]["value"]
+            if table is None:
+                table = [
+                    [
+                        "USGS",
+                        site,
+                        rec["dateTime"][: 10 if daily else 16].replace("T", " "),
+                    ]
+                    + ([] if daily else ["EST"])
+                    for rec in records
+                ]
+            for row, rec in zip(table, records):
+                row += [rec["value"], ":".join(rec["qualifiers"])]
+
+        lines += ["#", "\t".join(columns)]
+        widths = ["5s", "15s", "20d"] + ([] if daily else ["6s"])
+        lines.append("\t".join(widths + ["14n", "10s"] * len(series)))
+        lines += ["\t".join(row) for row in table]
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,83 @@
-from .nwis import Station
-from .io import *
+"""Download NWIS data without too much fuss
 
-from .tests import test, teststrict, test_nowarnings
+The public names below are imported from their submodules on first use, so
+``import dockside`` stays cheap and does not load pandas, requests, or the
+test helpers until they are needed.
+"""
+
+import importlib
 
 __author__ = "Lucas Nguyen (Geosyntec Consultants)"
 __version__ = "0.1.2"
 __license__ = "BSD 3-clause"
+
+_IO_NAMES = [
+    "CACHE_FORMATS",
+    "PARALLEL_MIN_VALUES",
+    "QUALIFIER_CODES",
+    "QUALIFIER_OTHER",
+    "RDB_TIMEZONES",
+    "cache_format",
+    "combine_sites",
+    "date_chunks",
+    "decode_qualifiers",
+    "download_nwis",
+    "encode_qualifiers",
+    "fetch_batched",
+    "fetch_many",
+    "fetch_nwis",
+    "get_client",
+    "iter_frames",
+    "iter_nwis",
+    "iter_timeseries",
+    "read_cache",
+    "read_nwis",
+    "read_nwis_chunked",
+    "read_nwis_file",
+    "read_nwis_rdb",
+    "read_nwis_stream",
+    "write_cache",
+]
+
+# public name -> submodule that defines it
+_LAZY = {
+    "Client": "client",
+    "Governor": "client",
+    "Station": "nwis",
+    "StationCollection": "nwis",
+    "test": "tests",
+    "teststrict": "tests",
+    "test_nowarnings": "tests",
+    **{name: "io" for name in _IO_NAMES},
+}
+
+_SUBMODULES = [
+    "aio",
+    "cache",
+    "catalog",
+    "cli",
+    "client",
+    "instrument",
+    "io",
+    "nwis",
+    "stats",
+    "store",
+    "tests",
+]
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    if name in _LAZY:
+        module = importlib.import_module("." + _LAZY[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted([*globals(), *_LAZY, *_SUBMODULES])
@@ -0,0 +1,450 @@
+import asyncio
+import functools
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .client import ACCEPT_ENCODING, NWIS_URL, RETRY_STATUSES, Backoff, _describe
+from .instrument import span
+from .io import read_nwis, read_cache, write_cache, _decode, _nwis_request
+from .nwis import Station
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+def _query(params):
+    """
+    Query string pairs with the same encoding as `requests`: list-like values
+    repeat the key and everything else is converted to a string
+    """
+
+    pairs = []
+    for name, value in (params or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            pairs.extend((name, str(v)) for v in value)
+        elif value is not None:
+            pairs.append((name, str(value)))
+    return pairs
+
+
+async def _blocking(func, *args, **kwargs):
+    """
+    Runs `func` on the loop's default executor so that parsing and disk and
+    sqlite work (the response cache, the catalog) do not stall other tasks
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+class AsyncClient(Backoff):
+    """Pooled asyncio HTTP session for talking to NWIS
+
+    The asyncio counterpart of `dockside.Client`, built on aiohttp. Requests
+    from any number of tasks share one connection pool and at most `limit`
+    of them are in flight at a time, so thousands of sites can be requested
+    from a single thread.
+
+    Parameters
+    ----------
+    limit : int (default is 100)
+        Maximum number of requests in flight, and of open connections.
+    retries : int (default is 3)
+        Number of times a request is retried after a connection error, a
+        timeout, or a response with a status code in `retry_statuses`.
+    backoff : float (default is 0.5)
+        Base delay in seconds, see `dockside.Client`. Tasks waiting to retry
+        do not count against `limit`.
+    max_backoff : float (default is 30)
+        Upper limit in seconds for any single delay.
+    timeout : float or (float, float) tuple (default is (3.05, 60))
+        Connect and read timeouts.
+    retry_statuses : sequence of ints
+        HTTP status codes that are considered transient.
+    base_url : string, optional
+        Root of the NWIS web services.
+    cache : dockside.cache.ResponseCache, optional
+        Persistent response cache consulted before any request is sent.
+
+    Examples
+    --------
+    >>> import asyncio
+    >>> from dockside.aio import AsyncClient, fetch_nwis_async
+    >>> async def main():
+    ...     async with AsyncClient(limit=50) as client:
+    ...         r = await fetch_nwis_async(14211500, '2018-01-01',
+    ...                                    '2018-06-30', client=client)
+    ...         return r.json()
+    >>> data = asyncio.run(main())
+
+    """
+
+    def __init__(
+        self,
+        limit=100,
+        retries=3,
+        backoff=0.5,
+        max_backoff=30,
+        timeout=(3.05, 60),
+        retry_statuses=RETRY_STATUSES,
+        base_url=NWIS_URL,
+        cache=None,
+    ):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp required for `AsyncClient`")
+
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.limit = limit
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retry_statuses = frozenset(retry_statuses)
+
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+        self._semaphore = None
+
+    def _client_timeout(self):
+        if isinstance(self.timeout, (list, tuple)):
+            connect, read = self.timeout
+        else:
+            connect = read = self.timeout
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+    @property
+    def session(self):
+        """The aiohttp session, created on first use inside the event loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                timeout=self._client_timeout(),
+                headers={"Accept-Encoding": ACCEPT_ENCODING},
+            )
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._session
+
+    async def get(self, url, params=None):
+        """Send a GET request, retrying transient failures
+
+        Parameters
+        ----------
+        url : string
+        params : dict, optional
+            Query string parameters.
+
+        Returns
+        -------
+        requests.Response
+            The first non-transient response, or the last response received
+            once the retries are exhausted, with its body already read.
+
+        """
+
+        with span("fetch", url=url) as rec:
+            if self.cache is not None:
+                cached = await _blocking(self.cache.get, url, params)
+                if cached is not None:
+                    rec.update(_describe(cached), cached=True)
+                    return cached
+
+            response = await self._send(url, params)
+            rec.update(_describe(response), cached=False)
+            if self.cache is not None:
+                await _blocking(self.cache.put, url, params, response)
+        return response
+
+    async def _send(self, url, params):
+        session = self.session
+        query = _query(params)
+        for attempt in range(self.retries + 1):
+            final = attempt == self.retries
+            try:
+                async with self._semaphore:
+                    async with session.get(url, params=query) as r:
+                        response = await _to_response(r)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if final:
+                    raise
+                await asyncio.sleep(self.delay(attempt))
+                continue
+
+            if response.status_code not in self.retry_statuses or final:
+                return response
+            await asyncio.sleep(self.delay(attempt, response))
+
+
+async def _to_response(r):
+    """
+    Reads an aiohttp response into a `requests.Response` so that the rest
+    of dockside can treat it like any other
+    """
+
+    response = requests.Response()
+    response.status_code = r.status
+    response.reason = r.reason
+    response.url = str(r.url)
+    response.headers = CaseInsensitiveDict(r.headers)
+    response.encoding = r.charset
+    response._content = await r.read()
+    return response
+
+
+async def fetch_nwis_async(site, start, end, daily=False, client=None, **kwargs):
+    """Fetch JSON data from NWIS without blocking the event loop
+
+    Parameters
+    ----------
+    site : int, string, or sequence
+        Site ID number from NWIS.
+    start, end : string or date-like
+        Some form of date representation for the start and end of the NWIS
+        observations you'd like to download
+    daily : bool (default is False)
+        Toggles downloading daily (True) or instanteous values (False, default)
+    client : dockside.aio.AsyncClient, optional
+        Pooled client used to send the request. When not provided, a
+        client is opened and closed for this request alone.
+
+    Additional Parameters
+    ---------------------
+    All additional keyword arguments are passed directly to the NWIS API.
+
+    Returns
+    -------
+    requests.Response
+        The response, with its body already downloaded.
+
+    """
+
+    if client is None:
+        async with AsyncClient() as client:
+            return await fetch_nwis_async(
+                site, start, end, daily=daily, client=client, **kwargs
+            )
+
+    url_base, url_params = _nwis_request(
+        client.base_url, site, start, end, daily=daily, **kwargs
+    )
+    return await client.get(url_base, params=url_params)
+
+
+def _parse(r, daily):
+    """Decodes and parses a response, off the event loop"""
+    return read_nwis(_decode(r), daily=daily)
+
+
+async def read_nwis_async(site, start, end, daily=False, client=None, **kwargs):
+    """Fetch and parse the data for a site
+
+    Parameters are the same as for `fetch_nwis_async`. Raises
+    `requests.HTTPError` for error responses.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        See `dockside.io.read_nwis`.
+
+    """
+
+    r = await fetch_nwis_async(site, start, end, daily=daily, client=client, **kwargs)
+    r.raise_for_status()
+    return await _blocking(_parse, r, daily)
+
+
+async def fetch_many_async(sites, start, end, daily=False, client=None, **kwargs):
+    """Fetch and parse data for many sites concurrently on one thread
+
+    Parameters
+    ----------
+    sites : sequence
+        Site ID numbers from NWIS.
+    start, end : string or date-like
+        Some form of date representation for the start and end of the NWIS
+        observations you'd like to download
+    daily : bool (default is False)
+        Toggles downloading daily (True) or instanteous values (False, default)
+    client : dockside.aio.AsyncClient, optional
+        Pooled client shared by all of the requests. Its `limit` caps the
+        number of requests in flight.
+
+    Additional Parameters
+    ---------------------
+    All additional keyword arguments are passed directly to the NWIS API.
+
+    Returns
+    -------
+    data, errors : dict
+        Same as `dockside.io.fetch_many`.
+
+    Notes
+    -----
+    Cancelling the task that awaits this coroutine cancels every request
+    that is still pending.
+
+    Examples
+    --------
+    >>> import asyncio
+    >>> from dockside.aio import AsyncClient, fetch_many_async
+    >>> async def main(sites):
+    ...     async with AsyncClient(limit=200) as client:
+    ...         return await fetch_many_async(sites, '2018-01-01',
+    ...                                       '2018-01-31', client=client)
+    >>> data, errors = asyncio.run(main(['14211500', '14211010']))
+
+    """
+
+    if client is None:
+        async with AsyncClient() as client:
+            return await fetch_many_async(
+                sites, start, end, daily=daily, client=client, **kwargs
+            )
+
+    data, errors = {}, {}
+
+    async def _fetch_one(site):
+        try:
+            data[site] = await read_nwis_async(
+                site, start, end, daily=daily, client=client, **kwargs
+            )
+        except Exception as e:
+            errors[site] = e
+
+    await asyncio.gather(*[_fetch_one(site) for site in sites])
+    ordered = {site: data[site] for site in sites if site in data}
+    return ordered, errors
+
+
+class AsyncStation(Station):
+    """USGS Station with awaitable download helpers
+
+    `daily_json`, `insta_json`, `daily_data`, and `insta_data` are awaitable:
+    the first access starts the download as a task on the running loop and
+    every later access awaits the same task, e.g.,
+    ``df = await station.insta_data``. A download that failed or was
+    cancelled is started again on the next access.
+
+    Parameters
+    ----------
+    site : int, string, or sequence
+        Site ID number from NWIS.
+    start, end : string or date-like
+        Start and end dates for the period of interest.
+    savepath : path-like
+        Path to where data would be saved when using the `get_data` method.
+    client : dockside.aio.AsyncClient, optional
+        Pooled client used for all requests made by the station.
+    cache_format : string (default is "csv")
+        Format of the files written by `get_data`.
+    parameters, statistics : string, int, or sequence, optional
+        NWIS parameter and statistic codes of the time series to download,
+        see `dockside.Station`.
+
+    """
+
+    def __init__(
+        self,
+        site,
+        start,
+        end,
+        savepath="data",
+        client=None,
+        cache_format="csv",
+        parameters=None,
+        statistics=None,
+    ):
+        super().__init__(
+            site,
+            start,
+            end,
+            savepath=savepath,
+            client=client,
+            cache_format=cache_format,
+            parameters=parameters,
+            statistics=statistics,
+        )
+
+    def _task(self, attr, factory):
+        task = getattr(self, attr)
+        if task is None or task.cancelled() or (task.done() and task.exception()):
+            task = asyncio.ensure_future(factory())
+            setattr(self, attr, task)
+        return task
+
+    async def _fetch_json(self, daily):
+        kwargs, _ = self._series(daily)
+        r = await fetch_nwis_async(
+            self.site, self.start, self.end, daily=daily, client=self.client, **kwargs
+        )
+        return await _blocking(_decode, r)
+
+    async def _read_data(self, daily):
+        site_json = await (self.daily_json if daily else self.insta_json)
+        kwargs, _ = self._series(daily)
+        return await _blocking(read_nwis, site_json, daily=daily, **kwargs)
+
+    @property
+    def daily_json(self):
+        return self._task("_daily_json", lambda: self._fetch_json(daily=True))
+
+    @property
+    def insta_json(self):
+        return self._task("_insta_json", lambda: self._fetch_json(daily=False))
+
+    @property
+    def daily_data(self):
+        return self._task("_daily_data", lambda: self._read_data(daily=True))
+
+    @property
+    def insta_data(self):
+        return self._task("_insta_data", lambda: self._read_data(daily=False))
+
+    def _save(self, df, fpath, daily):
+        write_cache(df, fpath, fmt=self.cache_format)
+        self._register(fpath, daily)
+
+    async def get_data(self, daily=False, save=False, force=False):
+        """
+        Fetch and save data for the site, see `dockside.Station.get_data`.
+        Catalog lookups and file reads and writes run on the loop's default
+        executor.
+        """
+
+        fpath = self._make_fpath(daily=daily)
+
+        if not fpath.exists() and not force:
+            df = await _blocking(self._from_catalog, daily)
+            if df is not None:
+                return df
+
+        if not fpath.exists() or force:
+            kwargs, _ = self._series(daily)
+            df = await read_nwis_async(
+                self.site,
+                self.start,
+                self.end,
+                daily=daily,
+                client=self.client,
+                **kwargs,
+            )
+            if save and df is not None:
+                self.savepath.mkdir(parents=True, exist_ok=True)
+                await _blocking(self._save, df, fpath, daily)
+        else:
+            df = await _blocking(read_cache, fpath, daily)
+        return df
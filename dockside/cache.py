@@ -0,0 +1,708 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .instrument import event
+from .io import (
+    fetch_nwis,
+    read_nwis,
+    read_nwis_chunked,
+    read_cache,
+    write_cache,
+    _decode,
+    _json_timezone,
+    _resolve_format,
+    _site_time,
+    _stitch,
+)
+
+ONE_DAY = pd.Timedelta(days=1)
+
+
+def _merge_ranges(ranges):
+    """
+    Merges overlapping or adjacent inclusive (start, end) date ranges
+    """
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + ONE_DAY:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _gaps(ranges, start, end):
+    """
+    Inclusive (start, end) date ranges within `start`..`end` that are not
+    covered by the (merged) `ranges`
+    """
+
+    gaps = []
+    cursor = start
+    for a, b in ranges:
+        if b < cursor:
+            continue
+        if a > end:
+            break
+        if a > cursor:
+            gaps.append((cursor, a - ONE_DAY))
+        cursor = b + ONE_DAY
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _in_utc(df):
+    """Whether `df` is indexed in UTC, like data across a DST change"""
+    return str(getattr(getattr(df, "index", None), "tz", None)) == "UTC"
+
+
+def _slice_dates(df, start, end, tz=None):
+    """
+    Rows of `df` from the first moment of `start` through the last moment of
+    `end`, compared in the wall-clock time of the site, like NWIS does.
+
+    Data across a daylight saving time change is indexed in UTC (see
+    `dockside.io.read_nwis`), which does not tell the wall-clock time. It is
+    converted to the site's time zone `tz` to be sliced, and comes back as a
+    fresh download of the window would. Without `tz`, None is returned for
+    such data.
+    """
+
+    index = df.index
+    utc = _in_utc(df)
+    if utc:
+        if tz is None:
+            return None
+        index = index.tz_convert(tz)
+    if getattr(index, "tz", None) is not None:
+        index = index.tz_localize(None)
+    df = df.loc[(index >= start) & (index < end + ONE_DAY)]
+    return _site_time(df, tz) if utc else df
+
+
+class IncrementalCache(object):
+    """On-disk store of NWIS data that only downloads what it is missing
+
+    Data is kept in one file per site and service (daily or instantaneous
+    values), next to a small JSON manifest that records which date ranges
+    have already been downloaded. A request for any window only fetches the
+    days that are not covered yet and merges them into the stored series.
+
+    Parameters
+    ----------
+    root : path-like
+        Directory that holds the cache. Created if needed.
+    fmt : string (default is "parquet")
+        Format of the data files, see `dockside.io.write_cache`.
+    client : dockside.Client, optional
+        Pooled HTTP client used for all downloads.
+    chunk : string or pandas.DateOffset, optional
+        Download large gaps in windows of this size, see
+        `dockside.io.read_nwis_chunked`.
+
+    Notes
+    -----
+    Days from today onward are returned but never marked as covered, since
+    NWIS may still be adding observations for them.
+
+    Instantaneous values across a daylight saving time change are stored in
+    UTC. Windows are cut from them in the site's time zone, which is taken
+    from the NWIS responses (or the `tz` given to `get`) and kept in the
+    manifest. While it is unknown, for instance when every gap was
+    downloaded with `chunk`, such windows are downloaded again instead.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> from dockside.cache import IncrementalCache
+    >>> cache = IncrementalCache(tempfile.mkdtemp())
+    >>> df = cache.get(14211500, '2018-01-01', '2018-06-30', daily=True)  # doctest: +SKIP
+    >>> # only 2018-07-01 is requested from NWIS
+    >>> df = cache.get(14211500, '2018-01-01', '2018-07-01', daily=True)  # doctest: +SKIP
+
+    """
+
+    def __init__(self, root, fmt="parquet", client=None, chunk=None):
+        self.root = Path(root)
+        self.fmt = _resolve_format(fmt)
+        self.client = client
+        self.chunk = chunk
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # site -> time zone seen in its responses
+        self._zones = {}
+
+    def _lock(self, site, daily):
+        with self._locks_lock:
+            return self._locks.setdefault((str(site), daily), threading.Lock())
+
+    def _stem(self, site, daily):
+        return self.root / "{}_{}".format(site, "dv" if daily else "iv")
+
+    def data_path(self, site, daily=False):
+        """Path of the data file for a site and service"""
+        return self._stem(site, daily).with_suffix("." + self.fmt)
+
+    def manifest_path(self, site, daily=False):
+        """Path of the JSON manifest for a site and service"""
+        return self._stem(site, daily).with_suffix(".json")
+
+    def coverage(self, site, daily=False):
+        """Date ranges already held for a site
+
+        Parameters
+        ----------
+        site : int or string
+            Site ID number from NWIS.
+        daily : bool (default is False)
+            Daily (True) or instantaneous values (False).
+
+        Returns
+        -------
+        list of (pandas.Timestamp, pandas.Timestamp) tuples
+            Sorted, non-overlapping, inclusive date ranges.
+
+        """
+
+        ranges = self._manifest(site, daily).get("ranges", [])
+        return [(pd.Timestamp(a), pd.Timestamp(b)) for a, b in ranges]
+
+    def _manifest(self, site, daily):
+        mpath = self.manifest_path(site, daily=daily)
+        if not mpath.exists():
+            return {}
+        with mpath.open("r", encoding="utf-8") as fp:
+            return json.load(fp)
+
+    def _save(self, site, daily, df, ranges, tz=None):
+        self.root.mkdir(parents=True, exist_ok=True)
+        if df is not None:
+            write_cache(df, self.data_path(site, daily=daily), fmt=self.fmt)
+        manifest = {
+            "site": str(site),
+            "service": "dv" if daily else "iv",
+            "format": self.fmt,
+            "ranges": [
+                [a.strftime("%Y-%m-%d"), b.strftime("%Y-%m-%d")] for a, b in ranges
+            ],
+            "tz": tz,
+        }
+        with self.manifest_path(site, daily=daily).open("w", encoding="utf-8") as fp:
+            json.dump(manifest, fp, indent=2)
+
+    def _download(self, site, start, end, daily):
+        if self.chunk is not None:
+            return read_nwis_chunked(
+                site, start, end, daily=daily, chunk=self.chunk, client=self.client
+            )
+        r = fetch_nwis(site, start, end, daily=daily, client=self.client)
+        r.raise_for_status()
+        site_json = _decode(r)
+        zone = _json_timezone(site_json)
+        if zone is not None:
+            self._zones[str(site)] = zone
+        return read_nwis(site_json, daily=daily)
+
+    def get(self, site, start, end, daily=False, force=False, tz=None):
+        """Data for a site and window, downloading only the missing days
+
+        Parameters
+        ----------
+        site : int or string
+            Site ID number from NWIS.
+        start, end : string or date-like
+            Inclusive start and end dates of the window.
+        daily : bool (default is False)
+            Daily (True) or instantaneous values (False).
+        force : bool (default is False)
+            Redownload the whole window even if it is already covered.
+        tz : string, optional
+            IANA time zone of the site (e.g., "America/Los_Angeles"). Only
+            needed when the NWIS responses do not tell, see the notes.
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            None if NWIS has no data for the window.
+
+        """
+
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+
+        with self._lock(site, daily):
+            manifest = self._manifest(site, daily)
+            ranges = self.coverage(site, daily=daily)
+            dpath = self.data_path(site, daily=daily)
+            df = read_cache(dpath) if dpath.exists() else None
+
+            gaps = [(start, end)] if force else _gaps(ranges, start, end)
+            fetched = []
+            if gaps:
+                fetched = [self._download(site, a, b, daily) for a, b in gaps]
+                df = _stitch([df, *fetched])
+
+                today = pd.Timestamp.now().normalize()
+                done = [(a, min(b, today - ONE_DAY)) for a, b in gaps if a < today]
+                tz = tz or self._zones.get(str(site)) or manifest.get("tz")
+                self._save(site, daily, df, _merge_ranges([*ranges, *done]), tz)
+            tz = tz or manifest.get("tz")
+
+        if df is None:
+            return None
+        window = _slice_dates(df, start, end, tz=tz)
+        if window is None:
+            # the wall-clock time of the stored UTC data is unknown
+            if gaps == [(start, end)]:
+                return fetched[0]
+            window = self._download(site, start, end, daily)
+        return window
+
+
+class ResponseCache(object):
+    """Persistent, content-addressed cache of NWIS responses
+
+    Successful responses are stored under the SHA-256 hash of the normalized
+    request (URL plus sorted query parameters, with site lists sorted), so
+    identical queries from different processes or notebook sessions are only
+    sent to NWIS once. Attach the cache to a `dockside.Client`.
+
+    Parameters
+    ----------
+    root : path-like
+        Directory that holds the cached responses. Created if needed.
+    max_bytes : int (default is 1 GiB)
+        Size limit of the cache. When a new response pushes the total over
+        the limit, the least recently used responses are evicted until the
+        cache is back under 90% of it.
+    ttl : float (default is 3600)
+        Seconds that responses for recent windows stay valid.
+    recent_days : int (default is 7)
+        Responses whose `endDT` is at least this many days in the past are
+        historical and kept until evicted; anything newer, or without an
+        `endDT`, expires after `ttl`.
+    compress : bool (default is True)
+        Store the response bodies gzip-compressed. NWIS JSON compresses
+        about tenfold. Uncompressed entries are still read either way.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> from dockside import Client
+    >>> from dockside.cache import ResponseCache
+    >>> from dockside.io import fetch_nwis
+    >>> client = Client(cache=ResponseCache(tempfile.mkdtemp()))
+    >>> r1 = fetch_nwis(14211500, '2018-01-01', '2018-06-30',
+    ...                 client=client)  # doctest: +SKIP
+    >>> r2 = fetch_nwis(14211500, '2018-01-01', '2018-06-30',
+    ...                 client=client)  # doctest: +SKIP
+    >>> r2.from_cache  # doctest: +SKIP
+    True
+
+    """
+
+    def __init__(self, root, max_bytes=2**30, ttl=3600, recent_days=7, compress=True):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.recent_days = recent_days
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        # total size of the bodies, measured on the first `put`; other
+        # processes sharing `root` are only accounted for by `evict`
+        self._nbytes = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, params=None):
+        """Hash of the normalized request
+
+        Parameters
+        ----------
+        url : string
+        params : dict, optional
+            Query string parameters.
+
+        Returns
+        -------
+        string
+
+        """
+
+        normal = {}
+        for name, value in (params or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                value = ",".join(sorted(map(str, value)))
+            elif name == "sites":
+                value = ",".join(sorted(str(value).split(",")))
+            normal[str(name)] = str(value)
+        blob = json.dumps([url, sorted(normal.items())])
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        folder = self.root / key[:2]
+        return folder / (key + ".body"), folder / (key + ".json")
+
+    def _expires(self, params):
+        end = (params or {}).get("endDT")
+        if end is not None:
+            cutoff = pd.Timestamp.now().normalize() - pd.Timedelta(
+                days=self.recent_days
+            )
+            if pd.Timestamp(end) < cutoff:
+                return None
+        return time.time() + self.ttl
+
+    def get(self, url, params=None):
+        """Cached response for a request, or None on a miss
+
+        Returns
+        -------
+        requests.Response or None
+            Responses served from the cache have ``from_cache = True``.
+
+        """
+
+        key = self.key(url, params)
+        body_path, meta_path = self._paths(key)
+        try:
+            with meta_path.open("r", encoding="utf-8") as fp:
+                meta = json.load(fp)
+            expires = meta["expires"]
+            if expires is not None and expires < time.time():
+                self._remove(key)
+                raise FileNotFoundError(body_path)
+            body = body_path.read_bytes()
+            if body[:2] == b"\x1f\x8b":
+                body = gzip.decompress(body)
+        except (FileNotFoundError, ValueError, OSError, EOFError):
+            with self._lock:
+                self.misses += 1
+            event("response_cache", hit=False)
+            return None
+
+        # mark as recently used for the LRU eviction
+        os.utime(body_path)
+        with self._lock:
+            self.hits += 1
+        event("response_cache", hit=True)
+
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.reason = "OK"
+        response.url = meta["url"]
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response.encoding = meta.get("encoding")
+        response._content = body
+        # the body is already in memory, so it streams from `_content`
+        response._content_consumed = True
+        response.raw = None
+        response.from_cache = True
+        return response
+
+    def put(self, url, params, response):
+        """Store a successful response
+
+        Parameters
+        ----------
+        url : string
+        params : dict
+            Query string parameters of the request.
+        response : requests.Response
+            Only responses with a 200 status are stored. Streamed responses
+            whose body has not been read yet are skipped, so that storing
+            them does not download the body up front.
+
+        """
+
+        if response.status_code != 200 or response._content is False:
+            return
+
+        key = self.key(url, params)
+        body_path, meta_path = self._paths(key)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "url": response.url,
+            "status": response.status_code,
+            "headers": {
+                k: v
+                for k, v in response.headers.items()
+                if k.lower() in ("content-type", "last-modified", "date")
+            },
+            "encoding": response.encoding,
+            "expires": self._expires(params),
+        }
+
+        body = response.content
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+        try:
+            replaced = body_path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        _atomic_write(body_path, body)
+        _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+
+        with self._lock:
+            if self._nbytes is None:
+                self._nbytes = self.size()
+            else:
+                self._nbytes += len(body) - replaced
+            full = self._nbytes > self.max_bytes
+        if full:
+            self.evict()
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def size(self):
+        """Total size in bytes of the cached response bodies"""
+        return sum(p.stat().st_size for p in self.root.glob("*/*.body"))
+
+    def evict(self):
+        """Remove expired responses, then least recently used ones until the
+        cache fits in 90% of `max_bytes`"""
+
+        now = time.time()
+        entries = []
+        for body_path in self.root.glob("*/*.body"):
+            key = body_path.stem
+            meta_path = body_path.with_suffix(".json")
+            try:
+                stat = body_path.stat()
+                with meta_path.open("r", encoding="utf-8") as fp:
+                    expires = json.load(fp)["expires"]
+            except (FileNotFoundError, ValueError):
+                continue
+            if expires is not None and expires < now:
+                self._remove(key)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, key))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            # leave some room, so the next few puts do not scan again
+            for _, size, key in sorted(entries):
+                if total <= 0.9 * self.max_bytes:
+                    break
+                self._remove(key)
+                total -= size
+        with self._lock:
+            self._nbytes = total
+
+    def clear(self):
+        """Remove every cached response"""
+        for body_path in self.root.glob("*/*.body"):
+            self._remove(body_path.stem)
+        with self._lock:
+            self._nbytes = 0
+
+
+def _atomic_write(path, data):
+    """
+    Writes bytes to `path` through a temporary file so that concurrent
+    readers never see a partial file
+    """
+
+    tmp = path.with_name("{}.{}.tmp".format(path.name, uuid.uuid4().hex))
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class FrameCache(object):
+    """In-memory LRU of parsed NWIS dataframes, bounded in bytes
+
+    Frames are kept per site, service, and date window. A request for any
+    window that lies inside a cached one is answered by slicing the cached
+    frame, so overlapping `Station` objects for the same gauge only download
+    and parse the data once. Pass it (or the module-level cache returned by
+    `get_frame_cache`) to `Station` as `frame_cache`.
+
+    Parameters
+    ----------
+    max_bytes : int (default is 256 MiB)
+        Limit on the deep memory usage of the cached frames. The least
+        recently used frames are dropped to stay under it.
+    ttl : float (default is 600)
+        Seconds that frames for windows reaching today stay valid, since
+        NWIS may still be adding observations to them. Older windows are
+        kept until evicted.
+
+    Notes
+    -----
+    `put` stores a copy of the frame and `get` returns a copy, so callers
+    are free to modify what they get. `hits` and `misses` count the lookups. Instantaneous values
+    across a daylight saving time change can only be cut to a smaller window
+    when the site's time zone is known, see `put`; otherwise the lookup is a
+    miss.
+
+    Examples
+    --------
+    >>> from dockside import Station
+    >>> from dockside.cache import FrameCache
+    >>> frames = FrameCache()
+    >>> year = Station(14211500, '2018-01-01', '2018-12-31',
+    ...                frame_cache=frames).daily_data  # doctest: +SKIP
+    >>> june = Station(14211500, '2018-06-01', '2018-06-30',
+    ...                frame_cache=frames).daily_data  # doctest: +SKIP
+    >>> frames.hits  # doctest: +SKIP
+    1
+
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, ttl=600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        # (site, daily, start, end) -> (df, nbytes, expires, tz), oldest first
+        self._entries = OrderedDict()
+        # (site, daily) -> set of (start, end) windows
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _window(start, end):
+        return pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+
+    def _pop(self, key):
+        df, nbytes, _, _ = self._entries.pop(key)
+        self.nbytes -= nbytes
+        windows = self._windows[key[:2]]
+        windows.discard(key[2:])
+        if not windows:
+            del self._windows[key[:2]]
+
+    def get(self, site, start, end, daily=False, tz=None):
+        """Cached data for a site and window, or None on a miss
+
+        Parameters
+        ----------
+        site : int or string
+            Site ID number from NWIS.
+        start, end : string or date-like
+            Inclusive start and end dates of the window.
+        daily : bool (default is False)
+            Daily (True) or instantaneous values (False).
+        tz : string, optional
+            Time zone of the site, used when the cached frame was not stored
+            with one.
+
+        Returns
+        -------
+        pandas.DataFrame or None
+
+        """
+
+        start, end = self._window(start, end)
+        now = time.time()
+        df = None
+        with self._lock:
+            best = None
+            for a, b in list(self._windows.get((str(site), daily), ())):
+                key = (str(site), daily, a, b)
+                expires = self._entries[key][2]
+                if expires is not None and expires < now:
+                    self._pop(key)
+                elif (
+                    a <= start
+                    and end <= b
+                    and (best is None or b - a < best[3] - best[2])
+                ):
+                    best = key
+
+            if best is not None:
+                self._entries.move_to_end(best)
+                df, _, _, stored_tz = self._entries[best]
+
+        if df is not None:
+            if best[2:] == (start, end):
+                df = df.copy()
+            else:
+                df = _slice_dates(df, start, end, tz=stored_tz or tz)
+
+        with self._lock:
+            if df is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        event("frame_cache", hit=df is not None)
+        return df
+
+    def put(self, site, start, end, daily, df, tz=None):
+        """Add the data for a site and window
+
+        Frames larger than `max_bytes` and anything that is not a dataframe
+        (e.g., None when NWIS has no data) are not cached. `tz` is the time
+        zone of the site, when known (see `get`).
+        """
+
+        if not isinstance(df, pd.DataFrame):
+            return
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+
+        start, end = self._window(start, end)
+        expires = None
+        if end >= pd.Timestamp.now().normalize():
+            expires = time.time() + self.ttl
+
+        key = (str(site), daily, start, end)
+        with self._lock:
+            # windows inside the new one are redundant
+            for a, b in list(self._windows.get(key[:2], ())):
+                if start <= a and b <= end:
+                    self._pop((*key[:2], a, b))
+
+            self._entries[key] = (df.copy(), nbytes, expires, tz)
+            self._windows.setdefault(key[:2], set()).add((start, end))
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def clear(self):
+        """Drop every cached frame and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._windows.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+_frame_cache = None
+
+
+def get_frame_cache():
+    """
+    Returns the module-level `FrameCache` shared by default, creating it on
+    first use
+    """
+
+    global _frame_cache
+    if _frame_cache is None:
+        _frame_cache = FrameCache()
+    return _frame_cache
@@ -0,0 +1,383 @@
+"""Index of the data files saved by `dockside.Station.get_data`
+
+A `Catalog` is a small SQLite database in the save directory with one row
+per cached file: site, service, selected time series, covered dates, format,
+and size. `Station` asks it for any file that covers the requested window,
+so a file saved for a whole year also serves every window inside that year.
+"""
+
+import atexit
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+CATALOG_FILE = "catalog.sqlite"
+
+# catalogs kept open by `get_catalog`
+MAX_OPEN_CATALOGS = 32
+
+# file names made by `Station._make_fpath`
+_FNAME = re.compile(
+    r"^(?P<site>.+)_(?P<start>\d{8})_thru_(?P<end>\d{8})_(?P<kind>daily|insta)"
+    r"(?:_(?P<series>[ps][\d-]+(?:_s[\d-]+)?))?"
+    r"\.(?P<fmt>json\.gz|csv|parquet|feather)$"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    service TEXT NOT NULL,
+    series TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    bytes INTEGER,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_window
+    ON artifacts (site, service, series, start, end);
+"""
+
+_COLUMNS = [
+    "path",
+    "site",
+    "service",
+    "series",
+    "start",
+    "end",
+    "format",
+    "bytes",
+    "created",
+]
+
+
+def _service(daily):
+    return "dv" if daily else "iv"
+
+
+def _day(date):
+    return pd.Timestamp(date).strftime("%Y-%m-%d")
+
+
+def _format(path):
+    name = Path(path).name
+    if name.endswith(".json.gz"):
+        return "json.gz"
+    return Path(path).suffix.lstrip(".")
+
+
+class Catalog(object):
+    """Index of cached data files, kept in a SQLite database
+
+    Parameters
+    ----------
+    fpath : path-like
+        Location of the database. It is created, along with its directory,
+        when the first file is added; until then lookups find nothing.
+
+    Notes
+    -----
+    Paths are stored as given (`Station` uses paths inside its save
+    directory). Entries whose file has disappeared are dropped when a lookup
+    comes across them, or by `prune`.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> from pathlib import Path
+    >>> from dockside.catalog import Catalog
+    >>> data = Path(tempfile.mkdtemp())
+    >>> _ = (data / '14211500_20180101_thru_20181231_daily.csv').write_text('')
+    >>> catalog = Catalog(data / 'catalog.sqlite')
+    >>> catalog.scan(data)  # index files saved before the catalog existed
+    1
+    >>> catalog.find(14211500, '2018-03-01', '2018-03-31', daily=True).name
+    '14211500_20180101_thru_20181231_daily.csv'
+    >>> len(catalog.list(site=14211500))
+    1
+    >>> catalog.prune(max_bytes=10 * 2**30)
+    []
+    >>> catalog.close()
+
+    """
+
+    def __init__(self, fpath):
+        self.fpath = Path(fpath)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self, create):
+        if self._conn is None:
+            if not create and not self.fpath.exists():
+                return None
+            self.fpath.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.fpath), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+    def add(self, path, site, start, end, daily=False, fmt=None, series=""):
+        """Record a cached file, replacing any entry for the same path
+
+        Parameters
+        ----------
+        path : path-like
+        site : int or string
+            Site ID number from NWIS.
+        start, end : string or date-like
+            Inclusive dates covered by the file.
+        daily : bool (default is False)
+            Daily (True) or instantaneous values (False).
+        fmt : string, optional
+            Format of the file. Defaults to its extension.
+        series : string, optional
+            Tag of the time series the file is limited to (see
+            `Station.parameters`). Empty when it holds all of them.
+
+        """
+
+        try:
+            nbytes = Path(path).stat().st_size
+        except OSError:
+            nbytes = None
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        row = (
+            str(path),
+            str(site),
+            _service(daily),
+            series,
+            _day(start),
+            _day(end),
+            (end - start).days,
+            fmt or _format(path),
+            nbytes,
+            time.time(),
+        )
+        with self._lock:
+            conn = self._connect(create=True)
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO artifacts"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+
+    def remove(self, path, delete=False):
+        """Drop the entry for `path`, and the file itself when `delete`"""
+        with self._lock:
+            conn = self._connect(create=False)
+            if conn is not None:
+                with conn:
+                    conn.execute("DELETE FROM artifacts WHERE path = ?", (str(path),))
+        if delete:
+            Path(path).unlink(missing_ok=True)
+
+    def find(self, site, start, end, daily=False, series=""):
+        """Smallest cached file that covers a window
+
+        Parameters
+        ----------
+        site : int or string
+            Site ID number from NWIS.
+        start, end : string or date-like
+            Inclusive start and end dates of the window.
+        daily : bool (default is False)
+            Daily (True) or instantaneous values (False).
+        series : string, optional
+            Only consider files limited to these time series, see `add`.
+
+        Returns
+        -------
+        pathlib.Path or None
+
+        """
+
+        query = (
+            "SELECT path FROM artifacts"
+            " WHERE site = ? AND service = ? AND series = ?"
+            " AND start <= ? AND end >= ?"
+            " ORDER BY days, created DESC"
+        )
+        params = (str(site), _service(daily), series, _day(start), _day(end))
+        with self._lock:
+            conn = self._connect(create=False)
+            if conn is None:
+                return None
+            candidates = [Path(p) for (p,) in conn.execute(query, params)]
+
+        for path in candidates:
+            if path.exists():
+                return path
+            self.remove(path)
+
+    def list(self, site=None, daily=None):
+        """Cached files, optionally only those of a site or service
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per file with its path, site, service ("dv" or "iv"),
+            time series tag, start and end dates, format, size in bytes,
+            and the time it was added (seconds since the epoch).
+
+        """
+
+        clauses, params = [], []
+        if site is not None:
+            clauses.append("site = ?")
+            params.append(str(site))
+        if daily is not None:
+            clauses.append("service = ?")
+            params.append(_service(daily))
+        query = "SELECT {} FROM artifacts".format(", ".join(_COLUMNS))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY site, service, series, start, end"
+
+        with self._lock:
+            conn = self._connect(create=False)
+            rows = [] if conn is None else conn.execute(query, params).fetchall()
+        df = pd.DataFrame(rows, columns=_COLUMNS)
+        for col in ["start", "end"]:
+            df[col] = pd.to_datetime(df[col])
+        return df
+
+    def size(self):
+        """Total size in bytes of the cached files"""
+        with self._lock:
+            conn = self._connect(create=False)
+            if conn is None:
+                return 0
+            (total,) = conn.execute("SELECT SUM(bytes) FROM artifacts").fetchone()
+        return total or 0
+
+    def scan(self, directory):
+        """Add the files in `directory` that were saved by `Station`
+
+        Files whose names do not follow `Station`'s naming scheme are
+        ignored.
+
+        Returns
+        -------
+        int
+            The number of files added.
+
+        """
+
+        added = 0
+        for path in sorted(Path(directory).iterdir()):
+            match = _FNAME.match(path.name)
+            if match is None or not path.is_file():
+                continue
+            self.add(
+                path,
+                match["site"],
+                match["start"],
+                match["end"],
+                daily=match["kind"] == "daily",
+                fmt=match["fmt"],
+                series=match["series"] or "",
+            )
+            added += 1
+        return added
+
+    def prune(self, max_age=None, max_bytes=None, redundant=False, delete=True):
+        """Drop stale entries and, optionally, cached files
+
+        Entries whose file no longer exists are always dropped.
+
+        Parameters
+        ----------
+        max_age : float, optional
+            Remove files added more than this many seconds ago.
+        max_bytes : int, optional
+            Remove the oldest files until the rest fit in this many bytes.
+        redundant : bool (default is False)
+            Remove files whose window is inside the window of another file
+            for the same site, service, and time series.
+        delete : bool (default is True)
+            Delete the removed files from disk, not only their entries.
+
+        Returns
+        -------
+        list of pathlib.Path
+            The files that were removed, not counting missing ones.
+
+        """
+
+        df = self.list()
+        exists = df["path"].map(lambda p: Path(p).exists())
+        for path in df.loc[~exists, "path"]:
+            self.remove(path)
+        df = df[exists]
+
+        drop = pd.Series(False, index=df.index)
+        if max_age is not None:
+            drop |= df["created"] < time.time() - max_age
+        if redundant:
+            for _, group in df.groupby(["site", "service", "series"]):
+                # widest windows first, so each file is only checked against
+                # files at least as wide
+                group = group.assign(span=group["end"] - group["start"])
+                group = group.sort_values(["span", "created"], ascending=False)
+                kept = []
+                for idx, row in group.iterrows():
+                    if any(s <= row["start"] and row["end"] <= e for s, e in kept):
+                        drop[idx] = True
+                    else:
+                        kept.append((row["start"], row["end"]))
+        if max_bytes is not None:
+            kept = df[~drop].sort_values("created", ascending=False)
+            total = kept["bytes"].fillna(0).cumsum()
+            drop[total[total > max_bytes].index] = True
+
+        removed = [Path(p) for p in df.loc[drop, "path"]]
+        for path in removed:
+            self.remove(path, delete=delete)
+        return removed
+
+
+# path -> Catalog, least recently used first
+_catalogs = OrderedDict()
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(directory):
+    """The catalog of a save directory, shared by every `Station` using it
+
+    At most `MAX_OPEN_CATALOGS` catalogs are kept; the least recently used
+    one is closed to make room, and reconnects if it is used again.
+    """
+
+    fpath = (Path(directory) / CATALOG_FILE).resolve()
+    with _catalogs_lock:
+        if fpath in _catalogs:
+            _catalogs.move_to_end(fpath)
+        else:
+            _catalogs[fpath] = Catalog(fpath)
+            while len(_catalogs) > MAX_OPEN_CATALOGS:
+                _, oldest = _catalogs.popitem(last=False)
+                oldest.close()
+        return _catalogs[fpath]
+
+
+@atexit.register
+def _close_catalogs():
+    with _catalogs_lock:
+        for catalog in _catalogs.values():
+            catalog.close()
+        _catalogs.clear()
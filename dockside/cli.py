@@ -0,0 +1,313 @@
+"""Command-line bulk downloader
+
+Downloads every site listed in a file into the cache directory, a few at a
+time, and records the outcome for each site in a JSON job-state file. Running
+the same command again skips the sites that already finished, so an
+interrupted run picks up where it stopped.
+
+Examples
+--------
+.. code-block:: bash
+
+    dockside gauges.txt 2018-01-01 2018-12-31 --service dv --savepath data
+    # interrupted? run it again to download the rest
+    dockside gauges.txt 2018-01-01 2018-12-31 --service dv --savepath data
+
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+STATE_FILE = "dockside-job.json"
+
+
+def read_sites(fpath):
+    """Site IDs from a text file, one per line
+
+    Blank lines and anything after a ``#`` are ignored. Duplicates are
+    dropped, keeping the first occurrence.
+    """
+
+    sites = []
+    with Path(fpath).open("r", encoding="utf-8") as fh:
+        for line in fh:
+            site = line.split("#", 1)[0].strip()
+            if site and site not in sites:
+                sites.append(site)
+    return sites
+
+
+class JobState(object):
+    """Per-site progress of a bulk download, kept in a JSON file
+
+    Parameters
+    ----------
+    fpath : path-like
+        Location of the job-state file. It is rewritten atomically after
+        every update, so it is always readable even if the run is killed.
+    job : dict
+        Settings of the run (dates, service, ...). A file written for
+        different settings is not resumed.
+
+    """
+
+    DONE = "done"
+    EMPTY = "empty"
+    FAILED = "failed"
+
+    def __init__(self, fpath, job):
+        self.fpath = Path(fpath)
+        self.job = dict(job)
+        self.sites = {}
+
+    @classmethod
+    def load(cls, fpath, job):
+        """Resume from `fpath` if it exists, otherwise start a new state
+
+        Raises
+        ------
+        ValueError
+            The existing file was written for a different job.
+
+        """
+
+        state = cls(fpath, job)
+        if state.fpath.exists():
+            saved = json.loads(state.fpath.read_text(encoding="utf-8"))
+            if saved.get("job") != state.job:
+                raise ValueError(
+                    "{} belongs to a different job: {}".format(fpath, saved.get("job"))
+                )
+            state.sites = saved.get("sites", {})
+        return state
+
+    def save(self):
+        self.fpath.parent.mkdir(parents=True, exist_ok=True)
+        part = self.fpath.with_name(self.fpath.name + ".part")
+        part.write_text(
+            json.dumps({"job": self.job, "sites": self.sites}, indent=2),
+            encoding="utf-8",
+        )
+        os.replace(part, self.fpath)
+
+    def finished(self, site):
+        """Whether `site` needs no more work"""
+        status = self.sites.get(site, {}).get("status")
+        return status in (self.DONE, self.EMPTY)
+
+    def record(self, site, status, **fields):
+        self.sites[site] = {"status": status, **fields}
+        self.save()
+
+    def counts(self):
+        counts = {}
+        for info in self.sites.values():
+            counts[info["status"]] = counts.get(info["status"], 0) + 1
+        return counts
+
+
+def _download_site(site, args, client):
+    from .nwis import Station
+
+    station = Station(
+        site,
+        args.start,
+        args.end,
+        savepath=args.savepath,
+        client=client,
+        cache_format=args.format,
+        raw=args.raw,
+        frame_cache=False,
+    )
+    daily = args.service == "dv"
+    df = station.get_data(daily=daily, save=True, force=args.force)
+    if df is None:
+        return JobState.EMPTY, {}
+    fpath = station._make_fpath(daily=daily)
+    if not fpath.exists() and station.catalog is not None:
+        # served from a saved file that covers the window
+        _, tag = station._series(daily)
+        fpath = station.catalog.find(
+            site, args.start, args.end, daily=daily, series=tag
+        )
+    return JobState.DONE, {"path": str(fpath), "rows": len(df)}
+
+
+def run(args, log=sys.stderr):
+    """Download the sites in ``args.sites``, see `main`
+
+    Returns
+    -------
+    JobState
+
+    """
+
+    from .client import Client, Governor
+
+    sites = read_sites(args.sites)
+    job = {
+        "start": args.start,
+        "end": args.end,
+        "service": args.service,
+        "format": "json.gz" if args.raw else args.format,
+    }
+    state_path = Path(args.state) if args.state else Path(args.savepath) / STATE_FILE
+    state = JobState.load(state_path, job)
+
+    todo = [site for site in sites if args.force or not state.finished(site)]
+    print(
+        "{} sites, {} to download, state in {}".format(
+            len(sites), len(todo), state_path
+        ),
+        file=log,
+    )
+
+    governor = None
+    if args.adaptive or args.rate is not None:
+        # without --adaptive, the limit stays at --workers
+        governor = Governor(
+            concurrency=min(4, args.workers) if args.adaptive else args.workers,
+            min_concurrency=1 if args.adaptive else args.workers,
+            max_concurrency=args.workers,
+            rate=args.rate,
+        )
+    client = Client(
+        pool_size=args.workers,
+        retries=args.retries,
+        base_url=args.base_url,
+        governor=governor,
+    )
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    futures = {}
+    try:
+        futures = {
+            executor.submit(_download_site, site, args, client): site for site in todo
+        }
+        for n, future in enumerate(as_completed(futures), 1):
+            site = futures[future]
+            try:
+                status, fields = future.result()
+            except Exception as e:
+                status, fields = JobState.FAILED, {"error": repr(e)}
+            state.record(site, status, **fields)
+            print("[{}/{}] {} {}".format(n, len(todo), site, status), file=log)
+        if governor is not None:
+            stats = governor.stats()
+            print(
+                "concurrency {concurrency}, {throttled} throttled, "
+                "{requests_per_second:.1f} requests/s".format(**stats),
+                file=log,
+            )
+    finally:
+        # on Ctrl-C, drop the queued sites; finished ones are already recorded.
+        # `shutdown(cancel_futures=True)` needs Python 3.9
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        client.close()
+
+    return state
+
+
+def build_parser():
+    from .client import NWIS_URL
+    from .io import CACHE_FORMATS
+
+    parser = argparse.ArgumentParser(
+        prog="dockside",
+        description="Download NWIS data for many sites into a cache directory.",
+    )
+    parser.add_argument("sites", help="text file with one NWIS site ID per line")
+    parser.add_argument("start", help="start date, e.g. 2018-01-01")
+    parser.add_argument("end", help="end date, e.g. 2018-12-31")
+    parser.add_argument(
+        "--service",
+        choices=["iv", "dv"],
+        default="iv",
+        help="instantaneous (iv, default) or daily (dv) values",
+    )
+    parser.add_argument(
+        "--savepath", default="data", help="cache directory (default: data)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(set(CACHE_FORMATS.values())),
+        default="csv",
+        help="format of the saved dataframes (default: csv)",
+    )
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="save the gzip-compressed responses instead of dataframes",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="number of sites downloaded at once (default: 8)",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="adapt the number of requests in flight, up to --workers, to how "
+        "fast and how willingly NWIS answers",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="most requests sent per second (default: no limit)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="retries per request after transient errors (default: 3)",
+    )
+    parser.add_argument(
+        "--state",
+        help="job-state file (default: {} in the cache directory)".format(STATE_FILE),
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="download every site again, even those already done",
+    )
+    parser.add_argument("--base-url", default=NWIS_URL, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    """Entry point of the ``dockside`` console script
+
+    Returns the exit status: 0 when every site is done (or has no data), 1
+    when any site failed, 2 for usage errors, and 130 when interrupted.
+    """
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+
+    try:
+        state = run(args)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print("interrupted, run the same command again to resume", file=sys.stderr)
+        return 130
+
+    counts = state.counts()
+    print(
+        ", ".join(
+            "{} {}".format(counts.get(status, 0), status)
+            for status in (JobState.DONE, JobState.EMPTY, JobState.FAILED)
+        ),
+        file=sys.stderr,
+    )
+    return 1 if counts.get(JobState.FAILED) else 0
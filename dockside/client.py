@@ -0,0 +1,467 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .instrument import span
+
+NWIS_URL = "https://nwis.waterservices.usgs.gov/nwis"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+ACCEPT_ENCODING = "gzip, deflate"
+
+
+class Backoff(object):
+    """Retry delay policy shared by the synchronous and asyncio clients"""
+
+    def _retry_after(self, response):
+        """
+        Seconds to wait according to a ``Retry-After`` header, or None
+        """
+
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value:
+            return None
+
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(when.timestamp() - time.time(), 0)
+
+    def delay(self, attempt, response=None):
+        """Seconds to sleep before the retry following `attempt`
+
+        Parameters
+        ----------
+        attempt : int
+            Zero-based number of the attempt that just failed.
+        response : requests.Response, optional
+            The failed response, used to honor ``Retry-After``.
+
+        Returns
+        -------
+        float
+
+        """
+
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        cap = min(self.backoff * 2**attempt, self.max_backoff)
+        return random.uniform(0, cap)
+
+
+class Governor(object):
+    """Adaptive limit on the requests a client has in flight
+
+    The limit follows the additive-increase, multiplicative-decrease rule of
+    TCP congestion control: every answered request raises it by about one
+    per round trip, while a throttling response (`throttle_statuses`), a
+    connection error or timeout, or a response much slower than usual cuts
+    it by `decrease`. Only one cut is made per round trip, since requests
+    that were already in flight carry no news about the new limit.
+
+    Parameters
+    ----------
+    concurrency : int (default is 4)
+        Initial number of requests allowed in flight.
+    min_concurrency, max_concurrency : int (defaults are 1 and 32)
+        Bounds of the limit.
+    rate : float, optional
+        Ceiling on requests sent per second, shared by every thread.
+    decrease : float (default is 0.5)
+        Factor applied to the limit by each cut.
+    tolerance : float or None (default is 2.0)
+        Cut the limit when the smoothed latency exceeds this multiple of the
+        lowest recent latency. None reacts to throttling and errors only.
+    max_pause : float (default is 30)
+        Upper limit in seconds on the pause requested by a ``Retry-After``
+        header. Until it has passed, no request is sent.
+    throttle_statuses : sequence of ints
+        HTTP status codes that mean the server is shedding load.
+
+    Notes
+    -----
+    The governor only limits requests; it does not start any. Give the
+    thread pool that uses it at least `max_concurrency` workers, so that
+    the limit, not the pool, decides how many requests are in flight.
+
+    Examples
+    --------
+    >>> from dockside import Client, Governor
+    >>> from dockside.io import fetch_many
+    >>> sites = ['14211500', '14211010', '14206950', '14207500']
+    >>> governor = Governor(max_concurrency=32, rate=20)
+    >>> governor.stats()['concurrency']
+    4
+    >>> with Client(pool_size=32, governor=governor) as client:  # doctest: +SKIP
+    ...     data, errors = fetch_many(sites, '2018-01-01', '2018-12-31',
+    ...                               max_workers=32, client=client)
+    >>> stats = governor.stats()  # doctest: +SKIP
+    >>> stats['requests'], stats['throttled']  # doctest: +SKIP
+    (4, 0)
+
+    """
+
+    def __init__(
+        self,
+        concurrency=4,
+        min_concurrency=1,
+        max_concurrency=32,
+        rate=None,
+        decrease=0.5,
+        tolerance=2.0,
+        max_pause=30,
+        throttle_statuses=THROTTLE_STATUSES,
+    ):
+        if not 1 <= min_concurrency <= max_concurrency:
+            raise ValueError("need 1 <= min_concurrency <= max_concurrency")
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.max_pause = max_pause
+        self.throttle_statuses = frozenset(throttle_statuses)
+
+        self._limit = float(min(max(concurrency, min_concurrency), max_concurrency))
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._next_send = 0.0
+        self._paused_until = 0.0
+        self._last_cut = 0.0
+        self._latency = None
+        self._base_latency = None
+        self._started = None
+        self._counts = dict.fromkeys(
+            ["requests", "throttled", "failed", "slow", "decreases"], 0
+        )
+
+    @property
+    def concurrency(self):
+        """Number of requests currently allowed in flight"""
+        return int(self._limit)
+
+    def acquire(self):
+        """Wait for a free slot, the end of any pause, and the rate ceiling
+
+        Returns
+        -------
+        float
+            The `time.monotonic` time the request may be sent at, to be
+            given back to `release`.
+
+        """
+
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._cond.wait(self._paused_until - now)
+                elif self._in_flight >= self.concurrency:
+                    self._cond.wait()
+                else:
+                    break
+            self._in_flight += 1
+            if self._started is None:
+                self._started = now
+            send_at = now
+            if self.rate is not None:
+                send_at = max(now, self._next_send)
+                self._next_send = send_at + 1.0 / self.rate
+
+        if send_at > now:
+            time.sleep(send_at - now)
+        return send_at
+
+    def release(self, started, status=None, retry_after=None, failed=False):
+        """Free the slot of a finished request and adapt the limit to it
+
+        Parameters
+        ----------
+        started : float
+            The value returned by `acquire`.
+        status : int, optional
+            HTTP status code of the response.
+        retry_after : float, optional
+            Seconds the server asked to wait before the next request.
+        failed : bool (default is False)
+            The request ended with a connection error or a timeout.
+
+        """
+
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight -= 1
+            self._counts["requests"] += 1
+            if failed or status in self.throttle_statuses:
+                self._counts["failed" if failed else "throttled"] += 1
+                if retry_after:
+                    pause = now + min(retry_after, self.max_pause)
+                    self._paused_until = max(self._paused_until, pause)
+                self._cut(started, now)
+            elif status is not None and status < 500:
+                if self._slow(now - started):
+                    self._counts["slow"] += 1
+                    self._cut(started, now)
+                else:
+                    self._limit = min(
+                        self._limit + 1.0 / self._limit, self.max_concurrency
+                    )
+            self._cond.notify_all()
+
+    def _slow(self, latency):
+        """
+        Tracks the smoothed and the lowest recent latency, and tells whether
+        the smoothed one has grown past `tolerance` times the lowest
+        """
+
+        if self._latency is None:
+            self._latency = self._base_latency = latency
+        else:
+            self._latency += 0.2 * (latency - self._latency)
+            # the lowest latency slowly forgets, so a lasting change of
+            # conditions becomes the new normal
+            self._base_latency += 0.01 * (self._latency - self._base_latency)
+            self._base_latency = min(self._base_latency, latency)
+        if self.tolerance is None:
+            return False
+        return self._latency > self.tolerance * self._base_latency
+
+    def _cut(self, started, now):
+        # requests sent before the previous cut already count towards it
+        if started >= self._last_cut:
+            self._limit = max(self._limit * self.decrease, self.min_concurrency)
+            self._last_cut = now
+            self._counts["decreases"] += 1
+
+    def stats(self):
+        """Current state and counters of the governor
+
+        Returns
+        -------
+        dict
+            ``concurrency`` (the current limit), ``in_flight``, the number
+            of ``requests`` answered, ``throttled``, ``failed`` and ``slow``
+            requests, the number of ``decreases`` of the limit, the smoothed
+            ``latency`` in seconds, the achieved ``requests_per_second``, and
+            the seconds left in the ``paused`` state.
+
+        """
+
+        now = time.monotonic()
+        with self._cond:
+            elapsed = now - self._started if self._started is not None else 0
+            return {
+                "concurrency": self.concurrency,
+                "in_flight": self._in_flight,
+                **self._counts,
+                "latency": self._latency,
+                "requests_per_second": (
+                    self._counts["requests"] / elapsed if elapsed > 0 else 0.0
+                ),
+                "paused": max(self._paused_until - now, 0.0),
+            }
+
+
+class Client(Backoff):
+    """Pooled HTTP session for talking to NWIS
+
+    Parameters
+    ----------
+    pool_size : int (default is 10)
+        Number of keep-alive connections held open per host. Set this to at
+        least the number of threads that share the client.
+    retries : int (default is 3)
+        Number of times a request is retried after a connection error, a
+        timeout, or a response with a status code in `retry_statuses`.
+    backoff : float (default is 0.5)
+        Base delay in seconds. The delay before retry ``n`` (zero-based) is
+        drawn uniformly from ``[0, backoff * 2**n]`` ("full jitter"), capped
+        at `max_backoff`.
+    max_backoff : float (default is 30)
+        Upper limit in seconds for any single delay, including delays
+        requested by the server through a ``Retry-After`` header.
+    timeout : float or (float, float) tuple (default is (3.05, 60))
+        Connect and read timeouts passed to `requests`.
+    retry_statuses : sequence of ints
+        HTTP status codes that are considered transient.
+    session : requests.Session, optional
+        An existing session to use instead of creating a new one. New
+        sessions ask for gzip-compressed responses.
+    base_url : string, optional
+        Root of the NWIS web services. Only needs to change when pointing at a
+        mirror or a local stand-in server.
+    cache : dockside.cache.ResponseCache, optional
+        Persistent response cache consulted before any request is sent.
+        Successful responses are added to it.
+    governor : dockside.Governor, optional
+        Adaptive limit on the requests in flight and the request rate,
+        shared by all threads using the client. Every attempt, including
+        retries, waits for it and reports back how it went.
+
+    Examples
+    --------
+    >>> from dockside import Client
+    >>> from dockside.io import fetch_nwis
+    >>> with Client(pool_size=4, retries=5) as client:
+    ...     r = fetch_nwis(14211500, '2018-01-01', '2018-06-30', client=client)
+
+    """
+
+    def __init__(
+        self,
+        pool_size=10,
+        retries=3,
+        backoff=0.5,
+        max_backoff=30,
+        timeout=(3.05, 60),
+        retry_statuses=RETRY_STATUSES,
+        session=None,
+        base_url=NWIS_URL,
+        cache=None,
+        governor=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.governor = governor
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retry_statuses = frozenset(retry_statuses)
+
+        if session is None:
+            session = requests.Session()
+            # gzip bodies can be saved as-is, see `dockside.io.download_nwis`
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        self.session = session
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def get(self, url, params=None, **kwargs):
+        """Send a GET request, retrying transient failures
+
+        Parameters
+        ----------
+        url : string
+        params : dict, optional
+            Query string parameters.
+
+        Additional Parameters
+        ---------------------
+        All additional keyword arguments are passed to
+        `requests.Session.get`. A `timeout` given here overrides the
+        client's timeout policy.
+
+        Returns
+        -------
+        requests.Response
+            The first non-transient response, or the last response received
+            once the retries are exhausted. When the client has a `cache`, a
+            cached response may be returned without sending the request.
+
+        """
+
+        with span("fetch", url=url) as rec:
+            if self.cache is not None:
+                cached = self.cache.get(url, params)
+                if cached is not None:
+                    rec.update(_describe(cached), cached=True)
+                    return cached
+
+            stream = kwargs.get("stream", False)
+            response = self._send(url, params, **kwargs)
+            rec.update(_describe(response, stream), cached=False)
+            # storing a streamed response would read its whole body here
+            if self.cache is not None and not stream:
+                self.cache.put(url, params, response)
+        return response
+
+    def _send(self, url, params, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retries + 1):
+            final = attempt == self.retries
+            try:
+                response = self._attempt(url, params, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if final:
+                    raise
+                time.sleep(self.delay(attempt))
+                continue
+
+            if response.status_code not in self.retry_statuses or final:
+                return response
+
+            wait = self.delay(attempt, response)
+            response.close()
+            time.sleep(wait)
+
+    def _attempt(self, url, params, **kwargs):
+        if self.governor is None:
+            return self.session.get(url, params=params, **kwargs)
+
+        started = self.governor.acquire()
+        try:
+            response = self.session.get(url, params=params, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.governor.release(started, failed=True)
+            raise
+        except BaseException:
+            self.governor.release(started)
+            raise
+        self.governor.release(
+            started, response.status_code, retry_after=self._retry_after(response)
+        )
+        return response
+
+
+def _describe(response, stream=False):
+    """
+    Instrumentation fields of a response: its status and the size of its
+    body on the wire when known
+    """
+
+    size = response.headers.get("Content-Length")
+    if size is not None:
+        size = int(size)
+    elif not stream:
+        size = len(response.content)
+    return {"status": response.status_code, "bytes": size}
+
+
+_default_client = None
+
+
+def get_client():
+    """
+    Returns the module-level `Client` shared by default, creating it on first use
+    """
+
+    global _default_client
+    if _default_client is None:
+        _default_client = Client()
+    return _default_client
@@ -0,0 +1,194 @@
+"""Instrumentation hooks for the fetch, decode, parse, and cache I/O paths
+
+dockside reports what it does as records (plain dicts) passed to every hook
+registered with `add_hook`. Nothing is recorded, and nothing is timed, while
+no hook is registered.
+
+Every record has a "stage" and the wall time in "seconds" (None for events
+without a duration, like cache lookups), plus stage-specific fields:
+
+========================  =================================================
+stage                     fields
+========================  =================================================
+fetch                     url, status, bytes, cached
+decode                    (JSON decoding of a response body)
+parse                     timeseries, rows, format
+concat                    frames, rows
+read_cache, write_cache   path, format, rows, bytes
+response_cache            hit
+frame_cache               hit
+========================  =================================================
+
+Records from failed stages carry the exception class name in "error".
+
+Examples
+--------
+>>> from dockside import Station
+>>> from dockside.instrument import Profile
+>>> with Profile() as prof:  # doctest: +SKIP
+...     Station(14211500, '2018-01-01', '2018-06-30').insta_data
+>>> print(prof.summary())  # doctest: +SKIP
+
+"""
+
+import json
+import logging
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+_hooks = []
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook):
+    """Register a callable that receives every record"""
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Unregister a hook added with `add_hook`"""
+    with _hooks_lock:
+        _hooks.remove(hook)
+
+
+def enabled():
+    """Whether any hook is registered"""
+    return bool(_hooks)
+
+
+def _emit(record):
+    for hook in list(_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            warnings.warn("instrumentation hook {!r} failed: {}".format(hook, e))
+
+
+def event(stage, **fields):
+    """Report something without a duration, e.g., a cache hit"""
+    if _hooks:
+        _emit({"stage": stage, "seconds": None, **fields})
+
+
+@contextmanager
+def span(stage, **fields):
+    """Time the body of the `with` block as `stage`
+
+    Yields the dict of fields, which the body can add to (e.g., the number
+    of rows it produced) before the record is emitted.
+    """
+
+    if not _hooks:
+        yield fields
+        return
+
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields["error"] = type(e).__name__
+        raise
+    finally:
+        _emit({"stage": stage, "seconds": time.perf_counter() - start, **fields})
+
+
+class Profile(object):
+    """Hook that collects records in memory and summarizes them
+
+    Use it as a context manager to register it for the duration of a block,
+    or pass it to `add_hook`.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_hook(self)
+
+    def to_frame(self):
+        """The records as a dataframe, one row per record"""
+        import pandas as pd
+
+        with self._lock:
+            return pd.DataFrame(self.records)
+
+    def summary(self):
+        """Totals per stage
+
+        Returns
+        -------
+        pandas.DataFrame
+            Indexed by stage, with the number of records ("calls"), the
+            total and mean duration, the totals of the "bytes" and "rows"
+            fields, and the hits and misses of the cache stages.
+
+        """
+
+        import pandas as pd
+
+        df = self.to_frame()
+        columns = ["calls", "seconds", "mean_ms", "bytes", "rows", "hits", "misses"]
+        if df.empty:
+            return pd.DataFrame(columns=columns).rename_axis("stage")
+
+        for col in ["seconds", "bytes", "rows", "hit"]:
+            if col not in df:
+                df[col] = None
+        df["hits"] = df["hit"].eq(True).astype(int)
+        df["misses"] = df["hit"].eq(False).astype(int)
+        grouped = df.groupby("stage", sort=False)
+        summary = pd.DataFrame(
+            {
+                "calls": grouped.size(),
+                "seconds": grouped["seconds"].sum(min_count=1),
+                "bytes": grouped["bytes"].sum(min_count=1),
+                "rows": grouped["rows"].sum(min_count=1),
+                "hits": grouped["hits"].sum(),
+                "misses": grouped["misses"].sum(),
+            }
+        )
+        summary["mean_ms"] = summary["seconds"] / summary["calls"] * 1e3
+        return summary[columns]
+
+
+class LogHook(object):
+    """Hook that writes every record as a JSON log message
+
+    Parameters
+    ----------
+    logger : logging.Logger or string (default is "dockside")
+    level : int (default is logging.INFO)
+
+    Examples
+    --------
+    >>> import logging
+    >>> from dockside.instrument import LogHook, add_hook, remove_hook
+    >>> logging.basicConfig(level=logging.INFO)
+    >>> hook = LogHook()
+    >>> add_hook(hook)
+    >>> # ... download data, every record is logged ...
+    >>> remove_hook(hook)
+
+    """
+
+    def __init__(self, logger="dockside", level=logging.INFO):
+        if isinstance(logger, str):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, record):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, json.dumps(record, default=str))
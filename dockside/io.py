@@ -1,10 +1,31 @@
+import codecs
+import csv
+import gzip
+import itertools
+import json
+import os
+import re
+import warnings
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from datetime import timezone
+from functools import partial
+from io import StringIO
 from pathlib import Path
 
-import requests
+import numpy
 import pandas as pd
 
+from .client import get_client
+from .instrument import enabled, span
 
-def fetch_nwis(site, start, end, daily=False, **kwargs):
+
+def fetch_nwis(site, start, end, daily=False, client=None, stream=False, **kwargs):
     """Fetch JSON data from NWIS
 
     Parameters
@@ -18,10 +39,25 @@ def fetch_nwis(site, start, end, daily=False, **kwargs):
         observations you'd like to download
     daily : bool (default is False)
         Toggles downloading daily (True) or instanteous values (False, default)
+    client : dockside.Client, optional
+        Pooled HTTP client used to send the request. When not provided, a
+        module-level client shared by all calls is used so that connections
+        are kept alive between requests.
+    stream : bool (default is False)
+        Defer downloading the response body until it is read, e.g., by
+        `read_nwis_stream`.
+    parameters : string, int, or sequence, optional
+        NWIS parameter codes (e.g., "00060" for discharge) of the time series
+        to download, sent as ``parameterCd``. Defaults to all of them.
+    statistics : string, int, or sequence, optional
+        NWIS statistic codes (e.g., "00003" for the daily mean), sent as
+        ``statCd``. Only applies to daily values.
 
     Additional Parameters
     ---------------------
     All additional keyword arguments are passed directly to the NWIS API.
+    E.g., ``format="rdb"`` requests the much smaller tab-delimited format,
+    which is read by `read_nwis_rdb`.
 
     Returns
     -------
@@ -42,10 +78,104 @@ def fetch_nwis(site, start, end, daily=False, **kwargs):
 
     """
 
-    dtfmt = "%Y-%m-%d"
-    url_base = "https://nwis.waterservices.usgs.gov/nwis/{}".format(
-        "dv" if daily else "iv"
+    if client is None:
+        client = get_client()
+
+    url_base, url_params = _nwis_request(
+        client.base_url, site, start, end, daily=daily, **kwargs
     )
+    return client.get(url_base, params=url_params, stream=stream)
+
+
+def download_nwis(site, start, end, fpath, daily=False, client=None, **kwargs):
+    """Save an NWIS response to a gzip file without decoding it
+
+    The compressed body is written to disk exactly as it came over the
+    wire whenever NWIS sends it gzip-encoded, so the response is neither
+    decompressed nor parsed. Other responses are compressed while they are
+    written. Read the file back with `read_nwis_file`.
+
+    Parameters
+    ----------
+    site : int, string, or sequence
+        Site ID number from NWIS.
+    start, end : string or date-like
+        Some form of date representation for the start and end of the NWIS
+        observations you'd like to download
+    fpath : path-like
+        Where to save the response, conventionally ending in ".json.gz" (or
+        ".rdb.gz" with ``format="rdb"``). Written atomically.
+    daily : bool (default is False)
+        Toggles downloading daily (True) or instanteous values (False, default)
+    client : dockside.Client, optional
+        Pooled HTTP client used to send the request.
+
+    Additional Parameters
+    ---------------------
+    All additional keyword arguments are passed directly to the NWIS API.
+
+    Returns
+    -------
+    pathlib.Path
+
+    Examples
+    --------
+    >>> from dockside.io import download_nwis, read_nwis_file
+    >>> fpath = download_nwis(14211500, '2018-01-01', '2018-06-30',
+    ...                       'JCreek_flow.json.gz')
+    >>> df = read_nwis_file(fpath)
+
+    """
+
+    fpath = Path(fpath)
+    tmp = fpath.with_name(fpath.name + ".part")
+    r = fetch_nwis(site, start, end, daily=daily, client=client, stream=True, **kwargs)
+    try:
+        r.raise_for_status()
+        encoding = r.headers.get("Content-Encoding", "").strip().lower()
+        # responses from a cache, or already read, only have the decoded body
+        unread = r.raw is not None and r._content is False
+        if unread and encoding == "gzip":
+            with tmp.open("wb") as fp:
+                for chunk in r.raw.stream(65536, decode_content=False):
+                    fp.write(chunk)
+        else:
+            with gzip.open(tmp, "wb") as fp:
+                for chunk in r.iter_content(chunk_size=65536):
+                    fp.write(chunk)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    finally:
+        r.close()
+
+    os.replace(tmp, fpath)
+    return fpath
+
+
+def _codes(codes):
+    """
+    Sorted, zero-padded five-digit NWIS parameter or statistic codes, or
+    None for all of them
+    """
+
+    if codes is None:
+        return None
+    if isinstance(codes, (str, int)):
+        codes = [codes]
+    return sorted({"{:0>5}".format(str(code).strip()) for code in codes})
+
+
+def _nwis_request(
+    base_url, site, start, end, daily=False, parameters=None, statistics=None, **kwargs
+):
+    """
+    URL and query string parameters of an NWIS request
+    """
+
+    dtfmt = "%Y-%m-%d"
+    url_base = "{}/{}".format(base_url, "dv" if daily else "iv")
     url_params = {
         "format": kwargs.pop("format", "json"),
         "sites": site,
@@ -53,8 +183,20 @@ def fetch_nwis(site, start, end, daily=False, **kwargs):
         "endDT": pd.Timestamp(end).strftime(dtfmt),
         **kwargs,
     }
+    if parameters is not None:
+        url_params["parameterCd"] = ",".join(_codes(parameters))
+    if statistics is not None and daily:
+        url_params["statCd"] = ",".join(_codes(statistics))
+    return url_base, url_params
+
+
+def _decode(r):
+    """
+    Decodes the JSON body of a response
+    """
 
-    return requests.get(url_base, params=url_params)
+    with span("decode"):
+        return r.json()
 
 
 def _expand_columns(df, names, sep="_"):
@@ -66,7 +208,198 @@ def _expand_columns(df, names, sep="_"):
     return df.set_axis(newcols, axis="columns").rename_axis(names, axis="columns")
 
 
-def _parse_ts(ts, daily):
+def _parse_datetimes(strings):
+    """
+    Parses NWIS ``dateTime`` strings (e.g., "2012-10-01T00:00:00.000-05:00")
+    into a DatetimeIndex.
+
+    Parsing the naive part with an explicit format and applying the UTC offsets
+    separately is an order of magnitude faster than letting pandas infer the
+    offset of every row. A single offset gives a fixed-offset index (same as
+    `pandas.to_datetime`); several offsets (a window across a DST change) are
+    converted to UTC.
+    """
+
+    if len(strings) == 0:
+        return pd.DatetimeIndex([], name="datetime")
+
+    first = strings[0]
+    if len(first) <= 19 or first[-6] not in "+-":
+        return pd.DatetimeIndex(
+            pd.to_datetime(strings, format="ISO8601"), name="datetime"
+        )
+
+    naive = pd.to_datetime([s[:-6] for s in strings], format="ISO8601")
+    offsets = [s[-6:] for s in strings]
+    deltas = {
+        o: pd.Timedelta(hours=int(o[:3]), minutes=int(o[0] + o[4:]))
+        for o in set(offsets)
+    }
+    return _localize(naive, offsets, deltas)
+
+
+def _localize(naive, offsets, deltas):
+    """
+    Attaches per-row UTC offsets to naive local times. `offsets` holds one
+    key of `deltas` (key -> pandas.Timedelta) per row.
+    """
+
+    if len(deltas) == 1:
+        (delta,) = deltas.values()
+        index = pd.DatetimeIndex(naive).tz_localize(timezone(delta))
+    else:
+        shift = pd.TimedeltaIndex([deltas[o] for o in offsets])
+        index = (pd.DatetimeIndex(naive) - shift).tz_localize("UTC")
+    return index.rename("datetime")
+
+
+# IANA time zones of NWIS sites that observe daylight saving time, by their
+# standard UTC offset. Every such site switches on the US rules.
+_DST_ZONES = {
+    "-05:00": "America/New_York",
+    "-06:00": "America/Chicago",
+    "-07:00": "America/Denver",
+    "-08:00": "America/Los_Angeles",
+    "-09:00": "America/Anchorage",
+    "-10:00": "America/Adak",
+}
+
+
+def _json_timezone(site_json):
+    """
+    Time zone of the site in an NWIS JSON response, from the `timeZoneInfo`
+    of its first time series. None when the response does not say, or the
+    site keeps the same UTC offset all year (its data is never in UTC).
+    """
+
+    for ts in site_json["value"]["timeSeries"]:
+        info = ts.get("sourceInfo", {}).get("timeZoneInfo")
+        if info:
+            if not info.get("siteUsesDaylightSavingsTime"):
+                return None
+            return _DST_ZONES.get(info["defaultTimeZone"]["zoneOffset"])
+    return None
+
+
+def _site_time(df, tz):
+    """
+    `df`, whose index is in UTC, with the index expressed the way
+    `read_nwis` parses a response for a site in time zone `tz`: at the fixed
+    UTC offset of its rows when they share one, in UTC otherwise
+    """
+
+    index = df.index
+    offsets = (
+        index.tz_convert(tz).tz_localize(None) - index.tz_localize(None)
+    ).unique()
+    if len(offsets) != 1:
+        return df
+    return df.tz_convert(timezone(offsets[0].to_pytimedelta()))
+
+
+# bit positions of the NWIS data-value qualification codes used by
+# `qual="bitmask"`; the order only matters for compatibility of stored masks,
+# so new codes must be appended
+QUALIFIER_CODES = (
+    "A",
+    "P",
+    "e",
+    "E",
+    "R",
+    "<",
+    ">",
+    "1",
+    "2",
+    "&",
+    "Ice",
+    "Eqp",
+    "Fld",
+    "Dry",
+    "Dis",
+    "Ssn",
+    "Mnt",
+    "Bkw",
+    "Rat",
+    "Zfl",
+    "Tst",
+    "Pr",
+    "***",
+)
+QUALIFIER_OTHER = 1 << 31
+_QUALIFIER_BITS = {code: 1 << i for i, code in enumerate(QUALIFIER_CODES)}
+
+
+def encode_qualifiers(quals):
+    """Pack comma-separated NWIS qualifier strings into integer bitmasks
+
+    Parameters
+    ----------
+    quals : sequence of strings
+        E.g., ``["A", "P,e", "P,Ice"]`` as found in the "qual" columns.
+
+    Returns
+    -------
+    numpy.ndarray of uint32
+        Bit ``i`` is set when ``QUALIFIER_CODES[i]`` is present. Codes that
+        are not in `QUALIFIER_CODES` set `QUALIFIER_OTHER` and raise a
+        warning.
+
+    """
+
+    lookup = {}
+    unknown = set()
+    for q in set(quals):
+        mask = 0
+        for code in filter(None, q.split(",")):
+            bit = _QUALIFIER_BITS.get(code)
+            if bit is None:
+                unknown.add(code)
+                bit = QUALIFIER_OTHER
+            mask |= bit
+        lookup[q] = mask
+
+    if unknown:
+        warnings.warn("unknown NWIS qualifiers: {}".format(", ".join(sorted(unknown))))
+    return numpy.array([lookup[q] for q in quals], dtype=numpy.uint32)
+
+
+def decode_qualifiers(masks):
+    """Unpack bitmasks made by `encode_qualifiers` into qualifier strings
+
+    Parameters
+    ----------
+    masks : sequence of ints
+
+    Returns
+    -------
+    list of strings
+        Codes are listed in the order of `QUALIFIER_CODES`, which may differ
+        from the order NWIS reported them in. Unknown codes are lost.
+
+    """
+
+    lookup = {}
+    for mask in set(int(m) for m in masks):
+        lookup[mask] = ",".join(c for c, b in _QUALIFIER_BITS.items() if mask & b)
+    return [lookup[int(m)] for m in masks]
+
+
+def _compact_qual(quals, qual):
+    """
+    Converts the per-row qualifier strings to the representation requested
+    from `read_nwis`
+    """
+
+    if qual == "object":
+        return quals
+    elif qual == "category":
+        return pd.Categorical(quals)
+    elif qual == "bitmask":
+        return encode_qualifiers(quals)
+    raise ValueError("`qual` must be 'object', 'category', or 'bitmask'")
+
+
+def _parse_ts(ts, daily, qual="object", downcast=False):
     """
     Parses a single `timeSeries` object in an NWIS JSON response in a dataframe
     """
@@ -74,27 +407,106 @@ def _parse_ts(ts, daily):
     param = ts["variable"]["variableName"]
     if daily:
         stat = ts["variable"]["options"]["option"][0]["value"]
+        col_levels = ["param", "stat", "var"]
+        prefix = (param, stat)
     else:
-        stat = None
-
-    col_levels = {False: ["param", "var"], True: ["param", "stat", "var"]}
-    sep = "xxxxx"
-
-    return (
-        pd.DataFrame(ts["values"][0]["value"])
-        .rename(columns=lambda c: "_orig_" + c)
-        .assign(datetime=lambda df: pd.to_datetime(df["_orig_dateTime"]))
-        .assign(qual=lambda df: df["_orig_qualifiers"].map(lambda x: ",".join(x)))
-        .assign(value=lambda df: df["_orig_value"].astype(float))
-        .loc[:, lambda df: df.columns.map(lambda c: not c.startswith("_orig"))]
-        .set_index("datetime")
-        .rename(columns=lambda c: sep.join(filter(lambda x: bool(x), [param, stat, c])))
-        .rename_axis("var", axis="columns")
-        .pipe(_expand_columns, col_levels[daily], sep=sep)
+        col_levels = ["param", "var"]
+        prefix = (param,)
+
+    records = ts["values"][0]["value"]
+    n = len(records)
+    datetimes = [None] * n
+    values = [None] * n
+    quals = [None] * n
+    for i, rec in enumerate(records):
+        datetimes[i] = rec["dateTime"]
+        values[i] = rec["value"]
+        quals[i] = ",".join(rec["qualifiers"])
+
+    return _ts_frame(
+        prefix, col_levels, _parse_datetimes(datetimes), quals, values, qual, downcast
+    )
+
+
+def _ts_frame(prefix, col_levels, index, quals, values, qual, downcast):
+    """
+    Builds the two-column ("qual", "value") frame of a single time series
+    """
+
+    columns = pd.MultiIndex.from_tuples(
+        [(*prefix, "qual"), (*prefix, "value")], names=col_levels
     )
+    df = pd.DataFrame(
+        {
+            "qual": _compact_qual(quals, qual),
+            "value": numpy.array(values, dtype=numpy.float32 if downcast else float),
+        },
+        index=index,
+    )
+    return df.set_axis(columns, axis="columns")
 
 
-def read_nwis(site_json, daily=False):
+def _wanted(daily, parameters, statistics):
+    """
+    Predicate on (parameter code, statistic code) pairs, or None when every
+    time series is wanted
+    """
+
+    parameters = _codes(parameters)
+    statistics = _codes(statistics) if daily else None
+    if parameters is None and statistics is None:
+        return None
+
+    # series without codes (e.g., hand-built JSON) are always kept
+    def wanted(param_cd, stat_cd):
+        if parameters is not None and param_cd not in (None, *parameters):
+            return False
+        return statistics is None or stat_cd in (None, *statistics)
+
+    return wanted
+
+
+def _ts_codes(ts):
+    """
+    Parameter and statistic codes of a single `timeSeries` object, None for
+    codes that are not in it
+    """
+
+    variable = ts["variable"]
+    codes = variable.get("variableCode") or [{}]
+    options = (variable.get("options") or {}).get("option") or [{}]
+    return codes[0].get("value"), options[0].get("optionCode")
+
+
+def _filter_ts(all_ts, wanted):
+    """
+    The `timeSeries` objects to parse, picked from their codes without
+    looking at any values
+    """
+
+    if wanted is None:
+        return all_ts
+    return [ts for ts in all_ts if wanted(*_ts_codes(ts))]
+
+
+def _site_code(ts):
+    """
+    Site ID of a single `timeSeries` object
+    """
+
+    return ts["sourceInfo"]["siteCode"][0]["value"]
+
+
+def read_nwis(
+    site_json,
+    daily=False,
+    qual="object",
+    downcast=False,
+    by_site=False,
+    workers=None,
+    parameters=None,
+    statistics=None,
+):
     """Read an NWIS JSON response to a pandas Dataframe
 
     Parameters
@@ -104,10 +516,37 @@ def read_nwis(site_json, daily=False):
     daily : bool (default is False)
         Set to True if you're parsing daily values or False (default) if they
         they are instanteous values.
+    qual : string (default is "object")
+        Representation of the "qual" columns. "object" keeps one
+        comma-separated string per row, "category" stores them as a
+        pandas.Categorical, and "bitmask" packs them into uint32 flags (see
+        `encode_qualifiers`). Both compact forms use a small fraction of the
+        memory of the strings.
+    downcast : bool (default is False)
+        Store the "value" columns as float32 instead of float64.
+    by_site : bool (default is False)
+        Split a response for several sites by the site code of each time
+        series. Without it, identically named parameters of different sites
+        collide.
+    workers : int, optional
+        Parse the time series in up to this many worker processes (never
+        more than the number of CPUs), started with the platform's default
+        method. Each worker is sent its share of the time series and sends
+        back the parsed frames, both pickled, so this only pays off when
+        parsing dominates. Responses with fewer than `PARALLEL_MIN_VALUES`
+        values in total are always parsed serially, since starting the
+        workers would take longer.
+    parameters, statistics : string, int, or sequence, optional
+        Only parse the time series with these NWIS parameter codes and (for
+        daily values) statistic codes, see `fetch_nwis`. The others are
+        skipped before any of their values are read. Time series without
+        codes in the response are always kept.
 
     Returns
     -------
-    pandas.DataFrame
+    pandas.DataFrame, or dict when `by_site` is True
+        The dict maps each site ID in the response to its dataframe and can
+        be combined with `combine_sites`.
 
     Examples
     --------
@@ -117,23 +556,1031 @@ def read_nwis(site_json, daily=False):
 
     """
 
-    all_ts = site_json["value"]["timeSeries"]
-    if len(all_ts) > 0:
-        df = pd.concat([_parse_ts(ts, daily=daily) for ts in all_ts], axis="columns")
+    all_ts = _filter_ts(
+        site_json["value"]["timeSeries"], _wanted(daily, parameters, statistics)
+    )
+    with span("parse", format="json", timeseries=len(all_ts)) as rec:
+        frames = _parse_many(
+            all_ts, daily=daily, qual=qual, downcast=downcast, workers=workers
+        )
+        rec["rows"] = sum(len(df) for df in frames)
+    if by_site:
+        groups = {}
+        for ts, df in zip(all_ts, frames):
+            groups.setdefault(_site_code(ts), []).append(df)
+        return {site: _join(group) for site, group in groups.items()}
+    return _join(frames)
+
+
+def _join(frames):
+    """
+    Joins parsed `timeSeries` side by side, or None if there are none
+    """
+
+    if len(frames) > 0:
+        with span("concat", frames=len(frames)) as rec:
+            df = pd.concat(frames, axis="columns", sort=True)
+            rec["rows"] = len(df)
 
         return df
 
 
-def read_cache(fpath, daily=False):
-    """Reads a previouly cached dataframe created with `read_nwis`
+PARALLEL_MIN_VALUES = 200000
+
+
+def _parse_batch(batch, daily, qual, downcast):
+    return [_parse_ts(ts, daily=daily, qual=qual, downcast=downcast) for ts in batch]
+
+
+def _parse_many(all_ts, daily, qual="object", downcast=False, workers=None):
+    """
+    Parses `timeSeries` objects, in worker processes for large responses
+    """
+
+    parse = partial(_parse_ts, daily=daily, qual=qual, downcast=downcast)
+    workers = min(workers or 1, len(all_ts), os.cpu_count() or 1)
+    if (
+        workers < 2
+        or sum(len(ts["values"][0]["value"]) for ts in all_ts) < PARALLEL_MIN_VALUES
+    ):
+        return [parse(ts) for ts in all_ts]
+
+    # one task per worker, so each series is pickled to exactly one process
+    batches = [range(i, len(all_ts), workers) for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _parse_batch, [all_ts[i] for i in batch], daily, qual, downcast
+            )
+            for batch in batches
+        ]
+        results = [future.result() for future in futures]
+
+    frames = [None] * len(all_ts)
+    for batch, parsed in zip(batches, results):
+        for i, df in zip(batch, parsed):
+            frames[i] = df
+    return frames
+
+
+def iter_timeseries(chunks, chunk_size=65536):
+    """Incrementally decode the `timeSeries` objects of an NWIS JSON body
+
+    Only the `timeSeries` object currently being decoded is held in memory;
+    the rest of the document is never materialized as a Python dict tree.
 
     Parameters
     ----------
-    fpath : path-like
-        File path to the cached data
+    chunks : requests.Response, file-like, or iterable of bytes/str
+        The response body. Responses are read with ``iter_content`` (use
+        ``fetch_nwis(..., stream=True)``) and file-like objects with
+        ``read``.
+    chunk_size : int (default is 65536)
+        Number of bytes read at a time from responses and files.
+
+    Yields
+    ------
+    dict
+        One decoded `timeSeries` object at a time.
+
+    """
+
+    if hasattr(chunks, "iter_content"):
+        body = chunks.iter_content(chunk_size=chunk_size)
+    elif hasattr(chunks, "read"):
+        body = iter(lambda: chunks.read(chunk_size), chunks.read(0))
+    else:
+        body = iter(chunks)
+
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    state = {"buf": "", "eof": False}
+
+    def _fill(minimum):
+        # read until the buffer holds at least `minimum` characters and
+        # report whether anything was added
+        pieces = [state["buf"]]
+        size = total = len(state["buf"])
+        while not state["eof"] and total < minimum:
+            chunk = next(body, None)
+            if chunk is None:
+                state["eof"] = True
+                chunk = utf8.decode(b"", final=True)
+            elif isinstance(chunk, bytes):
+                chunk = utf8.decode(chunk)
+            pieces.append(chunk)
+            total += len(chunk)
+        state["buf"] = "".join(pieces)
+        return total > size
+
+    def _skip(pos):
+        # advance past whitespace, reading more data as needed
+        while True:
+            buf = state["buf"]
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or not _fill(len(buf) + 1):
+                return pos
+
+    key = '"timeSeries"'
+    start = -1
+    while start < 0:
+        start = state["buf"].find(key)
+        if start < 0:
+            keep = len(key) - 1
+            state["buf"] = state["buf"][-keep:]
+            if not _fill(len(state["buf"]) + chunk_size):
+                return
+
+    pos = _skip(start + len(key))
+    if state["buf"][pos : pos + 1] == ":":
+        pos = _skip(pos + 1)
+    if state["buf"][pos : pos + 1] != "[":
+        raise ValueError("`timeSeries` is not an array")
+    pos = _skip(pos + 1)
+
+    while state["buf"][pos : pos + 1] != "]":
+        try:
+            ts, end = decoder.raw_decode(state["buf"], pos)
+        except json.JSONDecodeError:
+            # incomplete object: at least double the buffer so that large
+            # series are decoded in a linear number of attempts
+            if not _fill(2 * len(state["buf"]) + chunk_size):
+                raise
+            continue
+
+        state["buf"] = state["buf"][end:]
+        yield ts
+        # drop our reference so the object can be freed before the next one
+        # is decoded
+        del ts
+
+        pos = _skip(0)
+        if state["buf"][pos : pos + 1] == ",":
+            pos = _skip(pos + 1)
+        elif state["buf"][pos : pos + 1] != "]":
+            raise ValueError("malformed `timeSeries` array")
+
+
+def iter_frames(
+    chunks, daily=False, qual="object", downcast=False, parameters=None, statistics=None
+):
+    """Parse an NWIS JSON body into dataframes, one `timeSeries` at a time
+
+    Parameters
+    ----------
+    chunks : requests.Response, file-like, or iterable of bytes/str
+        The response body, see `iter_timeseries`.
+    daily : bool (default is False)
+        Set to True if you're parsing daily values or False (default) if they
+        they are instanteous values.
+    qual, downcast, parameters, statistics
+        See `read_nwis`.
+
+    Yields
+    ------
+    pandas.DataFrame
+        The same frame that `_parse_ts` builds for each `timeSeries`.
+
+    Notes
+    -----
+    Each `timeSeries` is reported as its own "parse" record (see
+    `dockside.instrument`), so time spent by the consumer between frames is
+    not counted.
+
+    """
+
+    wanted = _wanted(daily, parameters, statistics)
+    try:
+        for ts in iter_timeseries(chunks):
+            if wanted is not None and not wanted(*_ts_codes(ts)):
+                continue
+            with span("parse", format="json", timeseries=1) as rec:
+                df = _parse_ts(ts, daily=daily, qual=qual, downcast=downcast)
+                rec["rows"] = len(df)
+            del ts
+            yield df
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def read_nwis_stream(
+    chunks, daily=False, qual="object", downcast=False, parameters=None, statistics=None
+):
+    """Read an NWIS JSON body to a pandas Dataframe without decoding it fully
+
+    Equivalent to ``read_nwis(response.json())``, but the response body is
+    parsed incrementally so that the raw text, the full JSON tree, and the
+    dataframe are never all held in memory at once.
+
+    Parameters
+    ----------
+    chunks : requests.Response, file-like, or iterable of bytes/str
+        The response body, see `iter_timeseries`.
     daily : bool (default is False)
         Set to True if you're parsing daily values or False (default) if they
         they are instanteous values.
+    qual, downcast, parameters, statistics
+        See `read_nwis`.
+
+    Returns
+    -------
+    pandas.DataFrame
+
+    Examples
+    --------
+    >>> from dockside.io import fetch_nwis, read_nwis_stream
+    >>> r = fetch_nwis(14211500, '2018-01-01', '2018-06-30', stream=True)
+    >>> df = read_nwis_stream(r)
+
+    """
+
+    frames = list(
+        iter_frames(
+            chunks,
+            daily=daily,
+            qual=qual,
+            downcast=downcast,
+            parameters=parameters,
+            statistics=statistics,
+        )
+    )
+    if len(frames) > 0:
+        return pd.concat(frames, axis="columns", sort=True)
+
+
+# UTC offsets, in hours, of the time zone codes in the `tz_cd` column of RDB
+# output
+RDB_TIMEZONES = {
+    "UTC": 0,
+    "GMT": 0,
+    "AST": -4,
+    "ADT": -3,
+    "EST": -5,
+    "EDT": -4,
+    "CST": -6,
+    "CDT": -5,
+    "MST": -7,
+    "MDT": -6,
+    "PST": -8,
+    "PDT": -7,
+    "AKST": -9,
+    "AKDT": -8,
+    "HST": -10,
+    "HDT": -9,
+    "SST": -11,
+    "ChST": 10,
+}
+
+_RDB_HEADER = re.compile(r"^agency_cd\t", re.M)
+_RDB_DESCRIPTION = re.compile(r"^#\s+(\d+)\s+(\d{5})(?:\s+(\d{5}))?\s+(.+?)\s*$", re.M)
+_RDB_COLUMN = re.compile(r"^(\d+)_(\d{5})(?:_(\d{5}))?$")
+_RDB_STATISTIC = re.compile(r"^(.*) \(([^()]*)\)$")
+
+
+def _rdb_usecols(wanted):
+    """
+    `usecols` callable for `pandas.read_csv` that drops the value and code
+    columns of unwanted time series, so they are never parsed
+    """
+
+    def usecols(name):
+        match = _RDB_COLUMN.match(name[:-3] if name.endswith("_cd") else name)
+        return match is None or wanted(match.group(2), match.group(3))
+
+    return usecols
+
+
+# length of the RDB `datetime` strings -> their format; NWIS writes daily
+# values as dates and instantaneous values to the minute
+_RDB_DATETIME = {10: "%Y-%m-%d", 16: "%Y-%m-%d %H:%M"}
+
+
+def _read_rdb_block(block, labels, daily, qual, downcast, wanted=None):
+    """
+    Parses the table of a single site in an RDB body into one frame per
+    time series
+    """
+
+    df = pd.read_csv(
+        StringIO(block),
+        sep="\t",
+        comment="#",
+        skiprows=[1],
+        dtype={"site_no": str},
+        usecols=None if wanted is None else _rdb_usecols(wanted),
+    )
+    if len(df) == 0:
+        return None, []
+
+    naive = pd.to_datetime(
+        df["datetime"], format=_RDB_DATETIME.get(len(df["datetime"].iat[0]), "ISO8601")
+    )
+    if "tz_cd" in df:
+        codes = df["tz_cd"].to_numpy()
+        try:
+            deltas = {c: pd.Timedelta(hours=RDB_TIMEZONES[c]) for c in pd.unique(codes)}
+        except KeyError as e:
+            raise ValueError("unknown RDB time zone code: {}".format(e))
+        index = _localize(naive, codes, deltas)
+    else:
+        index = pd.DatetimeIndex(naive, name="datetime")
+
+    frames = []
+    for name in df.columns:
+        match = _RDB_COLUMN.match(name)
+        if match is None:
+            continue
+        ts_id, param_cd, stat_cd = match.groups()
+        label = labels.get((ts_id, param_cd, stat_cd or ""), name)
+        if daily:
+            stat = _RDB_STATISTIC.match(label)
+            prefix = stat.groups() if stat else (label, stat_cd)
+            col_levels = ["param", "stat", "var"]
+        else:
+            prefix = (label,)
+            col_levels = ["param", "var"]
+
+        raw = df[name]
+        codes = df[name + "_cd"] if name + "_cd" in df else pd.Series(index=df.index)
+        if pd.api.types.is_numeric_dtype(raw):
+            values = raw
+            text = None
+        else:
+            # e.g., "Ice" or "Eqp" in place of a value
+            values = pd.to_numeric(raw, errors="coerce")
+            text = raw.where(values.isna())
+
+        keep = values.notna() | codes.notna()
+        if text is not None:
+            keep |= text.notna()
+        if pd.api.types.is_numeric_dtype(codes):  # all blank
+            quals = pd.Series("", index=df.index)
+        else:
+            quals = codes.fillna("").str.replace(":", ",", regex=False)
+        if text is not None:
+            extra = text.notna()
+            quals[extra] = (quals[extra] + "," + text[extra]).str.lstrip(",")
+
+        frames.append(
+            _ts_frame(
+                prefix,
+                col_levels,
+                index[keep.to_numpy()],
+                quals[keep].to_numpy(),
+                values[keep].to_numpy(),
+                qual,
+                downcast,
+            )
+        )
+    return df["site_no"].iloc[0], frames
+
+
+def read_nwis_rdb(
+    rdb,
+    daily=False,
+    qual="object",
+    downcast=False,
+    by_site=False,
+    parameters=None,
+    statistics=None,
+):
+    """Read an NWIS RDB (tab-delimited) response to a pandas Dataframe
+
+    RDB responses (``fetch_nwis(..., format="rdb")``) are several times
+    smaller than JSON and are parsed by the C engine of `pandas.read_csv`
+    instead of walking a decoded JSON tree.
+
+    Parameters
+    ----------
+    rdb : string, bytes, or requests.Response
+        Body of the RDB response.
+    daily, qual, downcast, by_site, parameters, statistics
+        See `read_nwis`.
+
+    Returns
+    -------
+    pandas.DataFrame, or dict when `by_site` is True
+        Laid out like the output of `read_nwis`: one ("qual", "value") pair
+        of columns per time series, with multiple qualifiers joined by
+        commas and values such as "Ice" moved to the qualifiers.
+
+    Notes
+    -----
+    RDB does not include the `variableName` of the JSON output, so the
+    parameters are labeled with the descriptions from the header comments
+    instead (e.g., "Discharge, cubic feet per second" rather than
+    "Streamflow, ft&#179;/s"). For daily values, the statistic in
+    parentheses at the end of the description becomes the "stat" level.
+
+    Examples
+    --------
+    >>> from dockside.io import fetch_nwis, read_nwis_rdb
+    >>> r = fetch_nwis(14211500, '2018-01-01', '2018-06-30', format='rdb')
+    >>> df = read_nwis_rdb(r)
+
+    """
+
+    if hasattr(rdb, "text"):
+        rdb = rdb.text
+    elif isinstance(rdb, bytes):
+        rdb = rdb.decode("utf-8")
+
+    with span("parse", format="rdb") as rec:
+        wanted = _wanted(daily, parameters, statistics)
+        groups = _read_rdb_blocks(rdb, daily, qual, downcast, wanted)
+        frames = [df for site_frames in groups.values() for df in site_frames]
+        rec["timeseries"] = len(frames)
+        rec["rows"] = sum(len(df) for df in frames)
+
+    if by_site:
+        return {site: _join(frames) for site, frames in groups.items()}
+    return _join(frames)
+
+
+def _read_rdb_blocks(rdb, daily, qual, downcast, wanted=None):
+    """
+    Site ID -> list of frames for every time series in an RDB body
+    """
+
+    starts = [m.start() for m in _RDB_HEADER.finditer(rdb)]
+    groups = {}
+    comments_from = 0
+    for i, pos in enumerate(starts):
+        stop = starts[i + 1] if i + 1 < len(starts) else len(rdb)
+        labels = {
+            (ts_id, param_cd, stat_cd): desc
+            for ts_id, param_cd, stat_cd, desc in _RDB_DESCRIPTION.findall(
+                rdb, comments_from, pos
+            )
+        }
+        site, frames = _read_rdb_block(
+            rdb[pos:stop], labels, daily, qual, downcast, wanted
+        )
+        if frames:
+            groups.setdefault(site, []).extend(frames)
+        comments_from = pos
+    return groups
+
+
+def read_nwis_file(
+    fpath, daily=False, qual="object", downcast=False, parameters=None, statistics=None
+):
+    """Read an NWIS response saved to disk, e.g., by `download_nwis`
+
+    Parameters
+    ----------
+    fpath : path-like
+        JSON or RDB body, optionally gzip-compressed. The compression and the
+        format are detected from the contents of the file.
+    daily, qual, downcast, parameters, statistics
+        See `read_nwis`.
+
+    Returns
+    -------
+    pandas.DataFrame
+
+    """
+
+    with Path(fpath).open("rb") as raw:
+        compressed = raw.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    with opener(fpath, "rb") as fp:
+        first = fp.read(4096).lstrip()[:1]
+        fp.seek(0)
+        kwargs = dict(
+            daily=daily,
+            qual=qual,
+            downcast=downcast,
+            parameters=parameters,
+            statistics=statistics,
+        )
+        if first == b"{":
+            return read_nwis_stream(fp, **kwargs)
+        return read_nwis_rdb(fp.read(), **kwargs)
+
+
+def date_chunks(start, end, freq="MS"):
+    """Split a date range into consecutive, non-overlapping windows
+
+    Parameters
+    ----------
+    start, end : string or date-like
+        Inclusive start and end dates of the full period.
+    freq : string or pandas.DateOffset (default is "MS")
+        Boundaries between the windows, as a pandas offset alias. E.g.,
+        "MS" splits on the first of every month and "7D" splits the period
+        into weeks counted from `start`.
+
+    Returns
+    -------
+    list of (pandas.Timestamp, pandas.Timestamp) tuples
+        Inclusive start and end dates of each window, matching the
+        inclusive `startDT` and `endDT` parameters of the NWIS API.
+
+    Examples
+    --------
+    >>> from dockside.io import date_chunks
+    >>> for a, b in date_chunks('2018-01-15', '2018-03-10', freq='MS'):
+    ...     print(a.date(), b.date())
+    2018-01-15 2018-01-31
+    2018-02-01 2018-02-28
+    2018-03-01 2018-03-10
+
+    """
+
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    edges = [e for e in pd.date_range(start, end, freq=freq) if e > start]
+    starts = [start, *edges]
+    ends = [e - pd.Timedelta(days=1) for e in edges] + [end]
+    return list(zip(starts, ends))
+
+
+def _stitch(frames):
+    """
+    Concatenates frames along the index, dropping duplicate timestamps
+    (later frames win) and sorting the result
+    """
+
+    frames = [df for df in frames if df is not None]
+    if len(frames) == 0:
+        return None
+
+    # windows on either side of a DST change come back with different UTC
+    # offsets, which pandas can only combine into an object index
+    if len({str(getattr(df.index, "tz", None)) for df in frames}) > 1:
+        frames = [df.tz_convert("UTC") for df in frames]
+
+    df = pd.concat(frames, axis="index", sort=False)
+    return df.loc[~df.index.duplicated(keep="last")].sort_index()
+
+
+def read_nwis_chunked(
+    site, start, end, daily=False, chunk="MS", max_workers=4, client=None, **kwargs
+):
+    """Fetch and parse a long period of record in smaller windows
+
+    Parameters
+    ----------
+    site : int or string
+        Site ID number from NWIS.
+    start, end : string or date-like
+        Some form of date representation for the start and end of the NWIS
+        observations you'd like to download
+    daily : bool (default is False)
+        Toggles downloading daily (True) or instanteous values (False, default)
+    chunk : string or pandas.DateOffset (default is "MS")
+        Size of each window, see `date_chunks`.
+    max_workers : int (default is 4)
+        Maximum number of windows downloaded at the same time.
+    client : dockside.Client, optional
+        Pooled HTTP client shared by all of the workers.
+
+    Additional Parameters
+    ---------------------
+    All additional keyword arguments are passed directly to the NWIS API.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A single, de-duplicated and monotonically indexed dataframe.
+
+    Notes
+    -----
+    Each worker parses its window as soon as it arrives and discards the
+    decoded JSON, so at most `max_workers` raw responses are held in memory
+    at once regardless of the length of the full period.
+
+    Examples
+    --------
+    >>> from dockside.io import read_nwis_chunked
+    >>> df = read_nwis_chunked(14211500, '2015-01-01', '2018-06-30', chunk='QS')
+
+    """
+
+    def _read_one(window):
+        r = fetch_nwis(site, *window, daily=daily, client=client, **kwargs)
+        r.raise_for_status()
+        return read_nwis(_decode(r), daily=daily)
+
+    windows = date_chunks(start, end, freq=chunk)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(_read_one, windows))
+    return _stitch(frames)
+
+
+def iter_nwis(
+    sites,
+    start,
+    end,
+    daily=False,
+    chunk=None,
+    max_workers=4,
+    client=None,
+    qual="object",
+    downcast=False,
+    **kwargs,
+):
+    """Download data piece by piece, yielding each time series as it arrives
+
+    One request is sent per site and date window. As soon as a response
+    has been parsed, its time series are yielded, so downstream consumers
+    (database writers, resamplers, ...) can start while the remaining
+    requests are still in flight.
+
+    Parameters
+    ----------
+    sites : int, string, or sequence
+        One or more site ID numbers from NWIS.
+    start, end : string or date-like
+        Some form of date representation for the start and end of the NWIS
+        observations you'd like to download
+    daily : bool (default is False)
+        Toggles downloading daily (True) or instanteous values (False, default)
+    chunk : string or pandas.DateOffset, optional
+        Split the period into windows of this size, see `date_chunks`.
+        Without it, each site is downloaded in a single request.
+    max_workers : int (default is 4)
+        Maximum number of requests in flight at any time.
+    client : dockside.Client, optional
+        Pooled HTTP client shared by all of the workers.
+    qual, downcast
+        See `read_nwis`.
+
+    Additional Parameters
+    ---------------------
+    All additional keyword arguments are passed directly to the NWIS API.
+
+    Yields
+    ------
+    site : int or string
+        The site ID, as given in `sites`.
+    parameter : string
+        The `variableName` of the time series.
+    pandas.DataFrame
+        The same frame that `read_nwis` builds for this time series and
+        window, in the order the requests complete.
+
+    Notes
+    -----
+    A request is only sent once a worker is free and the pieces of at most
+    `max_workers` responses wait to be consumed, so memory use does not grow
+    with the number of sites or the length of the period. Errors are raised
+    from the generator; closing it early cancels the pending requests.
+
+    Examples
+    --------
+    >>> from dockside.io import iter_nwis
+    >>> for site, param, df in iter_nwis(['14211500', '14211010'],
+    ...                                  '2010-01-01', '2018-06-30',
+    ...                                  chunk='YS'):
+    ...     print(site, param, df.shape)
+
+    """
+
+    if isinstance(sites, (str, int)):
+        sites = [sites]
+    windows = [(start, end)] if chunk is None else date_chunks(start, end, freq=chunk)
+    jobs = ((site, a, b) for site in sites for a, b in windows)
+
+    def _read_one(site, a, b):
+        r = fetch_nwis(site, a, b, daily=daily, client=client, stream=True, **kwargs)
+        try:
+            r.raise_for_status()
+        except Exception:
+            r.close()
+            raise
+        return [
+            (site, df.columns[0][0], df)
+            for df in iter_frames(r, daily=daily, qual=qual, downcast=downcast)
+        ]
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+    try:
+        for job in itertools.islice(jobs, max_workers):
+            pending.add(executor.submit(_read_one, *job))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pieces = future.result()
+                for job in itertools.islice(jobs, 1):
+                    pending.add(executor.submit(_read_one, *job))
+                while pieces:
+                    yield pieces.pop(0)
+    finally:
+        # `shutdown(cancel_futures=True)` needs Python 3.9
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def fetch_many(sites, start, end, daily=False, max_workers=8, client=None, **kwargs):
+    """Fetch and parse data for many sites concurrently
+
+    Parameters
+    ----------
+    sites : sequence
+        Site ID numbers from NWIS.
+    start, end : string or date-like
+        Some form of date representation for the start and end of the NWIS
+        observations you'd like to download
+    daily : bool (default is False)
+        Toggles downloading daily (True) or instanteous values (False, default)
+    max_workers : int (default is 8)
+        Maximum number of requests in flight at any time. Keep this at or
+        below the `pool_size` of the client so that connections are reused.
+    client : dockside.Client, optional
+        Pooled HTTP client shared by all of the workers.
+
+    Additional Parameters
+    ---------------------
+    All additional keyword arguments are passed directly to the NWIS API.
+
+    Returns
+    -------
+    data : dict
+        Site ID -> pandas.DataFrame (or None if NWIS returned no data) for
+        every site that was downloaded and parsed successfully.
+    errors : dict
+        Site ID -> exception for every site that failed. A failure at one
+        site never aborts the rest of the batch.
+
+    Examples
+    --------
+    >>> from dockside.io import fetch_many, combine_sites
+    >>> data, errors = fetch_many(['14211500', '14211010'], '2018-01-01',
+    ...                           '2018-01-31', daily=True, max_workers=2)
+    >>> df = combine_sites(data)
+
+    """
+
+    def _fetch_one(site):
+        r = fetch_nwis(site, start, end, daily=daily, client=client, **kwargs)
+        r.raise_for_status()
+        return read_nwis(_decode(r), daily=daily)
+
+    data, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_fetch_one, site): site for site in sites}
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                data[site] = future.result()
+            except Exception as e:
+                errors[site] = e
+
+    ordered = {site: data[site] for site in sites if site in data}
+    return ordered, errors
+
+
+def fetch_batched(
+    sites,
+    start,
+    end,
+    daily=False,
+    batch_size=100,
+    max_workers=8,
+    client=None,
+    **kwargs,
+):
+    """Fetch and parse data for many sites, several sites per request
+
+    NWIS accepts a comma-separated list of sites, so packing them into
+    batches cuts the number of requests by a factor of `batch_size`. Each
+    response is split back out per site using the site code of every time
+    series.
+
+    Parameters
+    ----------
+    sites : sequence
+        Site ID numbers from NWIS.
+    start, end : string or date-like
+        Some form of date representation for the start and end of the NWIS
+        observations you'd like to download
+    daily : bool (default is False)
+        Toggles downloading daily (True) or instanteous values (False, default)
+    batch_size : int (default is 100)
+        Maximum number of sites per request.
+    max_workers : int (default is 8)
+        Maximum number of requests in flight at any time.
+    client : dockside.Client, optional
+        Pooled HTTP client shared by all of the workers.
+
+    Additional Parameters
+    ---------------------
+    All additional keyword arguments are passed directly to the NWIS API.
+
+    Returns
+    -------
+    data, errors : dict
+        Same as `fetch_many`. A failed request puts every site of its batch
+        in `errors`.
+
+    Examples
+    --------
+    >>> from dockside.io import fetch_batched, combine_sites
+    >>> data, errors = fetch_batched(['14211500', '14211010'], '2018-01-01',
+    ...                              '2018-01-31', daily=True)
+    >>> df = combine_sites(data)
+
+    """
+
+    sites = list(sites)
+    batches = [sites[i : i + batch_size] for i in range(0, len(sites), batch_size)]
+
+    def _fetch_batch(batch):
+        r = fetch_nwis(
+            ",".join(map(str, batch)),
+            start,
+            end,
+            daily=daily,
+            client=client,
+            **kwargs,
+        )
+        r.raise_for_status()
+        frames = read_nwis(_decode(r), daily=daily, by_site=True)
+        return {site: frames.get(str(site)) for site in batch}
+
+    data, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_fetch_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                data.update(future.result())
+            except Exception as e:
+                errors.update({site: e for site in futures[future]})
+
+    ordered = {site: data[site] for site in sites if site in data}
+    return ordered, errors
+
+
+def combine_sites(data):
+    """Combine per-site dataframes into a single dataframe
+
+    Parameters
+    ----------
+    data : dict
+        Site ID -> pandas.DataFrame as returned by `fetch_many` or
+        `fetch_batched`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The column index gains a new top level named "site". Sites without
+        data are dropped. Returns None if no site has any data.
+
+    """
+
+    frames = {site: df for site, df in data.items() if df is not None}
+    if len(frames) > 0:
+        return pd.concat(frames, axis="columns", names=["site"], sort=True)
+
+
+CACHE_FORMATS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+    ".csv": "csv",
+}
+
+_MAGIC = {b"PAR1": "parquet", b"ARROW1": "feather"}
+
+
+def _import_pyarrow():
+    """
+    Imports pyarrow on demand, returning None if it is not installed
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.feather  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _resolve_format(fmt):
+    """
+    Returns `fmt` if it can be written here, or "csv" (with a warning) when
+    it needs pyarrow and pyarrow is not installed
+    """
+
+    if fmt not in ("parquet", "feather", "csv"):
+        raise ValueError("unknown cache format '{}'".format(fmt))
+    if fmt != "csv" and _import_pyarrow() is None:
+        warnings.warn("pyarrow is not installed, caching as CSV instead of " + fmt)
+        return "csv"
+    return fmt
+
+
+def cache_format(fpath):
+    """Detect the format of a cache file
+
+    The file extension is used when it is one of `CACHE_FORMATS`. Otherwise
+    the first bytes of the file are checked for the Parquet or Arrow IPC
+    (Feather v2) signatures, falling back to CSV.
+
+    Parameters
+    ----------
+    fpath : path-like
+
+    Returns
+    -------
+    string
+        One of "parquet", "feather", or "csv".
+
+    """
+
+    fpath = Path(fpath)
+    fmt = CACHE_FORMATS.get(fpath.suffix.lower())
+    if fmt is None:
+        with fpath.open("rb") as fp:
+            head = fp.read(6)
+        fmt = next(
+            (fmt for magic, fmt in _MAGIC.items() if head.startswith(magic)), "csv"
+        )
+    return fmt
+
+
+def write_cache(df, fpath, fmt=None):
+    """Write a dataframe created with `read_nwis` to disk
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    fpath : path-like
+        Destination of the cached data.
+    fmt : string, optional
+        One of "parquet", "feather", or "csv". Inferred from the extension of
+        `fpath` when not provided. Parquet and Feather keep the column
+        MultiIndex, dtypes and time zones, but require pyarrow. Without it,
+        a CSV file is written next to `fpath` instead, with a warning.
+
+    Returns
+    -------
+    pathlib.Path
+        The path of the file that was written.
+
+    Notes
+    -----
+    Feather files are written uncompressed so that `read_cache` can
+    memory-map them without decompressing.
+
+    """
+
+    fpath = Path(fpath)
+    requested = fmt or CACHE_FORMATS.get(fpath.suffix.lower(), "csv")
+    fmt = _resolve_format(requested)
+    if fmt != requested:
+        fpath = fpath.with_suffix(".csv")
+
+    with span("write_cache", path=str(fpath), format=fmt, rows=len(df)) as rec:
+        if fmt == "parquet":
+            df.to_parquet(fpath, engine="pyarrow")
+        elif fmt == "feather":
+            pa = _import_pyarrow()
+            table = pa.Table.from_pandas(df)
+            pa.feather.write_feather(table, fpath, compression="uncompressed")
+        else:
+            df.to_csv(fpath, encoding="utf-8")
+        if enabled():
+            rec["bytes"] = os.path.getsize(fpath)
+    return fpath
+
+
+def _csv_header_rows(fpath):
+    """
+    Number of column header rows in a CSV file written by `write_cache`
+    (i.e., the rows before the line that holds only the index name)
+    """
+
+    with Path(fpath).open("r", encoding="utf-8", newline="") as fp:
+        for n, row in enumerate(csv.reader(fp)):
+            if len(row) > 1 and not any(row[1:]):
+                return n
+    raise ValueError("could not find the column headers in {}".format(fpath))
+
+
+def read_cache(fpath, daily=None, memory_map=False):
+    """Reads a previouly cached dataframe created with `read_nwis`
+
+    Parameters
+    ----------
+    fpath : path-like
+        File path to the cached data. The format is detected automatically
+        (see `cache_format`).
+    daily : bool, optional
+        Only used for CSV files. Set to True if you're parsing daily values or
+        False if they they are instanteous values. When not provided, the
+        number of header rows is read from the file.
+    memory_map : bool (default is False)
+        Memory-map Parquet and Feather files instead of reading them into
+        memory up front.
 
     Returns
     -------
@@ -143,16 +1590,37 @@ def read_cache(fpath, daily=False):
     --------
     >>> from tempfile import TemporaryDirectory
     >>> from pathlib import Path
-    >>> from dockside.io import fetch_nwis, read_nwis, read_cache
+    >>> from dockside.io import fetch_nwis, read_nwis, read_cache, write_cache
     >>> r = fetch_nwis(14211500, '2018-01-01', '2018-06-30', daily=True)
     >>> with TemporaryDirectory() as td:
-    ...     fpath = Path(td) / 'cached_flow.csv'
+    ...     fpath = Path(td) / 'cached_flow.parquet'
     ...     df1 = read_nwis(r.json(), daily=True)
-    ...     df1.to_csv(fpath)
-    ...     df2 = read_cache(fpath, daily=True)
+    ...     fpath = write_cache(df1, fpath)
+    ...     df2 = read_cache(fpath)
     """
 
-    header = [0, 1]
-    if daily:
-        header.append(2)
+    fmt = cache_format(fpath)
+    with span("read_cache", path=str(fpath), format=fmt) as rec:
+        df = _read_cache(fpath, fmt, daily=daily, memory_map=memory_map)
+        if enabled():
+            rec["rows"] = len(df)
+            rec["bytes"] = os.path.getsize(fpath)
+    return df
+
+
+def _read_cache(fpath, fmt, daily, memory_map):
+    if fmt == "parquet":
+        return pd.read_parquet(fpath, engine="pyarrow", memory_map=memory_map)
+    elif fmt == "feather":
+        pa = _import_pyarrow()
+        if pa is None:
+            raise RuntimeError("pyarrow required to read {}".format(fpath))
+        return pa.feather.read_table(fpath, memory_map=memory_map).to_pandas()
+
+    if daily is None:
+        header = list(range(_csv_header_rows(fpath)))
+    else:
+        header = [0, 1]
+        if daily:
+            header.append(2)
     return pd.read_csv(fpath, parse_dates=[0], header=header, index_col=[0])
@@ -2,7 +2,28 @@ from pathlib import Path
 
 from pandas import Timestamp
 
-from .io import fetch_nwis, read_nwis, read_cache
+from .cache import ONE_DAY, _in_utc, _slice_dates
+from .catalog import get_catalog
+from .client import get_client
+from .stats import aggregate
+from .io import (
+    download_nwis,
+    fetch_nwis,
+    fetch_many,
+    fetch_batched,
+    combine_sites,
+    iter_nwis,
+    read_nwis,
+    read_nwis_chunked,
+    read_nwis_stream,
+    read_cache,
+    read_nwis_file,
+    write_cache,
+    _codes,
+    _decode,
+    _json_timezone,
+    _resolve_format,
+)
 
 
 class Station(object):
@@ -18,23 +39,138 @@ class Station(object):
         Start and end dates for the period of interest.
     savepath : path-like
         Path to where data would be saved when using the `get_data` method.
+    client : dockside.Client, optional
+        Pooled HTTP client used for all requests made by the station. When not
+        provided, the module-level client shared by `fetch_nwis` is used.
+    chunk : string or pandas.DateOffset, optional
+        When provided, `daily_data`, `insta_data`, and `get_data` download
+        the period in windows of this size (e.g., "MS" for monthly) in
+        parallel and stitch them back together. See
+        `dockside.io.read_nwis_chunked`.
+    stream : bool (default is False)
+        When True, `daily_data` and `insta_data` are parsed incrementally from
+        the response body (see `dockside.io.read_nwis_stream`) instead of
+        going through `daily_json` and `insta_json`, which keeps peak memory
+        low for large responses.
+    cache_format : string (default is "csv")
+        Format of the files written by `get_data`: "csv", "parquet", or
+        "feather". The binary formats keep dtypes and time zones and are much
+        faster to read back, but require pyarrow; without it, CSV is used.
+    cache : dockside.cache.IncrementalCache or dockside.store.ArrayStore, optional
+        When provided, `daily_data`, `insta_data`, and `get_data` read from
+        and save to this store, which only downloads the days it does not
+        already hold.
+    raw : bool (default is False)
+        When True, `get_data` saves the gzip-compressed response body as it
+        came from NWIS (".json.gz", see `dockside.io.download_nwis`) instead
+        of the parsed dataframe in `cache_format`.
+    frame_cache : dockside.cache.FrameCache, optional
+        In-memory cache that `daily_data` and `insta_data` are looked up in
+        and added to, so that other stations for the same server, site, and
+        an overlapping window can reuse them, e.g., the module-level cache
+        returned by `dockside.cache.get_frame_cache`. Each station gets its
+        own copy of a cached frame. Not used by default.
+    derive_daily : bool (default is False)
+        When True, `daily_data` is computed locally from `insta_data` (see
+        `dockside.stats.aggregate`) instead of being requested from the
+        daily values service. Daily values derived from provisional
+        instantaneous data may differ from the ones NWIS publishes. The days
+        are the site's local days, see `tz`.
+    catalog : dockside.catalog.Catalog or False, optional
+        Index of the files saved by `get_data`. A file that covers the
+        requested window is read (and trimmed to it) even when it was saved
+        for a different window. Defaults to the catalog of `savepath`;
+        False disables it.
+    parameters : string, int, or sequence, optional
+        NWIS parameter codes (e.g., "00060" for discharge) of the time series
+        to download. They are sent with every request, so other time series
+        are neither downloaded nor parsed, and saved files are named after
+        them. Defaults to all of them. Not applied to data read from `cache`.
+    statistics : string, int, or sequence, optional
+        NWIS statistic codes (e.g., "00003" for the mean) of the daily values
+        to download. Defaults to all of them.
+    tz : string, optional
+        IANA time zone of the site (e.g., "America/Los_Angeles"). Instantaneous
+        values across a daylight saving time change are indexed in UTC, and
+        the time zone is needed to trim them to the station's window from a
+        larger saved or cached frame. Defaults to the one NWIS reports in
+        `insta_json` or `daily_json` once those are downloaded; until then,
+        such frames are downloaded again instead.
 
     """
 
-    def __init__(self, site, start, end, savepath="data"):
+    def __init__(
+        self,
+        site,
+        start,
+        end,
+        savepath="data",
+        client=None,
+        chunk=None,
+        stream=False,
+        cache_format="csv",
+        cache=None,
+        raw=False,
+        frame_cache=None,
+        derive_daily=False,
+        catalog=None,
+        parameters=None,
+        statistics=None,
+        tz=None,
+    ):
         self.site = site
         self.start = Timestamp(start)
         self.end = Timestamp(end)
-        self.savepath = Path("." or savepath)
+        self.savepath = Path(savepath)
+        self.client = client
+        self.chunk = chunk
+        self.stream = stream
+
+        self.cache_format = _resolve_format(cache_format)
+        self.cache = cache
+        self.raw = raw
+        self.frame_cache = None if frame_cache is False else frame_cache
+        self.derive_daily = derive_daily
+        if catalog is None:
+            catalog = get_catalog(self.savepath)
+        self.catalog = None if catalog is False else catalog
+        self.parameters = parameters
+        self.statistics = statistics
+        self.tz = tz
 
         self._daily_json = None
         self._insta_json = None
         self._daily_data = None
         self._insta_data = None
 
+    def _series(self, daily):
+        """
+        Keyword arguments that select the station's time series, and a tag
+        that tells apart the files and cache entries holding only those
+        """
+
+        kwargs, tags = {}, []
+        if self.parameters is not None:
+            kwargs["parameters"] = self.parameters
+            tags.append("p" + "-".join(_codes(self.parameters)))
+        if self.statistics is not None and daily:
+            kwargs["statistics"] = self.statistics
+            tags.append("s" + "-".join(_codes(self.statistics)))
+        return kwargs, "_".join(tags)
+
+    def _zone(self):
+        """The site's time zone: `tz`, or the one NWIS reported for it"""
+        if self.tz is not None:
+            return self.tz
+        for site_json in (self._insta_json, self._daily_json):
+            if site_json is not None:
+                return _json_timezone(site_json)
+        return None
+
     def _make_fpath(self, daily):
         datefmt = "%Y%m%d"
         suffix = "daily" if daily else "insta"
+        _, tag = self._series(daily)
         fname = "_".join(
             [
                 f"{self.site}",
@@ -42,38 +178,212 @@ class Station(object):
                 "thru",
                 self.end.strftime(datefmt),
                 suffix,
+                *([tag] if tag else []),
             ]
         )
-        return self.savepath / (fname + ".csv")
+        ext = "json.gz" if self.raw else self.cache_format
+        return self.savepath / (fname + "." + ext)
+
+    def _read_saved(self, fpath, daily):
+        if fpath.name.endswith(".json.gz"):
+            kwargs, _ = self._series(daily)
+            return read_nwis_file(fpath, daily=daily, **kwargs)
+        return read_cache(fpath, daily=daily)
+
+    def _from_catalog(self, daily):
+        """
+        Data for the window from any saved file that covers it, or None
+        """
+
+        if self.catalog is None:
+            return None
+        _, tag = self._series(daily)
+        fpath = self.catalog.find(
+            self.site, self.start, self.end, daily=daily, series=tag
+        )
+        if fpath is not None:
+            df = self._read_saved(fpath, daily)
+            if df is not None:
+                return _slice_dates(df, self.start, self.end, tz=self._zone())
+
+    def _register(self, fpath, daily):
+        if self.catalog is not None:
+            # days from today onward are still being reported, so, like
+            # `IncrementalCache`, only complete days are recorded as covered
+            today = Timestamp.now().normalize()
+            if Timestamp(self.start).normalize() >= today:
+                return
+            end = min(Timestamp(self.end).normalize(), today - ONE_DAY)
+            _, tag = self._series(daily)
+            self.catalog.add(fpath, self.site, self.start, end, daily=daily, series=tag)
 
     @property
     def daily_json(self):
         if self._daily_json is None:
-            self._daily_json = fetch_nwis(
-                self.site, self.start, self.end, daily=True
-            ).json()
+            kwargs, _ = self._series(daily=True)
+            self._daily_json = _decode(
+                fetch_nwis(
+                    self.site,
+                    self.start,
+                    self.end,
+                    daily=True,
+                    client=self.client,
+                    **kwargs,
+                )
+            )
         return self._daily_json
 
     @property
     def insta_json(self):
         if self._insta_json is None:
-            self._insta_json = fetch_nwis(
-                self.site, self.start, self.end, daily=False
-            ).json()
+            kwargs, _ = self._series(daily=False)
+            self._insta_json = _decode(
+                fetch_nwis(
+                    self.site,
+                    self.start,
+                    self.end,
+                    daily=False,
+                    client=self.client,
+                    **kwargs,
+                )
+            )
         return self._insta_json
 
+    def _download(self, daily):
+        kwargs, _ = self._series(daily)
+        if self.chunk is not None:
+            return read_nwis_chunked(
+                self.site,
+                self.start,
+                self.end,
+                daily=daily,
+                chunk=self.chunk,
+                client=self.client,
+                **kwargs,
+            )
+
+        r = fetch_nwis(
+            self.site,
+            self.start,
+            self.end,
+            daily=daily,
+            client=self.client,
+            stream=self.stream,
+            **kwargs,
+        )
+        r.raise_for_status()
+        if self.stream:
+            return read_nwis_stream(r, daily=daily, **kwargs)
+        return read_nwis(_decode(r), daily=daily, **kwargs)
+
+    def _frame_key(self, daily):
+        """
+        Key of the station's frames in `frame_cache`: the server, the site,
+        and the selected time series
+        """
+
+        client = self.client if self.client is not None else get_client()
+        _, tag = self._series(daily)
+        site = "{}_{}".format(self.site, tag) if tag else str(self.site)
+        return "{} {}".format(client.base_url, site)
+
+    def _shared(self, daily, load):
+        if self.frame_cache is None:
+            return load()
+        key = self._frame_key(daily)
+        df = self.frame_cache.get(
+            key, self.start, self.end, daily=daily, tz=self._zone()
+        )
+        if df is None:
+            df = load()
+            tz = self._zone() if _in_utc(df) else None
+            self.frame_cache.put(key, self.start, self.end, daily, df, tz=tz)
+        return df
+
+    def _load_daily(self):
+        if self.cache is not None:
+            return self.cache.get(
+                self.site, self.start, self.end, daily=True, tz=self.tz
+            )
+        if self.chunk is None and not self.stream:
+            kwargs, _ = self._series(daily=True)
+            return read_nwis(self.daily_json, daily=True, **kwargs)
+        return self._download(daily=True)
+
+    def _load_insta(self):
+        if self.cache is not None:
+            return self.cache.get(
+                self.site, self.start, self.end, daily=False, tz=self.tz
+            )
+        if self.chunk is None and not self.stream:
+            kwargs, _ = self._series(daily=False)
+            return read_nwis(self.insta_json, daily=False, **kwargs)
+        return self._download(daily=False)
+
+    def _derive_daily(self):
+        """
+        Daily values of the site's local days from `insta_data`, which is in
+        UTC when the window spans a daylight saving time change
+        """
+
+        insta = self.insta_data
+        tz = None
+        if _in_utc(insta):
+            tz = self._zone()
+            if tz is None:
+                raise ValueError(
+                    "the instantaneous values span a daylight saving time "
+                    "change; pass the site's `tz` to derive its daily values"
+                )
+        return aggregate(insta, tz=tz)
+
     @property
     def daily_data(self):
         if self._daily_data is None:
-            self._daily_data = read_nwis(self.daily_json, daily=True)
+            if self.derive_daily:
+                self._daily_data = self._derive_daily()
+            else:
+                self._daily_data = self._shared(True, self._load_daily)
         return self._daily_data
 
     @property
     def insta_data(self):
         if self._insta_data is None:
-            self._insta_data = read_nwis(self.insta_json, daily=False)
+            self._insta_data = self._shared(False, self._load_insta)
         return self._insta_data
 
+    def iter_data(self, daily=False, chunk=None, max_workers=4):
+        """
+        Download the data piece by piece, see `dockside.io.iter_nwis`.
+
+        Parameters
+        ----------
+        daily : bool (default False)
+            Toggles fetching either instaneous (False) or daily values (True).
+        chunk : string or pandas.DateOffset, optional
+            Size of the date windows requested at once. Defaults to the
+            station's `chunk`.
+        max_workers : int (default is 4)
+            Maximum number of requests in flight at any time.
+
+        Yields
+        ------
+        (site, parameter, pandas.DataFrame) tuples
+
+        """
+
+        kwargs, _ = self._series(daily)
+        return iter_nwis(
+            self.site,
+            self.start,
+            self.end,
+            daily=daily,
+            chunk=chunk if chunk is not None else self.chunk,
+            max_workers=max_workers,
+            client=self.client,
+            **kwargs,
+        )
+
     def get_data(self, daily=False, save=False, force=False):
         """
         Fetch and save data for the site.
@@ -83,7 +393,9 @@ class Station(object):
         daily : bool (default False)
             Toggles fetching either instaneous (False) or daily values (True).
         save : bool (defaut False)
-            Toggles saving the downloaded data to `site.savepath`
+            Toggles saving the downloaded data to `site.savepath` in the
+            station's `cache_format`. Ignored when the station has a `cache`,
+            which always saves.
         force : bool (defaut False)
             If True and the data has already been downloaded and save, this
             will force the redownloading of the data.
@@ -100,12 +412,149 @@ class Station(object):
 
         """
 
+        if self.cache is not None:
+            return self.cache.get(
+                self.site, self.start, self.end, daily=daily, force=force, tz=self.tz
+            )
+
         fpath = self._make_fpath(daily=daily)
 
+        if not fpath.exists() and not force:
+            df = self._from_catalog(daily)
+            if df is not None:
+                return df
+
         if not fpath.exists() or force:
-            df = read_nwis(self.site, self.start, self.end, daily=daily)
-            if save:
-                df.to_csv(fpath, encoding="utf-8")
+            if save and self.raw:
+                self.savepath.mkdir(parents=True, exist_ok=True)
+                kwargs, _ = self._series(daily)
+                download_nwis(
+                    self.site,
+                    self.start,
+                    self.end,
+                    fpath,
+                    daily=daily,
+                    client=self.client,
+                    **kwargs,
+                )
+                self._register(fpath, daily)
+                df = self._read_saved(fpath, daily)
+            else:
+                df = self._download(daily=daily)
+                if save and df is not None:
+                    self.savepath.mkdir(parents=True, exist_ok=True)
+                    write_cache(df, fpath, fmt=self.cache_format)
+                    self._register(fpath, daily)
         else:
-            df = read_cache(fpath, daily=daily)
+            df = self._read_saved(fpath, daily)
         return df
+
+
+class StationCollection(object):
+    """Many USGS stations downloaded concurrently
+
+    Parameters
+    ----------
+    sites : sequence
+        Site ID numbers from NWIS.
+    start, end : string or date-like
+        Start and end dates for the period of interest.
+    max_workers : int (default is 8)
+        Maximum number of requests in flight at any time.
+    client : dockside.Client, optional
+        Pooled HTTP client shared by all requests made by the collection.
+    batch_size : int, optional
+        When provided, up to this many sites are requested at once and the
+        responses are split back out per site (see
+        `dockside.io.fetch_batched`). Otherwise each site is its own request.
+    parameters, statistics : string, int, or sequence, optional
+        NWIS parameter and statistic codes of the time series to download,
+        see `Station`.
+
+    Notes
+    -----
+    Sites that fail to download are left out of `daily_data` and
+    `insta_data`. The exceptions raised for those sites are kept in the
+    `daily_errors` and `insta_errors` dictionaries, keyed by site ID.
+
+    """
+
+    def __init__(
+        self,
+        sites,
+        start,
+        end,
+        max_workers=8,
+        client=None,
+        batch_size=None,
+        parameters=None,
+        statistics=None,
+    ):
+        self.sites = list(sites)
+        self.start = Timestamp(start)
+        self.end = Timestamp(end)
+        self.max_workers = max_workers
+        self.client = client
+        self.batch_size = batch_size
+        self.parameters = parameters
+        self.statistics = statistics
+
+        self.daily_errors = {}
+        self.insta_errors = {}
+        self._daily_frames = None
+        self._insta_frames = None
+
+    def _fetch(self, daily):
+        kwargs = {}
+        if self.parameters is not None:
+            kwargs["parameters"] = self.parameters
+        if self.statistics is not None and daily:
+            kwargs["statistics"] = self.statistics
+        if self.batch_size is not None:
+            data, errors = fetch_batched(
+                self.sites,
+                self.start,
+                self.end,
+                daily=daily,
+                batch_size=self.batch_size,
+                max_workers=self.max_workers,
+                client=self.client,
+                **kwargs,
+            )
+        else:
+            data, errors = fetch_many(
+                self.sites,
+                self.start,
+                self.end,
+                daily=daily,
+                max_workers=self.max_workers,
+                client=self.client,
+                **kwargs,
+            )
+        if daily:
+            self.daily_errors = errors
+        else:
+            self.insta_errors = errors
+        return data
+
+    @property
+    def daily_frames(self):
+        """Site ID -> daily values dataframe"""
+        if self._daily_frames is None:
+            self._daily_frames = self._fetch(daily=True)
+        return self._daily_frames
+
+    @property
+    def insta_frames(self):
+        """Site ID -> instantaneous values dataframe"""
+        if self._insta_frames is None:
+            self._insta_frames = self._fetch(daily=False)
+        return self._insta_frames
+
+    @property
+    def daily_data(self):
+        return combine_sites(self.daily_frames)
+
+    @property
+    def insta_data(self):
+        return combine_sites(self.insta_frames)
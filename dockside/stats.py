@@ -0,0 +1,206 @@
+"""Daily (and other period) statistics computed locally from NWIS data
+
+`aggregate` turns instantaneous values, as parsed by `dockside.io.read_nwis`,
+into the column layout of a daily values (``daily=True``) parse, so a
+station that already holds its 15-minute data does not need a second round
+trip to the ``dv`` service.
+"""
+
+import numpy
+import pandas as pd
+
+from .io import decode_qualifiers, encode_qualifiers, _compact_qual
+
+# NWIS statistic names (as in the "stat" level of a daily values parse) and
+# their statistic codes; "Count" has no NWIS counterpart
+STATISTICS = {
+    "Maximum": "00001",
+    "Minimum": "00002",
+    "Mean": "00003",
+    "Count": None,
+}
+
+
+def _qual_masks(quals):
+    """
+    Bitmasks (see `encode_qualifiers`) of a frame of "qual" columns in any of
+    the representations produced by `read_nwis`, with missing entries as 0
+    """
+
+    masks = numpy.zeros(quals.shape, dtype=numpy.uint32)
+    text, codes, uniques = [], [], []
+    for j, (_, col) in enumerate(quals.items()):
+        if pd.api.types.is_numeric_dtype(col):
+            masks[:, j] = col.fillna(0).to_numpy(dtype=numpy.uint32)
+        else:
+            # encode each distinct string once; missing entries get code -1
+            col_codes, col_uniques = pd.factorize(col)
+            text.append(j)
+            codes.append(numpy.where(col_codes < 0, -1, col_codes + len(uniques)))
+            uniques.extend(col_uniques)
+
+    if text:
+        lookup = numpy.append(encode_qualifiers(uniques), numpy.uint32(0))
+        masks[:, text] = lookup[numpy.column_stack(codes)]
+    return masks
+
+
+def _periods(index, freq, tz):
+    """
+    Integer period ordinals of every row, in local time
+    """
+
+    if not isinstance(index, pd.DatetimeIndex):
+        raise TypeError("`aggregate` needs a dataframe with a DatetimeIndex")
+    if index.tz is not None:
+        if tz is not None:
+            index = index.tz_convert(tz)
+        index = index.tz_localize(None)
+    elif tz is not None:
+        raise ValueError("`tz` only applies to time zone-aware data")
+    return index.to_period(freq)
+
+
+def aggregate(
+    df,
+    freq="D",
+    stats=("Mean", "Minimum", "Maximum"),
+    tz=None,
+    min_count=1,
+    qual="object",
+):
+    """Compute period statistics of instantaneous values
+
+    All time series (and all sites, after `dockside.io.combine_sites`) are
+    aggregated together in a single pass of grouped numpy reductions.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Output of `dockside.io.read_nwis` (or `combine_sites`) with
+        instantaneous values: one ("qual", "value") pair of columns per
+        time series, under a "var" column level.
+    freq : string (default is "D")
+        Length of the periods as a pandas period alias, e.g., "D" for daily,
+        "W" for weekly, or "M" for monthly values.
+    stats : sequence of strings (default is ("Mean", "Minimum", "Maximum"))
+        Statistics to compute, any of the keys of `STATISTICS`.
+    tz : string or tzinfo, optional
+        Time zone whose local days (or other periods) are used. Defaults to
+        the time zone of the index. Windows across a daylight saving time
+        change are parsed to UTC, so pass the site's time zone for those.
+    min_count : int (default is 1)
+        Minimum number of values a period needs for its statistics;
+        otherwise they are NaN. Use it to blank out partial days, e.g.,
+        ``min_count=96`` for complete days of 15-minute data.
+    qual : string (default is "object")
+        Representation of the "qual" columns, see `dockside.io.read_nwis`.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        Laid out like a daily values parse: the "stat" column level is
+        inserted before "var" and the index holds the (naive, local) start
+        of each period. The qualifiers of a period are the union of the
+        qualifiers of its values, listed in the order of
+        `dockside.io.QUALIFIER_CODES`. Periods without any values are
+        dropped. Returns None when `df` is None.
+
+    Examples
+    --------
+    >>> from dockside import Station
+    >>> from dockside.stats import aggregate
+    >>> sta = Station(14211500, '2018-01-01', '2018-06-30')
+    >>> daily = aggregate(sta.insta_data)  # doctest: +SKIP
+    >>> monthly = aggregate(
+    ...     sta.insta_data, freq="M", stats=["Mean", "Count"]
+    ... )  # doctest: +SKIP
+
+    """
+
+    if df is None:
+        return None
+
+    unknown = set(stats) - set(STATISTICS)
+    if unknown:
+        raise ValueError("unknown statistics: {}".format(", ".join(sorted(unknown))))
+
+    prefixes = df.columns.droplevel("var").unique()
+    prefixes = [p if isinstance(p, tuple) else (p,) for p in prefixes]
+    col_levels = [n for n in df.columns.names if n != "var"] + ["stat", "var"]
+
+    periods = _periods(df.index, freq, tz)
+    ordinals = periods.asi8
+    order = None
+    if not periods.is_monotonic_increasing:
+        order = numpy.argsort(ordinals, kind="stable")
+        ordinals = ordinals[order]
+
+    value_cols = df[[(*p, "value") for p in prefixes]]
+    downcast = all(dtype == numpy.float32 for dtype in value_cols.dtypes)
+    values = value_cols.to_numpy(dtype=float)
+    masks = _qual_masks(df[[(*p, "qual") for p in prefixes]])
+    if order is not None:
+        values, masks = values[order], masks[order]
+
+    if len(ordinals) == 0:
+        starts = numpy.array([], dtype=int)
+    else:
+        starts = numpy.flatnonzero(numpy.r_[True, ordinals[1:] != ordinals[:-1]])
+
+    valid = ~numpy.isnan(values)
+    if len(starts) == 0:
+        counts = numpy.zeros((0, len(prefixes)), dtype=int)
+        rolled = numpy.zeros((0, len(prefixes)), dtype=numpy.uint32)
+    else:
+        counts = numpy.add.reduceat(valid, starts, axis=0)
+        rolled = numpy.bitwise_or.reduceat(masks, starts, axis=0)
+
+    results = {}
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        for stat in stats:
+            if len(starts) == 0:
+                result = numpy.zeros(counts.shape)
+            elif stat == "Mean":
+                total = numpy.add.reduceat(
+                    numpy.where(valid, values, 0), starts, axis=0
+                )
+                result = total / counts
+            elif stat == "Minimum":
+                result = numpy.fmin.reduceat(values, starts, axis=0)
+            elif stat == "Maximum":
+                result = numpy.fmax.reduceat(values, starts, axis=0)
+            else:
+                result = counts.astype(float)
+            if stat != "Count":
+                result[counts < min_count] = numpy.nan
+            results[stat] = result
+
+    # periods without a single value or qualifier, e.g., gaps in the record
+    keep = (counts > 0).any(axis=1) | (rolled != 0).any(axis=1)
+    index = periods[order if order is not None else slice(None)][starts[keep]]
+    index = index.to_timestamp().rename("datetime")
+
+    rolled = rolled[keep]
+    empty = (counts[keep] == 0) & (rolled == 0)
+    if qual == "bitmask":
+        quals = rolled
+    else:
+        quals = numpy.array(decode_qualifiers(rolled.ravel()), dtype=object)
+        quals = quals.reshape(rolled.shape)
+        quals[empty] = None
+
+    data = {}
+    for j, prefix in enumerate(prefixes):
+        for stat in stats:
+            column = quals[:, j]
+            data[(*prefix, stat, "qual")] = (
+                column if qual == "bitmask" else _compact_qual(column, qual)
+            )
+            data[(*prefix, stat, "value")] = results[stat][keep, j].astype(
+                numpy.float32 if downcast else float
+            )
+
+    result = pd.DataFrame(data, index=index)
+    result.columns = pd.MultiIndex.from_tuples(result.columns, names=col_levels)
+    return result.sort_index(axis="columns")
@@ -0,0 +1,506 @@
+"""Memory-mapped, append-only store of NWIS time series
+
+`ArrayStore` keeps every time series of a site as three flat binary arrays:
+sorted int64 timestamps, float64 values, and uint32 qualifier bitmasks (see
+`dockside.io.encode_qualifiers`). Any window is read by binary search on the
+memory-mapped timestamps, so only the rows inside it are touched, and new
+data that follows what is stored is appended to the end of the files.
+"""
+
+import json
+import threading
+from datetime import timedelta, timezone
+from pathlib import Path
+
+import numpy
+import pandas as pd
+
+from .cache import ONE_DAY, _atomic_write, _gaps, _merge_ranges
+from .io import (
+    _compact_qual,
+    _decode,
+    _join,
+    _json_timezone,
+    _site_time,
+    decode_qualifiers,
+    fetch_nwis,
+    read_nwis,
+    read_nwis_chunked,
+)
+from .stats import _qual_masks
+
+# array name -> dtype of its file
+ARRAYS = {"time": numpy.int64, "value": numpy.float64, "qual": numpy.uint32}
+
+
+def _utc_offset(index):
+    """
+    UTC offset in minutes of a fixed-offset index, "naive" for an index
+    without time zone, or None when the offset is not fixed (e.g., UTC after
+    a daylight saving time change)
+    """
+
+    if index.tz is None:
+        return "naive"
+    if str(index.tz) == "UTC":
+        # `read_nwis` only gives UTC for data across a DST change
+        return None
+    offset = index.tz.utcoffset(None)
+    if offset is None:
+        return None
+    return int(offset.total_seconds() // 60)
+
+
+def _instant(day, offset, tz):
+    """
+    Stored nanoseconds of the wall-clock midnight starting `day`. Series in
+    UTC (`offset` is None) are converted with the site's time zone `tz`.
+    """
+
+    if offset is None:
+        return day.tz_localize(tz).value
+    shift = 0 if offset == "naive" else offset * 60 * 10**9
+    return day.value - shift
+
+
+def _load(path, dtype, rows):
+    """
+    Read-only memory map of the first `rows` items of a flat array file
+    """
+
+    if rows == 0:
+        return numpy.empty(0, dtype=dtype)
+    return numpy.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+
+def _unlink(path):
+    """
+    Removes a replaced array file. Memory maps of it that are still open stay
+    valid on POSIX, but Windows refuses to delete a mapped file; it is then
+    left for a later `ArrayStore._sweep`.
+    """
+
+    try:
+        path.unlink(missing_ok=True)
+    except PermissionError:
+        pass
+
+
+class ArrayStore(object):
+    """On-disk store of NWIS data, memory-mapped and searched by time
+
+    Each site and service (daily or instantaneous values) gets a directory
+    with a JSON manifest and one set of flat arrays per time series. Like
+    `dockside.cache.IncrementalCache`, `get` only downloads the days that
+    are not covered yet, so a `Station` created with ``cache=ArrayStore(...)``
+    reads windows straight from the store instead of requesting them from
+    NWIS or parsing a CSV file.
+
+    Parameters
+    ----------
+    root : path-like
+        Directory that holds the store. Created if needed.
+    client : dockside.Client, optional
+        Pooled HTTP client used for all downloads.
+    chunk : string or pandas.DateOffset, optional
+        Download large gaps in windows of this size, see
+        `dockside.io.read_nwis_chunked`.
+    qual : string (default is "object")
+        Representation of the "qual" columns that are read back, see
+        `dockside.io.read_nwis`. "bitmask" reads them without decoding.
+
+    Notes
+    -----
+    Data that starts after the last stored timestamp of a series is
+    appended to its files. Anything else (filling an earlier gap, or
+    re-downloading with ``force=True``) rewrites the series, with the new
+    values replacing stored values at the same timestamps.
+
+    Qualifier codes that are not in `dockside.io.QUALIFIER_CODES` are
+    stored as `dockside.io.QUALIFIER_OTHER` and are not read back.
+
+    Instantaneous values across a daylight saving time change are stored in
+    UTC. Windows are cut from them in the site's time zone, which is taken
+    from the NWIS responses (or the `tz` given to `get` or `read`) and kept
+    in the manifest. While it is unknown, `get` downloads such windows again
+    and `read` raises a ValueError.
+
+    Examples
+    --------
+    >>> from dockside import Station
+    >>> import tempfile
+    >>> from dockside.store import ArrayStore
+    >>> store = ArrayStore(tempfile.mkdtemp())
+    >>> df = store.get(14211500, '2018-01-01', '2018-06-30')  # doctest: +SKIP
+    >>> # served from the store by binary search, nothing is downloaded
+    >>> sta = Station(14211500, '2018-03-01', '2018-03-31', cache=store)
+    >>> df = sta.get_data()  # doctest: +SKIP
+
+    """
+
+    def __init__(self, root, client=None, chunk=None, qual="object"):
+        self.root = Path(root)
+        self.client = client
+        self.chunk = chunk
+        self.qual = qual
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # site -> time zone seen in its responses
+        self._zones = {}
+
+    def _lock(self, site, daily):
+        with self._locks_lock:
+            return self._locks.setdefault((str(site), daily), threading.Lock())
+
+    def site_path(self, site, daily=False):
+        """Directory of a site and service"""
+        return self.root / "{}_{}".format(site, "dv" if daily else "iv")
+
+    def manifest_path(self, site, daily=False):
+        """Path of the JSON manifest for a site and service"""
+        return self.site_path(site, daily=daily) / "manifest.json"
+
+    def _manifest(self, site, daily):
+        mpath = self.manifest_path(site, daily=daily)
+        if not mpath.exists():
+            return {
+                "site": str(site),
+                "service": "dv" if daily else "iv",
+                "utc_offset": "naive" if daily else None,
+                "unit": None,
+                "tz": None,
+                "ranges": [],
+                "series": [],
+            }
+        with mpath.open("r", encoding="utf-8") as fp:
+            return json.load(fp)
+
+    def _save_manifest(self, site, daily, manifest):
+        data = json.dumps(manifest, indent=2).encode("utf-8")
+        self.site_path(site, daily=daily).mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.manifest_path(site, daily=daily), data)
+
+    def _array_path(self, site, daily, entry, name, generation=None):
+        if generation is None:
+            generation = entry["generation"]
+        fname = "{}.{}.{}".format(entry["id"], generation, name)
+        return self.site_path(site, daily=daily) / fname
+
+    def coverage(self, site, daily=False):
+        """Date ranges already held for a site
+
+        Returns
+        -------
+        list of (pandas.Timestamp, pandas.Timestamp) tuples
+            Sorted, non-overlapping, inclusive date ranges.
+
+        """
+
+        ranges = self._manifest(site, daily)["ranges"]
+        return [(pd.Timestamp(a), pd.Timestamp(b)) for a, b in ranges]
+
+    def arrays(self, site, daily=False):
+        """Memory-mapped arrays of every stored time series
+
+        Returns
+        -------
+        dict
+            Column prefix tuple (e.g., ``("Streamflow, ft&#179;/s",)``) ->
+            dict of read-only "time" (int64 nanoseconds, UTC unless the
+            series is naive), "value", and "qual" arrays.
+
+        """
+
+        return self._arrays(site, daily, self._manifest(site, daily))
+
+    def _arrays(self, site, daily, manifest):
+        return {
+            tuple(entry["columns"]): {
+                name: _load(
+                    self._array_path(site, daily, entry, name), dtype, entry["rows"]
+                )
+                for name, dtype in ARRAYS.items()
+            }
+            for entry in manifest["series"]
+        }
+
+    def write(self, site, df, daily=False):
+        """Add the data of a dataframe to the store
+
+        Parameters
+        ----------
+        site : int or string
+            Site ID number from NWIS.
+        df : pandas.DataFrame or None
+            Output of `dockside.io.read_nwis` for the site.
+        daily : bool (default is False)
+            Daily (True) or instantaneous values (False).
+
+        """
+
+        with self._lock(site, daily):
+            manifest = self._manifest(site, daily)
+            self._write(site, daily, manifest, df)
+            self._save_manifest(site, daily, manifest)
+            self._sweep(site, daily, manifest)
+
+    def _sweep(self, site, daily, manifest):
+        """
+        Removes the files of older generations of the series in `manifest`,
+        once it is saved
+        """
+
+        current = {entry["id"]: entry["generation"] for entry in manifest["series"]}
+        directory = self.site_path(site, daily=daily)
+        if not directory.exists():
+            return
+        for path in directory.iterdir():
+            parts = path.name.split(".")
+            if len(parts) != 3 or parts[2] not in ARRAYS:
+                continue
+            sid, generation = int(parts[0]), int(parts[1])
+            if sid in current and generation < current[sid]:
+                _unlink(path)
+
+    def _write(self, site, daily, manifest, df):
+        """
+        Adds `df` to the arrays and updates `manifest` in place. Files
+        replaced by rewrites are left for `_sweep`, since they must only be
+        removed once the manifest is saved.
+        """
+
+        if df is None or len(df) == 0:
+            return
+        self.site_path(site, daily=daily).mkdir(parents=True, exist_ok=True)
+
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index(kind="stable")
+        offset = _utc_offset(df.index)
+        if not manifest["series"]:
+            manifest["utc_offset"] = offset
+        elif manifest["utc_offset"] != offset:
+            manifest["utc_offset"] = None
+        manifest["unit"] = df.index.unit
+        times = df.index.as_unit("ns").asi8
+
+        entries = {tuple(e["columns"]): e for e in manifest["series"]}
+        prefixes = df.columns.droplevel("var").unique()
+        for prefix in [p if isinstance(p, tuple) else (p,) for p in prefixes]:
+            values = df[(*prefix, "value")].to_numpy(dtype=float)
+            quals = _qual_masks(df[[(*prefix, "qual")]])[:, 0]
+            # rows that only exist for other series of the same response
+            keep = ~numpy.isnan(values) | (quals != 0)
+            new = {"time": times[keep], "value": values[keep], "qual": quals[keep]}
+            if len(new["time"]) == 0:
+                continue
+
+            entry = entries.get(prefix)
+            if entry is None:
+                entry = {
+                    "columns": list(prefix),
+                    "id": len(manifest["series"]),
+                    "generation": 0,
+                    "rows": 0,
+                }
+                manifest["series"].append(entry)
+                entries[prefix] = entry
+            self._write_series(site, daily, entry, new)
+
+    def _write_series(self, site, daily, entry, new):
+        rows = entry["rows"]
+        old = {
+            name: _load(self._array_path(site, daily, entry, name), dtype, rows)
+            for name, dtype in ARRAYS.items()
+        }
+
+        if rows == 0 or new["time"][0] > old["time"][-1]:
+            # append-only path; bytes past `rows` are left over from an
+            # append that never made it to the manifest
+            for name, dtype in ARRAYS.items():
+                path = self._array_path(site, daily, entry, name)
+                with path.open("ab") as fp:
+                    fp.truncate(rows * numpy.dtype(dtype).itemsize)
+                    fp.write(numpy.ascontiguousarray(new[name], dtype=dtype).tobytes())
+            entry["rows"] = rows + len(new["time"])
+            return
+
+        # merge, keeping the new value for timestamps that are in both
+        times = numpy.concatenate([old["time"], new["time"]])
+        order = numpy.argsort(times, kind="stable")
+        times = times[order]
+        last = numpy.r_[times[1:] != times[:-1], True]
+        generation = entry["generation"] + 1
+        for name, dtype in ARRAYS.items():
+            merged = numpy.concatenate([old[name], new[name]])[order][last]
+            path = self._array_path(site, daily, entry, name, generation)
+            _atomic_write(path, numpy.ascontiguousarray(merged, dtype=dtype).tobytes())
+
+        entry["generation"] = generation
+        entry["rows"] = int(last.sum())
+
+    def read(self, site, start=None, end=None, daily=False, tz=None):
+        """Stored data for a site, without downloading anything
+
+        Parameters
+        ----------
+        site : int or string
+            Site ID number from NWIS.
+        start, end : string or date-like, optional
+            Inclusive start and end dates of the window, compared in the
+            wall-clock time of the data. Defaults to everything stored.
+        daily : bool (default is False)
+            Daily (True) or instantaneous values (False).
+        tz : string, optional
+            IANA time zone of the site, used when the manifest does not
+            record one, see the notes.
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            Laid out like the output of `dockside.io.read_nwis`. None if
+            nothing is stored within the window.
+
+        Raises
+        ------
+        ValueError
+            A window of data stored in UTC was requested, and the time zone
+            of the site is unknown.
+
+        """
+
+        manifest = self._manifest(site, daily)
+        offset = manifest["utc_offset"]
+        tz = tz or manifest.get("tz")
+        windowed = start is not None or end is not None
+        if offset is None and tz is None and windowed and manifest["series"]:
+            raise ValueError(
+                "the data of site {} spans a daylight saving time change; "
+                "pass its `tz` to read a window of it".format(site)
+            )
+        if offset == "naive":
+            index_tz = None
+        elif offset is None:
+            index_tz = "UTC"
+        else:
+            index_tz = timezone(timedelta(minutes=offset))
+        # stores written before the unit was recorded held `read_nwis` output
+        unit = manifest.get("unit") or "us"
+
+        # wall-clock bounds -> stored (UTC) nanoseconds
+        lo = hi = None
+        if start is not None:
+            lo = _instant(pd.Timestamp(start).normalize(), offset, tz)
+        if end is not None:
+            hi = _instant(pd.Timestamp(end).normalize() + ONE_DAY, offset, tz)
+
+        if daily:
+            col_levels = ["param", "stat", "var"]
+        else:
+            col_levels = ["param", "var"]
+
+        frames = []
+        for prefix, arrays in self._arrays(site, daily, manifest).items():
+            times = arrays["time"]
+            i, j = 0, len(times)
+            if lo is not None:
+                i = numpy.searchsorted(times, lo, side="left")
+            if hi is not None:
+                j = numpy.searchsorted(times, hi, side="left")
+            if i >= j:
+                continue
+
+            index = pd.DatetimeIndex(times[i:j].view("M8[ns]"), name="datetime")
+            index = index.as_unit(unit)
+            if index_tz is not None:
+                index = index.tz_localize("UTC").tz_convert(index_tz)
+            masks = arrays["qual"][i:j]
+            if self.qual == "bitmask":
+                quals = masks
+            else:
+                quals = _compact_qual(decode_qualifiers(masks), self.qual)
+
+            df = pd.DataFrame(
+                {"qual": quals, "value": arrays["value"][i:j]}, index=index, copy=False
+            )
+            columns = pd.MultiIndex.from_tuples(
+                [(*prefix, "qual"), (*prefix, "value")], names=col_levels
+            )
+            frames.append(df.set_axis(columns, axis="columns"))
+
+        if len(frames) == 1:
+            # nothing to align, keeps the values a view of the memory map
+            df = frames[0]
+        else:
+            df = _join(frames)
+        if offset is None and tz is not None and df is not None:
+            # the way a fresh download of the window is indexed
+            df = _site_time(df, tz)
+        return df
+
+    def _download(self, site, start, end, daily):
+        if self.chunk is not None:
+            return read_nwis_chunked(
+                site, start, end, daily=daily, chunk=self.chunk, client=self.client
+            )
+        r = fetch_nwis(site, start, end, daily=daily, client=self.client)
+        r.raise_for_status()
+        site_json = _decode(r)
+        zone = _json_timezone(site_json)
+        if zone is not None:
+            self._zones[str(site)] = zone
+        return read_nwis(site_json, daily=daily)
+
+    def get(self, site, start, end, daily=False, force=False, tz=None):
+        """Data for a site and window, downloading only the missing days
+
+        Parameters
+        ----------
+        site : int or string
+            Site ID number from NWIS.
+        start, end : string or date-like
+            Inclusive start and end dates of the window.
+        daily : bool (default is False)
+            Daily (True) or instantaneous values (False).
+        force : bool (default is False)
+            Redownload the whole window even if it is already covered.
+        tz : string, optional
+            IANA time zone of the site (e.g., "America/Los_Angeles"). Only
+            needed when the NWIS responses do not tell, see the notes.
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            None if NWIS has no data for the window.
+
+        """
+
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+
+        with self._lock(site, daily):
+            manifest = self._manifest(site, daily)
+            ranges = [(pd.Timestamp(a), pd.Timestamp(b)) for a, b in manifest["ranges"]]
+            gaps = [(start, end)] if force else _gaps(ranges, start, end)
+            fetched = []
+            if gaps:
+                for a, b in gaps:
+                    fetched.append(self._download(site, a, b, daily))
+                    self._write(site, daily, manifest, fetched[-1])
+
+                today = pd.Timestamp.now().normalize()
+                done = [(a, min(b, today - ONE_DAY)) for a, b in gaps if a < today]
+                manifest["ranges"] = [
+                    [a.strftime("%Y-%m-%d"), b.strftime("%Y-%m-%d")]
+                    for a, b in _merge_ranges([*ranges, *done])
+                ]
+                manifest["tz"] = tz or self._zones.get(str(site)) or manifest.get("tz")
+                self._save_manifest(site, daily, manifest)
+                self._sweep(site, daily, manifest)
+
+            tz = tz or manifest.get("tz")
+            if manifest["utc_offset"] is None and tz is None and manifest["series"]:
+                # the wall-clock time of the stored UTC data is unknown
+                if gaps == [(start, end)]:
+                    return fetched[0]
+                return self._download(site, start, end, daily)
+            return self.read(site, start, end, daily=daily, tz=tz)
@@ -1,7 +1,6 @@
-from pkg_resources import resource_filename
 import warnings
+from pathlib import Path
 
-import dockside
 from .util import requires
 
 try:
@@ -12,7 +11,7 @@ except ImportError:
 
 @requires(pytest, "pytest")
 def test(*args):
-    options = [resource_filename("dockside", "")]
+    options = [str(Path(__file__).parents[1])]
     options.extend(list(args))
     return pytest.main(options)
 
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from dockside import aio
+from dockside.cache import ResponseCache
+from .util import FakeNWIS
+
+pytest.importorskip("aiohttp")
+
+
+def _site_body(path):
+    site = parse_qs(urlsplit(path).query)["sites"][0]
+    return json.dumps(
+        {
+            "value": {
+                "timeSeries": [
+                    {
+                        "variable": {"variableName": "Flow " + site},
+                        "values": [
+                            {
+                                "value": [
+                                    {
+                                        "value": "1.5",
+                                        "qualifiers": ["A"],
+                                        "dateTime": "2018-01-01T00:00:00.000-08:00",
+                                    }
+                                ]
+                            }
+                        ],
+                    }
+                ]
+            }
+        }
+    )
+
+
+@pytest.fixture
+def server():
+    with FakeNWIS(default=(200, _site_body, None)) as srv:
+        yield srv
+
+
+def _client(server, **kwargs):
+    return aio.AsyncClient(base_url=server.url, backoff=0.01, **kwargs)
+
+
+def test_fetch_nwis_async(server):
+    async def main():
+        async with _client(server) as client:
+            return await aio.fetch_nwis_async(
+                14211500, "2018-01-01", "2018-01-31", daily=True, client=client
+            )
+
+    r = asyncio.run(main())
+    assert r.status_code == 200
+    assert "Flow 14211500" in r.text
+    path, query = server.requests[0].split("?")
+    assert path == "/dv"
+    assert parse_qs(query) == {
+        "format": ["json"],
+        "sites": ["14211500"],
+        "startDT": ["2018-01-01"],
+        "endDT": ["2018-01-31"],
+    }
+
+
+def test_async_client_retries(server):
+    server.responses = [(503, b"", None), (429, b"", {"Retry-After": "0"})]
+
+    async def main():
+        async with _client(server) as client:
+            return await aio.read_nwis_async(
+                "01", "2018-01-01", "2018-01-01", client=client
+            )
+
+    df = asyncio.run(main())
+    assert len(server.requests) == 3
+    assert df.columns.tolist() == [("Flow 01", "qual"), ("Flow 01", "value")]
+
+
+def test_async_client_limit():
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def slow_body(path):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.05)
+        with lock:
+            state["active"] -= 1
+        return _site_body(path)
+
+    sites = ["{:02d}".format(i) for i in range(12)]
+    with FakeNWIS(default=(200, slow_body, None)) as server:
+
+        async def main():
+            async with _client(server, limit=3) as client:
+                return await aio.fetch_many_async(
+                    sites, "2018-01-01", "2018-01-01", client=client
+                )
+
+        data, errors = asyncio.run(main())
+
+    assert errors == {}
+    assert list(data) == sites
+    assert 1 < state["peak"] <= 3
+
+
+def test_fetch_many_async_errors(server):
+    def body(path):
+        if "sites=bad" in path:
+            raise ValueError  # drops the connection
+        return _site_body(path)
+
+    server.default = (200, body, None)
+
+    async def main():
+        async with _client(server, retries=0) as client:
+            return await aio.fetch_many_async(
+                ["01", "bad", "02"], "2018-01-01", "2018-01-01", client=client
+            )
+
+    data, errors = asyncio.run(main())
+    assert list(data) == ["01", "02"]
+    assert list(errors) == ["bad"]
+
+
+def test_fetch_many_async_cancel():
+    def slow_body(path):
+        time.sleep(0.5)
+        return _site_body(path)
+
+    with FakeNWIS(default=(200, slow_body, None)) as server:
+
+        async def main():
+            async with _client(server) as client:
+                task = asyncio.ensure_future(
+                    aio.fetch_many_async(
+                        ["01", "02", "03"], "2018-01-01", "2018-01-01", client=client
+                    )
+                )
+                await asyncio.sleep(0.1)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+                return asyncio.all_tasks()
+
+        started = time.perf_counter()
+        remaining = asyncio.run(main())
+        assert time.perf_counter() - started < 0.4
+        assert len(remaining) == 1  # just main()
+
+
+def test_async_station(server):
+    async def main():
+        async with _client(server) as client:
+            station = aio.AsyncStation("01", "2018-01-01", "2018-01-01", client=client)
+            first, second = await asyncio.gather(station.insta_data, station.insta_data)
+            assert first is second
+            return await station.insta_data
+
+    df = asyncio.run(main())
+    assert df is not None
+    assert len(server.requests) == 1
+
+
+def test_async_station_get_data(server, tmp_path):
+    async def main():
+        async with _client(server) as client:
+            station = aio.AsyncStation(
+                "01", "2018-01-01", "2018-01-01", savepath=tmp_path, client=client
+            )
+            await station.get_data(save=True)
+            return await station.get_data()
+
+    df = asyncio.run(main())
+    assert df.columns.tolist() == [("Flow 01", "qual"), ("Flow 01", "value")]
+    assert len(server.requests) == 1
+
+
+def test_async_client_cache_off_loop(server, tmp_path):
+    threads = []
+
+    class Recording(ResponseCache):
+        def get(self, url, params=None):
+            threads.append(threading.current_thread())
+            return super().get(url, params)
+
+        def put(self, url, params, response):
+            threads.append(threading.current_thread())
+            return super().put(url, params, response)
+
+    cache = Recording(tmp_path / "responses")
+
+    async def main():
+        async with _client(server, cache=cache) as client:
+            for _ in range(2):
+                r = await aio.fetch_nwis_async(
+                    "01", "2018-01-01", "2018-01-01", client=client
+                )
+            return r
+
+    r = asyncio.run(main())
+    assert "Flow 01" in r.text
+    assert len(server.requests) == 1
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+
+
+def test_parsing_runs_off_loop(server):
+    threads = []
+    real = aio.read_nwis
+
+    def recording(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return real(*args, **kwargs)
+
+    async def main():
+        async with _client(server) as client:
+            df = await aio.read_nwis_async(
+                "01", "2018-01-01", "2018-01-01", client=client
+            )
+            station = aio.AsyncStation("02", "2018-01-01", "2018-01-01", client=client)
+            return df, await station.insta_data
+
+    with mock.patch.object(aio, "read_nwis", side_effect=recording):
+        first, second = asyncio.run(main())
+    assert first is not None and second is not None
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_async_client_requires_aiohttp():
+    with mock.patch.object(aio, "aiohttp", None):
+        with pytest.raises(RuntimeError):
+            aio.AsyncClient()
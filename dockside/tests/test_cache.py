@@ -0,0 +1,524 @@
+import os
+from unittest import mock
+
+import numpy
+import pandas
+from pandas import Timestamp
+import pytest
+import requests
+import pandas.testing as pdtest
+
+from dockside import cache, nwis
+
+
+def _frame(start, end, freq="D"):
+    index = pandas.date_range(start, end, freq=freq, name="datetime")
+    columns = pandas.MultiIndex.from_tuples(
+        [("Flow", "Mean", "qual"), ("Flow", "Mean", "value")],
+        names=["param", "stat", "var"],
+    )
+    data = {columns[0]: "A", columns[1]: numpy.arange(len(index), dtype=float)}
+    return pandas.DataFrame(data, index=index, columns=columns)
+
+
+def _ranges(*pairs):
+    return [(Timestamp(a), Timestamp(b)) for a, b in pairs]
+
+
+@pytest.mark.parametrize(
+    ("ranges", "expected"),
+    [
+        ([], []),
+        (
+            [("2018-01-01", "2018-01-10"), ("2018-01-11", "2018-01-20")],
+            [("2018-01-01", "2018-01-20")],
+        ),
+        (
+            [("2018-02-01", "2018-02-10"), ("2018-01-01", "2018-02-05")],
+            [("2018-01-01", "2018-02-10")],
+        ),
+        (
+            [("2018-01-01", "2018-01-10"), ("2018-01-12", "2018-01-20")],
+            [("2018-01-01", "2018-01-10"), ("2018-01-12", "2018-01-20")],
+        ),
+    ],
+)
+def test__merge_ranges(ranges, expected):
+    assert cache._merge_ranges(_ranges(*ranges)) == _ranges(*expected)
+
+
+@pytest.mark.parametrize(
+    ("ranges", "start", "end", "expected"),
+    [
+        ([], "2018-01-01", "2018-01-31", [("2018-01-01", "2018-01-31")]),
+        ([("2018-01-01", "2018-01-31")], "2018-01-05", "2018-01-10", []),
+        (
+            [("2018-01-01", "2018-01-31")],
+            "2018-01-01",
+            "2018-02-01",
+            [("2018-02-01", "2018-02-01")],
+        ),
+        (
+            [("2018-01-05", "2018-01-10"), ("2018-01-20", "2018-01-25")],
+            "2018-01-01",
+            "2018-01-31",
+            [
+                ("2018-01-01", "2018-01-04"),
+                ("2018-01-11", "2018-01-19"),
+                ("2018-01-26", "2018-01-31"),
+            ],
+        ),
+    ],
+)
+def test__gaps(ranges, start, end, expected):
+    result = cache._gaps(_ranges(*ranges), Timestamp(start), Timestamp(end))
+    assert result == _ranges(*expected)
+
+
+def test__slice_dates_uses_wall_clock():
+    df = _frame("2018-01-01 22:00", "2018-01-03 02:00", freq="h").tz_localize(
+        "Etc/GMT+5"
+    )
+    result = cache._slice_dates(df, Timestamp("2018-01-02"), Timestamp("2018-01-02"))
+    assert len(result) == 24
+    assert result.index[0].hour == 0
+
+
+def _dst_frame(start, end):
+    # hourly data for whole local days, in UTC like a window across a DST change
+    index = pandas.date_range(
+        Timestamp(start),
+        Timestamp(end) + pandas.Timedelta(hours=23),
+        freq="h",
+        tz="America/Los_Angeles",
+        name="datetime",
+    )
+    df = _frame(index[0], index[-1], freq="h")
+    return df.set_axis(index, axis="index").tz_convert("UTC")
+
+
+def test__slice_dates_across_dst():
+    df = _dst_frame("2018-03-10", "2018-03-12")
+    day = Timestamp("2018-03-12")
+    assert cache._slice_dates(df, day, day) is None
+
+    result = cache._slice_dates(df, day, day, tz="America/Los_Angeles")
+    assert len(result) == 24
+    assert result.index[0] == Timestamp("2018-03-12", tz="-07:00")
+    assert str(result.index.tz) == "UTC-07:00"
+
+    change = Timestamp("2018-03-11")
+    result = cache._slice_dates(df, change, change, tz="America/Los_Angeles")
+    assert len(result) == 23
+    assert str(result.index.tz) == "UTC"
+
+
+@pytest.fixture
+def store(tmp_path):
+    pytest.importorskip("pyarrow")
+    return cache.IncrementalCache(tmp_path / "store")
+
+
+@pytest.fixture
+def downloader():
+    def fake(site, start, end, daily):
+        return _frame(start, end)
+
+    return fake
+
+
+def test_incremental_cache_fetches_only_gaps(store, downloader):
+    with mock.patch.object(store, "_download", side_effect=downloader) as download:
+        first = store.get("A", "2018-01-01", "2018-01-31", daily=True)
+        again = store.get("A", "2018-01-10", "2018-01-20", daily=True)
+        extended = store.get("A", "2018-01-01", "2018-02-01", daily=True)
+
+    assert download.call_args_list == [
+        mock.call("A", Timestamp("2018-01-01"), Timestamp("2018-01-31"), True),
+        mock.call("A", Timestamp("2018-02-01"), Timestamp("2018-02-01"), True),
+    ]
+    assert len(first) == 31
+    pdtest.assert_frame_equal(
+        again, first.loc["2018-01-10":"2018-01-20"], check_freq=False
+    )
+    assert len(extended) == 32
+    assert extended.index.is_monotonic_increasing
+    assert store.coverage("A", daily=True) == _ranges(("2018-01-01", "2018-02-01"))
+    assert store.coverage("A", daily=False) == []
+
+
+def test_incremental_cache_force(store, downloader):
+    with mock.patch.object(store, "_download", side_effect=downloader) as download:
+        store.get("A", "2018-01-01", "2018-01-31", daily=True)
+        store.get("A", "2018-01-05", "2018-01-06", daily=True, force=True)
+
+    assert download.call_count == 2
+    assert store.coverage("A", daily=True) == _ranges(("2018-01-01", "2018-01-31"))
+
+
+def test_incremental_cache_does_not_cover_today(store, downloader):
+    today = Timestamp.now().normalize()
+    with mock.patch.object(store, "_download", side_effect=downloader) as download:
+        store.get("A", today - pandas.Timedelta(days=3), today, daily=True)
+        store.get("A", today - pandas.Timedelta(days=3), today, daily=True)
+
+    assert download.call_count == 2
+    assert download.call_args_list[1].args[1:3] == (today, today)
+
+
+def test_incremental_cache_across_dst(store):
+    def fake(site, start, end, daily):
+        return _dst_frame(start, end)
+
+    with mock.patch.object(store, "_download", side_effect=fake) as download:
+        store.get("A", "2018-03-01", "2018-03-31")
+        # the time zone is unknown, so the window is downloaded again
+        store.get("A", "2018-03-12", "2018-03-12")
+        assert download.call_count == 2
+
+        store.get("A", "2018-04-01", "2018-04-02", tz="America/Los_Angeles")
+        result = store.get("A", "2018-03-12", "2018-03-12")
+        assert download.call_count == 3
+
+    assert len(result) == 24
+    assert result.index[0] == Timestamp("2018-03-12", tz="-07:00")
+
+
+def test_incremental_cache_no_data(store):
+    with mock.patch.object(store, "_download", return_value=None) as download:
+        assert store.get("A", "2018-01-01", "2018-01-31") is None
+        assert store.get("A", "2018-01-01", "2018-01-31") is None
+    download.assert_called_once()
+    assert not store.data_path("A").exists()
+
+
+def test_incremental_cache_csv(tmp_path, downloader):
+    store = cache.IncrementalCache(tmp_path, fmt="csv")
+    with mock.patch.object(store, "_download", side_effect=downloader):
+        store.get("A", "2018-01-01", "2018-01-31", daily=True)
+        result = store.get("A", "2018-01-01", "2018-02-10", daily=True)
+    assert store.data_path("A", daily=True).suffix == ".csv"
+    assert len(result) == 41
+
+
+def test_station_get_data_uses_cache():
+    store = mock.Mock(spec=cache.IncrementalCache)
+    station = nwis.Station("A", "2018-01-01", "2018-01-31", cache=store)
+    assert station.get_data(daily=True, force=True) is store.get.return_value
+    store.get.assert_called_once_with(
+        "A", station.start, station.end, daily=True, force=True, tz=None
+    )
+
+
+@pytest.fixture
+def responses(tmp_path):
+    return cache.ResponseCache(tmp_path / "responses", ttl=60, recent_days=7)
+
+
+def _response(body=b'{"value": {}}', status=200):
+    r = requests.Response()
+    r.status_code = status
+    r.url = "https://example.com/iv?sites=A"
+    r.headers["Content-Type"] = "application/json"
+    r._content = body
+    return r
+
+
+@pytest.mark.parametrize(
+    ("a", "b"),
+    [
+        ({"sites": "A,B", "startDT": "x"}, {"startDT": "x", "sites": "B,A"}),
+        ({"sites": ["B", "A"]}, {"sites": "A,B"}),
+        ({"sites": 14211500}, {"sites": "14211500"}),
+    ],
+)
+def test_response_cache_key_normalizes(a, b):
+    assert cache.ResponseCache.key("u", a) == cache.ResponseCache.key("u", b)
+
+
+def test_response_cache_key_differs():
+    key = cache.ResponseCache.key
+    assert key("u", {"sites": "A"}) != key("u", {"sites": "B"})
+    assert key("u/iv", {"sites": "A"}) != key("u/dv", {"sites": "A"})
+    assert key("u", {"sites": "A"}) != key("u", {"sites": "A", "parameterCd": "00060"})
+
+
+def test_response_cache_roundtrip(responses):
+    params = {"sites": "A", "endDT": "2018-01-31"}
+    assert responses.get("u", params) is None
+    responses.put("u", params, _response(b'{"a": 1}'))
+    hit = responses.get("u", params)
+
+    assert hit.from_cache
+    assert hit.status_code == 200
+    assert hit.json() == {"a": 1}
+    assert hit.headers["content-type"] == "application/json"
+    assert list(hit.iter_content(1)) == [bytes([c]) for c in b'{"a": 1}']
+    assert (responses.hits, responses.misses) == (1, 1)
+
+
+def test_response_cache_hit_streams(responses):
+    params = {"sites": "A", "endDT": "2018-01-31"}
+    responses.put("u", params, _response(b'{"a": 1}\n{"b": 2}'))
+    hit = responses.get("u", params)
+    assert b"".join(hit.iter_content(4)) == b'{"a": 1}\n{"b": 2}'
+    assert list(responses.get("u", params).iter_lines()) == [b'{"a": 1}', b'{"b": 2}']
+
+
+def test_response_cache_skips_errors(responses):
+    responses.put("u", {"sites": "A"}, _response(status=500))
+    assert responses.get("u", {"sites": "A"}) is None
+
+
+def test_response_cache_ttl(responses):
+    recent = {"sites": "A", "endDT": Timestamp.now().strftime("%Y-%m-%d")}
+    historical = {"sites": "A", "endDT": "2018-01-31"}
+    responses.put("u", recent, _response())
+    responses.put("u", historical, _response())
+
+    with mock.patch.object(cache.time, "time", return_value=cache.time.time() + 61):
+        assert responses.get("u", recent) is None
+        assert responses.get("u", historical) is not None
+
+
+def test_response_cache_lru_eviction(responses):
+    for n, site in enumerate("ABC"):
+        responses.put("u", {"sites": site}, _response(b"x" * 100))
+        # distinct mtimes without sleeping
+        body, _ = responses._paths(responses.key("u", {"sites": site}))
+        os.utime(body, (1000 + n, 1000 + n))
+
+    # touch A so that B becomes the least recently used
+    body, _ = responses._paths(responses.key("u", {"sites": "A"}))
+    os.utime(body, (2000, 2000))
+    size = body.stat().st_size
+    responses.max_bytes = int(size * 2.5)
+    responses.evict()
+
+    assert responses.size() == 2 * size
+    assert responses.get("u", {"sites": "A"}) is not None
+    assert responses.get("u", {"sites": "B"}) is None
+    assert responses.get("u", {"sites": "C"}) is not None
+
+
+def test_response_cache_evicts_only_when_full(responses):
+    responses.compress = False
+    responses.max_bytes = 1000
+    with mock.patch.object(responses, "evict", wraps=responses.evict) as evict:
+        for n in range(9):
+            responses.put("u", {"sites": str(n)}, _response(b"x" * 100))
+        # replacing an entry does not grow the cache
+        responses.put("u", {"sites": "0"}, _response(b"x" * 100))
+        evict.assert_not_called()
+
+        responses.put("u", {"sites": "9"}, _response(b"x" * 101))
+        evict.assert_called_once()
+    assert responses.size() <= 900
+
+
+def test_response_cache_skips_unread_streams(responses):
+    from dockside.client import Client
+    from .util import FakeNWIS
+
+    with FakeNWIS(default=(200, b"x" * 100, None)) as server:
+        with Client(base_url=server.url, cache=responses) as client:
+            r = client.get(server.url + "/iv", {"sites": "A"}, stream=True)
+            assert r.raw.read() == b"x" * 100
+
+        unread = requests.get(server.url + "/iv", stream=True)
+        responses.put(server.url + "/iv", {"sites": "B"}, unread)
+        unread.close()
+    assert responses.size() == 0
+
+
+def test_response_cache_compression(responses):
+    body = b'{"value": {"timeSeries": []}}' * 100
+    responses.put("u", {"sites": "A"}, _response(body))
+    stored, _ = responses._paths(responses.key("u", {"sites": "A"}))
+    assert stored.read_bytes()[:2] == b"\x1f\x8b"
+    assert stored.stat().st_size < len(body) / 10
+    assert responses.get("u", {"sites": "A"}).content == body
+
+    # entries written without compression are still served
+    responses.compress = False
+    responses.put("u", {"sites": "B"}, _response(body))
+    stored, _ = responses._paths(responses.key("u", {"sites": "B"}))
+    assert stored.read_bytes() == body
+    assert responses.get("u", {"sites": "B"}).content == body
+
+
+def test_response_cache_clear(responses):
+    responses.put("u", {"sites": "A"}, _response())
+    responses.clear()
+    assert responses.size() == 0
+
+
+def test_client_uses_response_cache(responses):
+    from dockside.client import Client
+    from dockside.io import fetch_nwis
+    from .util import FakeNWIS
+
+    with FakeNWIS(default=(200, b'{"value": {"timeSeries": []}}', None)) as server:
+        with Client(base_url=server.url, cache=responses) as client:
+            r1 = fetch_nwis("A", "2018-01-01", "2018-01-31", client=client)
+            r2 = fetch_nwis("A", "2018-01-01", "2018-01-31", client=client)
+            r3 = fetch_nwis("B", "2018-01-01", "2018-01-31", client=client)
+
+    assert len(server.requests) == 2
+    assert not getattr(r1, "from_cache", False)
+    assert r2.from_cache
+    assert r2.json() == r1.json()
+    assert r2.url == r1.url
+    assert not getattr(r3, "from_cache", False)
+
+
+def test_frame_cache_superset_slicing():
+    frames = cache.FrameCache()
+    year = _frame("2018-01-01", "2018-12-31")
+    frames.put("A", "2018-01-01", "2018-12-31", True, year)
+
+    # a copy, so callers cannot change the cached frame
+    whole = frames.get("A", "2018-01-01", "2018-12-31", daily=True)
+    pdtest.assert_frame_equal(whole, year)
+    assert whole is not year
+    whole.iloc[0, 1] = -1
+    assert frames.get("A", "2018-01-01", "2018-01-01", daily=True).iloc[0, 1] == 0
+    june = frames.get("A", "2018-06-01", "2018-06-30", daily=True)
+    pdtest.assert_frame_equal(june, year.loc["2018-06-01":"2018-06-30"])
+
+    assert frames.get("A", "2017-12-31", "2018-01-31", daily=True) is None
+    assert frames.get("A", "2018-06-01", "2018-06-30", daily=False) is None
+    assert frames.get("B", "2018-06-01", "2018-06-30", daily=True) is None
+    assert (frames.hits, frames.misses) == (3, 3)
+
+
+def test_frame_cache_lru_by_bytes():
+    frame = _frame("2018-01-01", "2018-01-31")
+    nbytes = int(frame.memory_usage(deep=True).sum())
+    frames = cache.FrameCache(max_bytes=int(nbytes * 2.5))
+    for site in "ABC":
+        frames.put(site, "2018-01-01", "2018-01-31", True, frame)
+        if site == "B":
+            frames.get("A", "2018-01-01", "2018-01-31", daily=True)
+
+    assert len(frames) == 2
+    assert frames.nbytes == 2 * nbytes
+    assert frames.get("B", "2018-01-01", "2018-01-31", daily=True) is None
+    assert frames.get("A", "2018-01-01", "2018-01-31", daily=True) is not None
+
+    frames.put("D", "2018-01-01", "2018-01-31", True, pandas.concat([frame] * 3))
+    frames.put("E", "2018-01-01", "2018-01-31", True, None)
+    assert frames.get("D", "2018-01-01", "2018-01-31", daily=True) is None
+    assert frames.get("E", "2018-01-01", "2018-01-31", daily=True) is None
+
+
+def test_frame_cache_replaces_subwindows_and_expires_recent():
+    frames = cache.FrameCache(ttl=60)
+    frames.put(
+        "A", "2018-01-01", "2018-01-31", True, _frame("2018-01-01", "2018-01-31")
+    )
+    frames.put(
+        "A", "2018-01-01", "2018-12-31", True, _frame("2018-01-01", "2018-12-31")
+    )
+    assert len(frames) == 1
+
+    today = Timestamp.now().normalize()
+    frames.put("A", today, today, False, _frame(today, today, freq="15min"))
+    assert frames.get("A", today, today) is not None
+    with mock.patch.object(cache.time, "time", return_value=cache.time.time() + 61):
+        assert frames.get("A", today, today) is None
+    assert len(frames) == 1
+
+    frames.clear()
+    assert (len(frames), frames.nbytes, frames.hits, frames.misses) == (0, 0, 0, 0)
+
+
+def test_frame_cache_across_dst():
+    frames = cache.FrameCache()
+    df = _dst_frame("2018-03-10", "2018-03-12")
+    frames.put("A", "2018-03-10", "2018-03-12", False, df)
+    pdtest.assert_frame_equal(frames.get("A", "2018-03-10", "2018-03-12"), df)
+
+    # UTC data cannot be cut to a smaller window without the site's time zone
+    assert frames.get("A", "2018-03-12", "2018-03-12") is None
+    assert (frames.hits, frames.misses) == (1, 1)
+    day = frames.get("A", "2018-03-12", "2018-03-12", tz="America/Los_Angeles")
+    assert len(day) == 24
+    assert str(day.index.tz) == "UTC-07:00"
+
+    frames.put("B", "2018-03-10", "2018-03-12", False, df, tz="America/Los_Angeles")
+    assert len(frames.get("B", "2018-03-11", "2018-03-11")) == 23
+
+
+@mock.patch.object(nwis, "read_nwis")
+@mock.patch.object(nwis, "fetch_nwis")
+def test_stations_share_frame_cache_across_dst(fetch, read):
+    info = {
+        "defaultTimeZone": {"zoneOffset": "-08:00"},
+        "siteUsesDaylightSavingsTime": True,
+    }
+    fetch.return_value.json.return_value = {
+        "value": {"timeSeries": [{"sourceInfo": {"timeZoneInfo": info}}]}
+    }
+    read.return_value = _dst_frame("2018-03-10", "2018-03-12")
+    frames = cache.FrameCache()
+
+    whole = nwis.Station("A", "2018-03-10", "2018-03-12", frame_cache=frames)
+    whole.insta_data
+    day = nwis.Station("A", "2018-03-12", "2018-03-12", frame_cache=frames)
+    assert len(day.insta_data) == 24
+    assert fetch.call_count == 1
+
+    # a station that is told the time zone can use frames stored without one
+    frames.clear()
+    day = nwis.Station(
+        "A", "2018-03-11", "2018-03-11", frame_cache=frames, tz="America/Los_Angeles"
+    )
+    key = day._frame_key(daily=False)
+    frames.put(key, "2018-03-10", "2018-03-12", False, read.return_value)
+    assert len(day.insta_data) == 23
+    assert fetch.call_count == 1
+
+
+@mock.patch.object(nwis, "read_nwis")
+@mock.patch.object(nwis, "fetch_nwis")
+def test_stations_share_frame_cache(fetch, read):
+    read.return_value = _frame("2018-01-01", "2018-12-31")
+    frames = cache.FrameCache()
+
+    def station(start, end, frame_cache=frames):
+        return nwis.Station("A", start, end, frame_cache=frame_cache)
+
+    year = station("2018-01-01", "2018-12-31").daily_data
+    june = station("2018-06-01", "2018-06-30").daily_data
+    assert fetch.call_count == 1
+    pdtest.assert_frame_equal(june, year.loc["2018-06-01":"2018-06-30"])
+
+    # each station gets its own frame
+    june.iloc[0, 1] = -1
+    again = station("2018-06-01", "2018-06-30").daily_data
+    assert again.iloc[0, 1] == year.iloc[151, 1] != -1
+    assert fetch.call_count == 1
+
+    station("2018-06-01", "2018-06-30", frame_cache=False).daily_data
+    assert fetch.call_count == 2
+    # sharing is opt-in
+    assert nwis.Station("A", "2018-01-01", "2018-01-02").frame_cache is None
+
+
+@mock.patch.object(nwis, "read_nwis")
+@mock.patch.object(nwis, "fetch_nwis")
+def test_frame_cache_keyed_by_server(fetch, read):
+    from dockside.client import Client
+
+    read.return_value = _frame("2018-01-01", "2018-01-31")
+    frames = cache.FrameCache()
+    usgs = nwis.Station("A", "2018-01-01", "2018-01-31", frame_cache=frames)
+    usgs.daily_data
+    with Client(base_url="http://mirror.example/nwis") as client:
+        mirror = nwis.Station(
+            "A", "2018-01-01", "2018-01-31", frame_cache=frames, client=client
+        )
+        mirror.daily_data
+    assert fetch.call_count == 2
+    assert len(frames) == 2
@@ -0,0 +1,218 @@
+import os
+import time
+from unittest import mock
+
+import numpy
+import pandas
+import pytest
+
+from dockside import nwis
+from dockside.catalog import Catalog, get_catalog
+
+
+def _touch(path, nbytes=10):
+    path.write_bytes(b"x" * nbytes)
+    return path
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return Catalog(tmp_path / "catalog.sqlite")
+
+
+def test_find_smallest_covering(catalog, tmp_path):
+    year = _touch(tmp_path / "year.csv")
+    half = _touch(tmp_path / "half.csv")
+    catalog.add(year, "A", "2018-01-01", "2018-12-31")
+    catalog.add(half, "A", "2018-01-01", "2018-06-30")
+    catalog.add(_touch(tmp_path / "other.csv"), "B", "2018-01-01", "2018-12-31")
+
+    assert catalog.find("A", "2018-03-01", "2018-03-31") == half
+    assert catalog.find("A", "2018-06-01", "2018-07-31") == year
+    assert catalog.find("A", "2017-12-31", "2018-01-31") is None
+    assert catalog.find("A", "2018-03-01", "2018-03-31", daily=True) is None
+    assert catalog.find("C", "2018-03-01", "2018-03-31") is None
+
+
+def test_missing_file_is_dropped(catalog, tmp_path):
+    catalog.add(tmp_path / "gone.csv", "A", "2018-01-01", "2018-12-31")
+    assert len(catalog.list()) == 1
+    assert catalog.find("A", "2018-03-01", "2018-03-31") is None
+    assert len(catalog.list()) == 0
+
+
+def test_lookup_does_not_create_database(tmp_path):
+    catalog = Catalog(tmp_path / "nested" / "catalog.sqlite")
+    assert catalog.find("A", "2018-01-01", "2018-01-31") is None
+    assert catalog.list().empty
+    assert catalog.size() == 0
+    assert not (tmp_path / "nested").exists()
+
+
+def test_list_and_size(catalog, tmp_path):
+    catalog.add(_touch(tmp_path / "a.csv", 5), "A", "2018-01-01", "2018-01-31")
+    catalog.add(
+        _touch(tmp_path / "b.json.gz", 7), "B", "2018-01-01", "2018-01-31", daily=True
+    )
+
+    listing = catalog.list()
+    assert listing["path"].tolist() == [
+        str(tmp_path / "a.csv"),
+        str(tmp_path / "b.json.gz"),
+    ]
+    assert listing["service"].tolist() == ["iv", "dv"]
+    assert listing["format"].tolist() == ["csv", "json.gz"]
+    assert listing["start"].tolist() == [pandas.Timestamp("2018-01-01")] * 2
+    assert catalog.list(site="B")["site"].tolist() == ["B"]
+    assert catalog.list(daily=False)["site"].tolist() == ["A"]
+    assert catalog.size() == 12
+
+
+def test_scan(catalog, tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    _touch(data / "14211500_20180101_thru_20181231_insta.csv")
+    _touch(data / "14211500_20180101_thru_20180131_daily.json.gz")
+    _touch(data / "14211500_20180101_thru_20181231_daily_p00060_s00003.csv")
+    _touch(data / "notes.txt")
+
+    assert catalog.scan(data) == 3
+    assert catalog.find("14211500", "2018-05-01", "2018-05-02").name == (
+        "14211500_20180101_thru_20181231_insta.csv"
+    )
+    assert catalog.list(daily=True)["series"].tolist() == ["", "p00060_s00003"]
+    assert catalog.find(
+        "14211500", "2018-05-01", "2018-05-02", daily=True, series="p00060_s00003"
+    ).name == ("14211500_20180101_thru_20181231_daily_p00060_s00003.csv")
+
+
+def test_prune(catalog, tmp_path):
+    paths = [_touch(tmp_path / "{}.csv".format(i), 100) for i in range(4)]
+    with mock.patch("time.time", side_effect=[1000.0, 2000.0, 3000.0, 4000.0]):
+        catalog.add(paths[0], "A", "2018-01-01", "2018-12-31")
+        catalog.add(paths[1], "A", "2018-02-01", "2018-02-28")
+        catalog.add(paths[2], "A", "2019-01-01", "2019-12-31")
+        catalog.add(paths[3], "B", "2018-02-01", "2018-02-28")
+
+    assert catalog.prune(redundant=True, delete=False) == [paths[1]]
+    assert paths[1].exists()
+
+    with mock.patch("time.time", return_value=4500.0):
+        assert catalog.prune(max_age=3000) == [paths[0]]
+    assert not paths[0].exists()
+
+    assert catalog.prune(max_bytes=150) == [paths[2]]
+    assert catalog.list()["path"].tolist() == [str(paths[3])]
+
+
+def test_find_is_fast(catalog, tmp_path):
+    _touch(tmp_path / "hit.csv")
+    conn = catalog._connect(create=True)
+    starts = pandas.date_range("2000-01-01", periods=20, freq="YS")
+    rows = [
+        (
+            str(tmp_path / "{}-{}.csv".format(site, i)),
+            "{:08d}".format(site),
+            "iv",
+            "",
+            start.strftime("%Y-%m-%d"),
+            (start + pandas.offsets.YearEnd()).strftime("%Y-%m-%d"),
+            364,
+            "csv",
+            10,
+            0.0,
+        )
+        for site in range(2500)
+        for i, start in enumerate(starts)
+    ]
+    with conn:
+        conn.executemany(
+            "INSERT INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    catalog.add(tmp_path / "hit.csv", "00001234", "2010-03-01", "2010-03-31")
+    assert len(catalog.list()) == 50001
+
+    timings = []
+    for _ in range(200):
+        started = time.perf_counter()
+        found = catalog.find("00001234", "2010-03-05", "2010-03-06")
+        timings.append(time.perf_counter() - started)
+    assert found == tmp_path / "hit.csv"
+    assert numpy.median(timings) < 1e-3
+
+
+def test_station_reuses_covering_file(tmp_path):
+    index = pandas.date_range(
+        "2018-01-01", "2018-12-31 23:45", freq="15min", tz="-08:00", name="datetime"
+    )
+    df = pandas.DataFrame(
+        {
+            ("Flow", "qual"): "A",
+            ("Flow", "value"): numpy.arange(len(index), dtype=float),
+        },
+        index=index,
+    ).rename_axis(["param", "var"], axis="columns")
+
+    year = nwis.Station("01", "2018-01-01", "2018-12-31", tmp_path)
+    assert year.catalog is get_catalog(tmp_path)
+    with mock.patch.object(year, "_download", return_value=df):
+        year.get_data(save=True)
+
+    march = nwis.Station("01", "2018-03-01", "2018-03-31", tmp_path)
+    with mock.patch.object(march, "_download") as download:
+        result = march.get_data()
+    download.assert_not_called()
+    assert len(result) == 31 * 96
+    assert result.index[0] == pandas.Timestamp("2018-03-01", tz="-08:00")
+    assert set(os.listdir(tmp_path)) >= {
+        "01_20180101_thru_20181231_insta.csv",
+        "catalog.sqlite",
+    }
+
+    off = nwis.Station("01", "2018-03-01", "2018-03-31", tmp_path, catalog=False)
+    with mock.patch.object(off, "_download", return_value=None) as download:
+        off.get_data()
+    download.assert_called_once()
+
+
+def test_station_window_ending_today(tmp_path):
+    today = pandas.Timestamp.now().normalize()
+    yesterday = today - pandas.Timedelta(days=1)
+    index = pandas.date_range(yesterday, today, freq="D", name="datetime")
+    df = pandas.DataFrame(
+        {("Flow", "qual"): "P", ("Flow", "value"): [1.0, 2.0]}, index=index
+    ).rename_axis(["param", "var"], axis="columns")
+
+    for start in [yesterday, today]:
+        station = nwis.Station("01", start, today, tmp_path)
+        with mock.patch.object(station, "_download", return_value=df):
+            station.get_data(save=True)
+
+    # today is not complete yet, so only yesterday is recorded as covered
+    listing = get_catalog(tmp_path).list()
+    assert len(listing) == 1
+    assert listing[["start", "end"]].iloc[0].tolist() == [yesterday, yesterday]
+
+    again = nwis.Station("01", yesterday, today, tmp_path)
+    assert again.catalog.find("01", yesterday, today) is None
+    assert again.catalog.find("01", yesterday, yesterday) is not None
+
+
+def test_get_catalog_closes_least_recently_used(tmp_path):
+    from dockside import catalog as catalog_module
+
+    with mock.patch.object(catalog_module, "MAX_OPEN_CATALOGS", 2):
+        first = get_catalog(tmp_path / "a")
+        first.add(tmp_path / "a" / "x.csv", "01", "2018-01-01", "2018-01-31")
+        assert first._conn is not None
+        get_catalog(tmp_path / "b")
+        assert get_catalog(tmp_path / "a") is first  # now the most recent
+        get_catalog(tmp_path / "c")
+        assert get_catalog(tmp_path / "a") is first
+        get_catalog(tmp_path / "d")
+        get_catalog(tmp_path / "e")
+
+        # closed to make room, but still usable
+        assert first._conn is None
+        assert len(first.list()) == 1
+        assert get_catalog(tmp_path / "a") is not first
@@ -0,0 +1,163 @@
+import json
+from io import StringIO
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from dockside import cli
+from .util import FakeNWIS
+
+
+def _site_body(path):
+    site = parse_qs(urlsplit(path).query)["sites"][0]
+    return json.dumps(
+        {
+            "value": {
+                "timeSeries": [
+                    {
+                        "variable": {"variableName": "Flow " + site},
+                        "values": [
+                            {
+                                "value": [
+                                    {
+                                        "value": "1.5",
+                                        "qualifiers": ["A"],
+                                        "dateTime": "2018-01-01T00:00:00.000-08:00",
+                                    }
+                                ]
+                            }
+                        ],
+                    }
+                ]
+            }
+        }
+    )
+
+
+def _requested_sites(server):
+    return sorted(parse_qs(urlsplit(p).query)["sites"][0] for p in server.requests)
+
+
+@pytest.fixture
+def sites_file(tmp_path):
+    fpath = tmp_path / "sites.txt"
+    fpath.write_text("# gauges\n01\n02  # a comment\n\nbad\n01\n")
+    return fpath
+
+
+def test_read_sites(sites_file):
+    assert cli.read_sites(sites_file) == ["01", "02", "bad"]
+
+
+def test_main_resumes(sites_file, tmp_path):
+    savepath = tmp_path / "data"
+    failing = {"bad"}
+
+    def body(path):
+        if any("sites=" + site in path for site in failing):
+            raise ValueError  # drops the connection
+        return _site_body(path)
+
+    with FakeNWIS(default=(200, body, None)) as server:
+        argv = [
+            str(sites_file),
+            "2018-01-01",
+            "2018-01-01",
+            "--savepath",
+            str(savepath),
+            "--workers",
+            "2",
+            "--retries",
+            "0",
+            "--base-url",
+            server.url,
+        ]
+
+        assert cli.main(argv) == 1
+        assert _requested_sites(server) == ["01", "02", "bad"]
+        state = json.loads((savepath / cli.STATE_FILE).read_text())
+        assert state["job"]["service"] == "iv"
+        assert {s: v["status"] for s, v in state["sites"].items()} == {
+            "01": "done",
+            "02": "done",
+            "bad": "failed",
+        }
+        assert (savepath / "01_20180101_thru_20180101_insta.csv").exists()
+        assert state["sites"]["01"]["rows"] == 1
+
+        # only the failed site is tried again
+        failing.clear()
+        server.requests.clear()
+        assert cli.main(argv) == 0
+        assert _requested_sites(server) == ["bad"]
+
+        server.requests.clear()
+        assert cli.main(argv) == 0
+        assert server.requests == []
+
+        server.requests.clear()
+        assert cli.main(argv + ["--force"]) == 0
+        assert _requested_sites(server) == ["01", "02", "bad"]
+
+
+def test_main_other_job(sites_file, tmp_path):
+    state = cli.JobState(tmp_path / "job.json", {"start": "2017-01-01"})
+    state.record("01", cli.JobState.DONE)
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main(
+            [str(sites_file), "2018-01-01", "2018-01-31"]
+            + ["--state", str(tmp_path / "job.json")]
+        )
+    assert exc.value.code == 2
+
+
+def test_job_state_roundtrip(tmp_path):
+    job = {"start": "2018-01-01", "end": "2018-01-31", "service": "dv"}
+    state = cli.JobState.load(tmp_path / "job.json", job)
+    state.record("01", cli.JobState.DONE, rows=31)
+    state.record("02", cli.JobState.FAILED, error="HTTPError()")
+    state.record("03", cli.JobState.EMPTY)
+
+    resumed = cli.JobState.load(tmp_path / "job.json", job)
+    assert resumed.finished("01") and resumed.finished("03")
+    assert not resumed.finished("02") and not resumed.finished("04")
+    assert resumed.counts() == {"done": 1, "failed": 1, "empty": 1}
+    assert not (tmp_path / "job.json.part").exists()
+
+
+def test_run_adaptive(sites_file, tmp_path):
+    log = StringIO()
+    with FakeNWIS(default=(200, _site_body, None)) as server:
+        args = cli.build_parser().parse_args(
+            [str(sites_file), "2018-01-01", "2018-01-01"]
+            + ["--savepath", str(tmp_path), "--base-url", server.url]
+            + ["--adaptive", "--rate", "100", "--workers", "4"]
+        )
+        state = cli.run(args, log=log)
+    assert state.counts() == {"done": 3}
+    assert "0 throttled" in log.getvalue().splitlines()[-1]
+
+
+def test_run_records_catalog_path(tmp_path):
+    sites_file = tmp_path / "sites.txt"
+    sites_file.write_text("01\n")
+    savepath = tmp_path / "data"
+    with FakeNWIS(default=(200, _site_body, None)) as server:
+        common = ["--savepath", str(savepath), "--base-url", server.url]
+        wide = cli.build_parser().parse_args(
+            [str(sites_file), "2017-12-01", "2018-01-31"] + common
+        )
+        cli.run(wide, log=StringIO())
+        narrow = cli.build_parser().parse_args(
+            [str(sites_file), "2018-01-01", "2018-01-02"]
+            + common
+            + ["--state", str(tmp_path / "narrow.json")]
+        )
+        state = cli.run(narrow, log=StringIO())
+
+    assert len(server.requests) == 1
+    path = state.sites["01"]["path"]
+    assert path == str(savepath / "01_20171201_thru_20180131_insta.csv")
+    assert Path(path).exists()
@@ -0,0 +1,204 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+import requests
+
+from dockside import client as dsclient
+from dockside.io import fetch_nwis
+from .util import FakeNWIS
+
+
+@pytest.fixture
+def server():
+    with FakeNWIS() as srv:
+        yield srv
+
+
+@pytest.fixture
+def client(server):
+    with dsclient.Client(base_url=server.url, retries=3, backoff=0.01) as c:
+        yield c
+
+
+def test_client_pool_size():
+    c = dsclient.Client(pool_size=25)
+    adapter = c.session.get_adapter("https://nwis.waterservices.usgs.gov")
+    assert adapter._pool_maxsize == 25
+    assert adapter.max_retries.total == 0
+
+
+def test_client_accepts_gzip():
+    assert dsclient.Client().session.headers["Accept-Encoding"] == "gzip, deflate"
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = "identity"
+    assert dsclient.Client(session=session).session.headers["Accept-Encoding"] == (
+        "identity"
+    )
+
+
+def test_client_keepalive(server, client):
+    for _ in range(5):
+        client.get(server.url + "/iv")
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_client_retries_transient(server, client, status):
+    server.responses = [(status, b"", None), (status, b"", None)]
+    with mock.patch.object(dsclient.time, "sleep") as sleep:
+        r = client.get(server.url + "/iv")
+    assert r.status_code == 200
+    assert len(server.requests) == 3
+    assert sleep.call_count == 2
+
+
+def test_client_gives_up(server, client):
+    server.default = (503, b"", None)
+    with mock.patch.object(dsclient.time, "sleep") as sleep:
+        r = client.get(server.url + "/iv")
+    assert r.status_code == 503
+    assert len(server.requests) == client.retries + 1
+    assert sleep.call_count == client.retries
+
+
+def test_client_no_retry_on_client_error(server, client):
+    server.responses = [(404, b"", None)]
+    with mock.patch.object(dsclient.time, "sleep") as sleep:
+        r = client.get(server.url + "/iv")
+    assert r.status_code == 404
+    assert len(server.requests) == 1
+    sleep.assert_not_called()
+
+
+def test_client_retry_after(server, client):
+    server.responses = [(429, b"", {"Retry-After": "7"})]
+    with mock.patch.object(dsclient.time, "sleep") as sleep:
+        client.get(server.url + "/iv")
+    sleep.assert_called_once_with(7.0)
+
+
+def test_client_retries_connection_errors():
+    c = dsclient.Client(retries=2, backoff=0.01)
+    with mock.patch.object(
+        c.session, "get", side_effect=requests.ConnectionError("boom")
+    ) as get, mock.patch.object(dsclient.time, "sleep"):
+        with pytest.raises(requests.ConnectionError):
+            c.get("http://example.com")
+    assert get.call_count == 3
+
+
+@pytest.mark.parametrize("attempt", [0, 1, 2, 5, 10])
+def test_client_delay_full_jitter(attempt):
+    c = dsclient.Client(backoff=0.5, max_backoff=4)
+    cap = min(0.5 * 2**attempt, 4)
+    delays = [c.delay(attempt) for _ in range(50)]
+    assert all(0 <= d <= cap for d in delays)
+
+
+def test_client_delay_retry_after_is_capped():
+    c = dsclient.Client(max_backoff=4)
+    response = requests.Response()
+    response.headers["Retry-After"] = "120"
+    assert c.delay(0, response) == 4
+
+
+def test_client_timeout_policy(server):
+    c = dsclient.Client(base_url=server.url, timeout=(1, 2))
+    with mock.patch.object(c.session, "get", wraps=c.session.get) as get:
+        c.get(server.url + "/iv")
+        c.get(server.url + "/iv", timeout=9)
+    assert get.call_args_list[0].kwargs["timeout"] == (1, 2)
+    assert get.call_args_list[1].kwargs["timeout"] == 9
+
+
+def test_get_client_is_shared():
+    assert dsclient.get_client() is dsclient.get_client()
+
+
+def test_fetch_nwis_uses_client(server, client):
+    r = fetch_nwis("08071280", "2012-10-01", "2012-12-01", daily=True, client=client)
+    assert r.status_code == 200
+    assert server.requests == [
+        "/dv?format=json&sites=08071280&startDT=2012-10-01&endDT=2012-12-01"
+    ]
+
+
+def test_governor_additive_increase():
+    governor = dsclient.Governor(concurrency=2, max_concurrency=3, tolerance=None)
+    for _ in range(10):
+        governor.release(governor.acquire(), 200)
+    assert governor.concurrency == 3
+    stats = governor.stats()
+    assert stats["requests"] == 10
+    assert stats["in_flight"] == 0
+    assert stats["decreases"] == 0
+
+
+def test_governor_one_cut_per_round_trip():
+    governor = dsclient.Governor(concurrency=8)
+    first, second = governor.acquire(), governor.acquire()
+    governor.release(first, 429)
+    governor.release(second, 503)
+    assert governor.concurrency == 4
+
+    governor.release(governor.acquire(), failed=True)
+    assert governor.concurrency == 2
+    stats = governor.stats()
+    assert (stats["throttled"], stats["failed"], stats["decreases"]) == (2, 1, 2)
+
+
+def test_governor_cuts_on_slow_responses():
+    governor = dsclient.Governor(concurrency=8)
+    for _ in range(3):
+        governor.release(governor.acquire() - 0.1, 200)
+    governor.release(governor.acquire() - 1.0, 200)
+    assert governor.stats()["slow"] == 1
+    assert governor.concurrency == 4
+
+
+def test_governor_retry_after_pauses():
+    governor = dsclient.Governor()
+    governor.release(governor.acquire(), 429, retry_after=0.1)
+    assert governor.stats()["paused"] > 0
+
+    started = time.monotonic()
+    governor.acquire()
+    assert time.monotonic() - started >= 0.09
+
+
+def test_governor_rate_ceiling():
+    governor = dsclient.Governor(max_concurrency=8, rate=50)
+    started = time.monotonic()
+    for _ in range(6):
+        governor.release(governor.acquire(), 200)
+    assert time.monotonic() - started >= 0.1
+
+
+def test_governor_limits_in_flight():
+    governor = dsclient.Governor(concurrency=2, max_concurrency=2)
+    seen = []
+
+    def work(_):
+        started = governor.acquire()
+        seen.append(governor.stats()["in_flight"])
+        time.sleep(0.01)
+        governor.release(started, 200)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(16)))
+    assert max(seen) == 2
+
+
+def test_client_reports_to_governor(server):
+    governor = dsclient.Governor(concurrency=4)
+    server.responses = [(429, b"", {"Retry-After": "0"})]
+    with dsclient.Client(base_url=server.url, governor=governor) as client:
+        with mock.patch.object(dsclient.time, "sleep"):
+            r = client.get(server.url + "/iv")
+    assert r.status_code == 200
+    stats = governor.stats()
+    assert (stats["requests"], stats["throttled"]) == (2, 1)
+    assert stats["concurrency"] == 2
@@ -0,0 +1,49 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import dockside
+
+HEAVY = ["pandas", "numpy", "requests", "pkg_resources", "pytest", "aiohttp"]
+
+
+def _run(code):
+    out = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    return json.loads(out.stdout)
+
+
+def test_import_is_lazy():
+    loaded = _run(
+        "import json, sys; import dockside; "
+        "print(json.dumps([m for m in {!r} if m in sys.modules]))".format(HEAVY)
+    )
+    assert loaded == []
+
+
+def test_import_time():
+    # generous bound, the eager import pulled in pandas and took ~0.7s
+    seconds = _run(
+        "import json, time; t = time.perf_counter(); import dockside; "
+        "print(json.dumps(time.perf_counter() - t))"
+    )
+    assert seconds < 0.2
+
+
+def test_lazy_names_resolve():
+    from dockside.io import read_nwis
+    from dockside.nwis import Station
+
+    assert dockside.read_nwis is read_nwis
+    assert dockside.Station is Station
+    assert dockside.instrument.__name__ == "dockside.instrument"
+    assert {"Client", "Station", "read_nwis", "test", "io"} <= set(dir(dockside))
+    assert set(dockside.__all__) <= set(dir(dockside))
+
+
+def test_unknown_name():
+    with pytest.raises(AttributeError, match="not_a_thing"):
+        dockside.not_a_thing
@@ -0,0 +1,153 @@
+import gzip
+import json
+import logging
+
+import pytest
+
+from dockside import instrument, nwis
+from dockside.cache import FrameCache
+from dockside.client import Client
+from .util import FakeNWIS
+
+BODY = json.dumps(
+    {
+        "value": {
+            "timeSeries": [
+                {
+                    "variable": {"variableName": "Flow"},
+                    "values": [
+                        {
+                            "value": [
+                                {
+                                    "value": "1.5",
+                                    "qualifiers": ["A"],
+                                    "dateTime": "2018-01-01T00:00:00.000-08:00",
+                                },
+                                {
+                                    "value": "2.5",
+                                    "qualifiers": ["P"],
+                                    "dateTime": "2018-01-01T00:15:00.000-08:00",
+                                },
+                            ]
+                        }
+                    ],
+                }
+            ]
+        }
+    }
+)
+
+
+def test_span_without_hooks():
+    with instrument.span("parse", rows=1) as rec:
+        rec["rows"] = 2
+    assert not instrument.enabled()
+
+
+def test_profile_station(tmp_path):
+    with FakeNWIS(default=(200, BODY, None)) as server, Client(
+        base_url=server.url
+    ) as client, instrument.Profile() as prof:
+        frames = FrameCache()
+        station = nwis.Station(
+            "01",
+            "2018-01-01",
+            "2018-01-01",
+            tmp_path,
+            client=client,
+            frame_cache=frames,
+        )
+        station.insta_data
+        nwis.Station(
+            "01",
+            "2018-01-01",
+            "2018-01-01",
+            tmp_path,
+            client=client,
+            frame_cache=frames,
+        ).insta_data
+        station.get_data(save=True)
+        station.get_data()
+
+    assert not instrument.enabled()
+    records = prof.to_frame()
+    assert records["stage"].tolist() == [
+        "frame_cache",
+        "fetch",
+        "decode",
+        "parse",
+        "concat",
+        "frame_cache",
+        "fetch",
+        "decode",
+        "parse",
+        "concat",
+        "write_cache",
+        "read_cache",
+    ]
+
+    fetch = records[records["stage"] == "fetch"].iloc[0]
+    assert fetch["url"] == server.url + "/iv"
+    assert (fetch["status"], fetch["bytes"], fetch["cached"]) == (200, len(BODY), False)
+
+    summary = prof.summary()
+    assert summary.loc["parse", "calls"] == 2
+    assert summary.loc["parse", "rows"] == 4
+    assert summary.loc["frame_cache", ["hits", "misses"]].tolist() == [1, 1]
+    assert summary.loc["write_cache", "bytes"] > 0
+    assert (summary["seconds"].drop("frame_cache") > 0).all()
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_profile_stream_and_file(tmp_path, compress):
+    from dockside import io
+
+    fpath = tmp_path / "body.json"
+    fpath.write_bytes(gzip.compress(BODY.encode()) if compress else BODY.encode())
+    with instrument.Profile() as prof:
+        io.read_nwis_stream([BODY])
+        io.read_nwis_file(fpath)
+        list(io.iter_frames([BODY.encode()]))
+
+    parse = prof.to_frame().query("stage == 'parse'")
+    assert parse["format"].tolist() == ["json"] * 3
+    assert parse["timeseries"].tolist() == [1] * 3
+    assert parse["rows"].tolist() == [2] * 3
+
+
+def test_span_error():
+    with instrument.Profile() as prof:
+        with pytest.raises(ValueError):
+            with instrument.span("parse"):
+                raise ValueError
+    assert prof.records[0]["error"] == "ValueError"
+
+
+def test_log_hook(caplog):
+    hook = instrument.LogHook(level=logging.WARNING)
+    instrument.add_hook(hook)
+    try:
+        instrument.event("frame_cache", hit=True)
+    finally:
+        instrument.remove_hook(hook)
+
+    (message,) = caplog.messages
+    assert json.loads(message) == {"stage": "frame_cache", "seconds": None, "hit": True}
+
+
+def test_failing_hook_warns():
+    def broken(record):
+        raise KeyError
+
+    instrument.add_hook(broken)
+    try:
+        with pytest.warns(UserWarning):
+            instrument.event("frame_cache", hit=True)
+    finally:
+        instrument.remove_hook(broken)
+
+
+def test_empty_summary():
+    summary = instrument.Profile().summary()
+    assert summary.empty
+    assert summary.columns.tolist()[:2] == ["calls", "seconds"]
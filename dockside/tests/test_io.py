@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 
 import numpy
@@ -6,6 +7,7 @@ from pandas import Timestamp
 
 from unittest import mock
 import pytest
+import requests
 import pandas.testing as pdtest
 
 from dockside import io
@@ -367,3 +369,882 @@ def test_read_cache(daily, header):
         reader.assert_called_once_with(
             path, parse_dates=datecol, header=header, index_col=datecol
         )
+
+
+class FakeJSONResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(self.status_code)
+
+    def json(self):
+        return self.payload
+
+
+def test_fetch_many(insta_ts_1, insta_ts_2):
+    payloads = {
+        "A": {"value": {"timeSeries": [insta_ts_1]}},
+        "B": {"value": {"timeSeries": [insta_ts_2]}},
+        "C": {"value": {"timeSeries": []}},
+    }
+
+    def fake_fetch(site, start, end, daily=False, client=None):
+        if site == "bad":
+            return FakeJSONResponse(None, status_code=500)
+        return FakeJSONResponse(payloads[site])
+
+    with mock.patch.object(io, "fetch_nwis", side_effect=fake_fetch):
+        data, errors = io.fetch_many(["A", "bad", "B", "C"], "2012-10-01", "2012-10-02")
+
+    assert list(data) == ["A", "B", "C"]
+    assert list(errors) == ["bad"]
+    assert isinstance(errors["bad"], requests.HTTPError)
+    pdtest.assert_frame_equal(data["A"], io._parse_ts(insta_ts_1, daily=False))
+    assert data["C"] is None
+
+
+def test_fetch_many_max_in_flight(insta_ts_1):
+    import threading
+    import time
+
+    lock = threading.Lock()
+    state = {"now": 0, "peak": 0}
+
+    def fake_fetch(site, start, end, daily=False, client=None):
+        with lock:
+            state["now"] += 1
+            state["peak"] = max(state["peak"], state["now"])
+        time.sleep(0.01)
+        with lock:
+            state["now"] -= 1
+        return FakeJSONResponse({"value": {"timeSeries": [insta_ts_1]}})
+
+    with mock.patch.object(io, "fetch_nwis", side_effect=fake_fetch):
+        data, errors = io.fetch_many(
+            range(20), "2012-10-01", "2012-10-02", max_workers=3
+        )
+
+    assert len(data) == 20
+    assert errors == {}
+    assert 1 < state["peak"] <= 3
+
+
+def test_combine_sites(insta_ts_1, insta_ts_2):
+    a = io._parse_ts(insta_ts_1, daily=False)
+    b = io._parse_ts(insta_ts_2, daily=False)
+    result = io.combine_sites({"A": a, "B": b, "C": None})
+    assert result.columns.names == ["site", "param", "var"]
+    assert result.columns.get_level_values("site").unique().tolist() == ["A", "B"]
+    pdtest.assert_frame_equal(result["A"], a, check_names=False)
+
+
+def test_combine_sites_empty():
+    assert io.combine_sites({"A": None}) is None
+
+
+def _at_site(ts, site):
+    return {**ts, "sourceInfo": {"siteCode": [{"value": site, "agencyCode": "USGS"}]}}
+
+
+def test_read_nwis_by_site(insta_ts_1, insta_ts_2):
+    site_json = {
+        "value": {
+            "timeSeries": [
+                _at_site(insta_ts_1, "A"),
+                _at_site(insta_ts_2, "B"),
+                _at_site(insta_ts_2, "A"),
+            ]
+        }
+    }
+    result = io.read_nwis(site_json, by_site=True)
+    assert list(result) == ["A", "B"]
+    pdtest.assert_frame_equal(
+        result["A"],
+        io.read_nwis({"value": {"timeSeries": [insta_ts_1, insta_ts_2]}}),
+    )
+    pdtest.assert_frame_equal(result["B"], io._parse_ts(insta_ts_2, daily=False))
+    assert io.read_nwis({"value": {"timeSeries": []}}, by_site=True) == {}
+
+
+@pytest.mark.parametrize("daily", [True, False])
+def test_read_nwis_workers(daily, insta_ts_1, insta_ts_2, daily_ts_1, daily_ts_2):
+    all_ts = [daily_ts_1, daily_ts_2] if daily else [insta_ts_1, insta_ts_2]
+    site_json = {"value": {"timeSeries": all_ts * 3}}
+    expected = io.read_nwis(site_json, daily=daily)
+    with mock.patch.object(io, "PARALLEL_MIN_VALUES", 0), mock.patch.object(
+        io.os, "cpu_count", return_value=4
+    ):
+        result = io.read_nwis(site_json, daily=daily, workers=2)
+    pdtest.assert_frame_equal(result, expected)
+
+
+def test_read_nwis_workers_send_slices(insta_ts_1, insta_ts_2):
+    from concurrent.futures import ThreadPoolExecutor
+
+    created, sent = [], []
+
+    class Recording(ThreadPoolExecutor):
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+            super().__init__(max_workers=kwargs["max_workers"])
+
+        def submit(self, fn, batch, *args):
+            sent.append(len(batch))
+            return super().submit(fn, batch, *args)
+
+    site_json = {"value": {"timeSeries": [insta_ts_1, insta_ts_2] * 3}}
+    expected = io.read_nwis(site_json)
+    with mock.patch.object(io, "PARALLEL_MIN_VALUES", 0), mock.patch.object(
+        io.os, "cpu_count", return_value=4
+    ), mock.patch.object(io, "ProcessPoolExecutor", Recording):
+        result = io.read_nwis(site_json, workers=3)
+
+    pdtest.assert_frame_equal(result, expected)
+    # the platform's default start method, and each worker only gets its share
+    assert created == [{"max_workers": 3}]
+    assert sent == [2, 2, 2]
+
+
+def test_read_nwis_workers_small(insta_ts_1, insta_ts_2):
+    site_json = {"value": {"timeSeries": [insta_ts_1, insta_ts_2]}}
+    with mock.patch.object(io, "ProcessPoolExecutor") as pool:
+        io.read_nwis(site_json, workers=4)
+    pool.assert_not_called()
+
+
+def test_fetch_batched(insta_ts_1, insta_ts_2):
+    calls = []
+
+    def fake_fetch(site, start, end, daily=False, client=None):
+        calls.append(site)
+        if "bad" in site:
+            return FakeJSONResponse(None, status_code=500)
+        series = {"A": insta_ts_1, "B": insta_ts_2}
+        return FakeJSONResponse(
+            {
+                "value": {
+                    "timeSeries": [
+                        _at_site(series[s], s) for s in site.split(",") if s in series
+                    ]
+                }
+            }
+        )
+
+    with mock.patch.object(io, "fetch_nwis", side_effect=fake_fetch):
+        data, errors = io.fetch_batched(
+            ["A", "B", "C", "bad", "D"], "2012-10-01", "2012-10-02", batch_size=3
+        )
+
+    assert sorted(calls) == ["A,B,C", "bad,D"]
+    assert list(data) == ["A", "B", "C"]
+    assert list(errors) == ["bad", "D"]
+    pdtest.assert_frame_equal(data["A"], io._parse_ts(insta_ts_1, daily=False))
+    assert data["C"] is None
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "freq", "expected"),
+    [
+        (
+            "2018-01-15",
+            "2018-03-10",
+            "MS",
+            [
+                ("2018-01-15", "2018-01-31"),
+                ("2018-02-01", "2018-02-28"),
+                ("2018-03-01", "2018-03-10"),
+            ],
+        ),
+        ("2018-01-01", "2018-01-20", "MS", [("2018-01-01", "2018-01-20")]),
+        (
+            "2018-01-01",
+            "2018-01-20",
+            "7D",
+            [
+                ("2018-01-01", "2018-01-07"),
+                ("2018-01-08", "2018-01-14"),
+                ("2018-01-15", "2018-01-20"),
+            ],
+        ),
+        ("2018-01-01", "2018-01-01", "MS", [("2018-01-01", "2018-01-01")]),
+    ],
+)
+def test_date_chunks(start, end, freq, expected):
+    result = io.date_chunks(start, end, freq=freq)
+    assert result == [(Timestamp(a), Timestamp(b)) for a, b in expected]
+
+
+def _ts_json(param, times, values):
+    return {
+        "variable": {"variableName": param},
+        "values": [
+            {
+                "value": [
+                    {"value": str(v), "qualifiers": ["A"], "dateTime": t}
+                    for t, v in zip(times, values)
+                ]
+            }
+        ],
+    }
+
+
+def test_read_nwis_chunked():
+    # the second window overlaps the first by one timestamp and comes back
+    # with the other UTC offset
+    chunks = {
+        Timestamp("2012-10-01"): {
+            "value": {
+                "timeSeries": [
+                    _ts_json(
+                        "Flow",
+                        [
+                            "2012-10-31T23:45:00.000-07:00",
+                            "2012-11-01T00:00:00.000-07:00",
+                        ],
+                        [1.0, 2.0],
+                    )
+                ]
+            }
+        },
+        Timestamp("2012-11-01"): {
+            "value": {
+                "timeSeries": [
+                    _ts_json(
+                        "Flow",
+                        [
+                            "2012-10-31T23:00:00.000-08:00",
+                            "2012-11-05T00:00:00.000-08:00",
+                        ],
+                        [2.0, 3.0],
+                    )
+                ]
+            }
+        },
+    }
+
+    def fake_fetch(site, start, end, daily=False, client=None):
+        return FakeJSONResponse(chunks[start])
+
+    with mock.patch.object(io, "fetch_nwis", side_effect=fake_fetch) as fetch:
+        result = io.read_nwis_chunked("A", "2012-10-01", "2012-11-30", chunk="MS")
+
+    assert fetch.call_count == 2
+    assert result.index.is_monotonic_increasing
+    assert result.index.is_unique
+    assert str(result.index.tz) == "UTC"
+    assert result[("Flow", "value")].tolist() == [1.0, 2.0, 3.0]
+
+
+def test_read_nwis_chunked_propagates_errors():
+    def fake_fetch(site, start, end, daily=False, client=None):
+        return FakeJSONResponse(None, status_code=503)
+
+    with mock.patch.object(io, "fetch_nwis", side_effect=fake_fetch):
+        with pytest.raises(requests.HTTPError):
+            io.read_nwis_chunked("A", "2012-10-01", "2012-11-30", chunk="MS")
+
+
+def test__parse_ts_qualifiers_and_offsets():
+    ts = _ts_json(
+        "Flow",
+        ["2012-10-01T00:00:00.000-05:00", "2012-10-01T00:15:00.000-05:00"],
+        [1.5, -999999],
+    )
+    ts["values"][0]["value"][1]["qualifiers"] = ["P", "Ice"]
+    result = io._parse_ts(ts, daily=False)
+
+    assert result[("Flow", "qual")].tolist() == ["A", "P,Ice"]
+    assert result[("Flow", "value")].tolist() == [1.5, -999999.0]
+    assert result.index.name == "datetime"
+    assert result.columns.names == ["param", "var"]
+    expected_index = pandas.to_datetime(
+        ["2012-10-01T00:00:00.000-05:00", "2012-10-01T00:15:00.000-05:00"]
+    )
+    pdtest.assert_index_equal(result.index, expected_index, check_names=False)
+
+
+def test__parse_ts_mixed_offsets():
+    ts = _ts_json(
+        "Flow",
+        ["2012-11-04T01:45:00.000-07:00", "2012-11-04T01:00:00.000-08:00"],
+        [1.0, 2.0],
+    )
+    result = io._parse_ts(ts, daily=False)
+    expected_index = pandas.DatetimeIndex(
+        ["2012-11-04 08:45", "2012-11-04 09:00"], tz="UTC"
+    )
+    pdtest.assert_index_equal(
+        result.index, expected_index, check_names=False, exact=False
+    )
+
+
+def test__parse_ts_empty():
+    result = io._parse_ts(_ts_json("Flow", [], []), daily=False)
+    assert result.shape == (0, 2)
+    assert result.columns.tolist() == [("Flow", "qual"), ("Flow", "value")]
+
+
+def _site_json(*ts):
+    return {
+        "name": "ns1:timeSeriesResponseType",
+        "value": {
+            "queryInfo": {"queryURL": "http://nwis.waterservices.usgs.gov/nwis/iv/"},
+            "timeSeries": list(ts),
+        },
+        "nil": False,
+    }
+
+
+def _chunked(body, size):
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("size", [1, 7, 100, 1_000_000])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_read_nwis_stream(insta_ts_1, insta_ts_2, size, indent):
+    insta_ts_2["variable"]["variableName"] = "Temperature, °C"
+    site_json = _site_json(insta_ts_1, insta_ts_2)
+    body = json.dumps(site_json, indent=indent, ensure_ascii=False).encode("utf-8")
+
+    result = io.read_nwis_stream(_chunked(body, size), daily=False)
+    pdtest.assert_frame_equal(result, io.read_nwis(site_json, daily=False))
+
+
+def test_read_nwis_stream_file(daily_ts_1, daily_ts_2):
+    from io import BytesIO
+
+    site_json = _site_json(daily_ts_1, daily_ts_2)
+    fp = BytesIO(json.dumps(site_json).encode("utf-8"))
+    result = io.read_nwis_stream(fp, daily=True)
+    pdtest.assert_frame_equal(result, io.read_nwis(site_json, daily=True))
+    assert fp.closed
+
+
+def test_read_nwis_stream_empty():
+    body = json.dumps(_site_json())
+    assert io.read_nwis_stream(_chunked(body, 5)) is None
+    assert list(io.iter_timeseries([b'{"value": {}}'])) == []
+
+
+def test_iter_timeseries_truncated(insta_ts_1):
+    body = json.dumps(_site_json(insta_ts_1, insta_ts_1)).encode("utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        list(io.iter_timeseries(_chunked(body[:-200], 64)))
+
+
+def test_iter_frames_is_lazy(insta_ts_1, insta_ts_2):
+    body = json.dumps(_site_json(insta_ts_1, insta_ts_2)).encode("utf-8")
+    frames = io.iter_frames(_chunked(body, 16))
+    first = next(frames)
+    assert first.columns.get_level_values("param")[0] == "Streamflow, ft&#179;/s"
+
+
+def test_read_nwis_stream_peak_memory():
+    import tracemalloc
+
+    times = pandas.date_range("2018-01-01", periods=20000, freq="15min")
+    ts = [
+        _ts_json(
+            "Param {}".format(p),
+            times.strftime("%Y-%m-%dT%H:%M:%S.000-05:00"),
+            numpy.arange(len(times)) / 7,
+        )
+        for p in range(5)
+    ]
+    body = json.dumps(_site_json(*ts)).encode("utf-8")
+    del ts
+
+    def peak(func):
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+    full = peak(lambda: io.read_nwis(json.loads(body)))
+    streamed = peak(lambda: io.read_nwis_stream(_chunked(body, 65536)))
+    assert streamed < full / 2
+
+
+def test_read_nwis_stream_from_server(insta_ts_1, insta_ts_2):
+    from dockside.client import Client
+    from .util import FakeNWIS
+
+    site_json = _site_json(insta_ts_1, insta_ts_2)
+    with FakeNWIS(default=(200, json.dumps(site_json), None)) as server:
+        with Client(base_url=server.url) as client:
+            r = io.fetch_nwis(
+                "A", "2012-10-01", "2012-10-02", client=client, stream=True
+            )
+            result = io.read_nwis_stream(r)
+    pdtest.assert_frame_equal(result, io.read_nwis(site_json))
+
+
+def _iter_server_body(path):
+    from urllib.parse import parse_qs, urlsplit
+
+    query = parse_qs(urlsplit(path).query)
+    start = query["startDT"][0]
+    return json.dumps(
+        _site_json(
+            _ts_json("Flow", [start + "T00:00:00.000-05:00"], [1.0]),
+            _ts_json("Stage", [start + "T00:00:00.000-05:00"], [2.0]),
+        )
+    )
+
+
+def test_iter_nwis():
+    from dockside.client import Client
+    from .util import FakeNWIS
+
+    with FakeNWIS(default=(200, _iter_server_body, None)) as server:
+        with Client(base_url=server.url) as client:
+            pieces = list(
+                io.iter_nwis(
+                    ["A", "B"], "2012-10-15", "2012-12-10", chunk="MS", client=client
+                )
+            )
+
+    assert len(server.requests) == 6
+    assert sorted((site, param) for site, param, _ in pieces) == sorted(
+        [(s, p) for s in "AB" for p in ["Flow", "Stage"]] * 3
+    )
+    flow_a = io._stitch([df for s, p, df in pieces if (s, p) == ("A", "Flow")])
+    assert flow_a.index.day.tolist() == [15, 1, 1]
+    assert flow_a.columns.tolist() == [("Flow", "qual"), ("Flow", "value")]
+
+
+def test_iter_nwis_errors_and_close():
+    from dockside.client import Client
+    from .util import FakeNWIS
+
+    with FakeNWIS(default=(200, _iter_server_body, None)) as server:
+        with Client(base_url=server.url) as client:
+            server.responses = [(404, b"", None)]
+            with pytest.raises(requests.HTTPError):
+                list(io.iter_nwis(["A"], "2012-10-01", "2012-10-02", client=client))
+
+            sites = ["S{}".format(i) for i in range(50)]
+            pieces = io.iter_nwis(sites, "2012-10-01", "2012-10-02", client=client)
+            first = next(pieces)
+            pieces.close()
+
+    # at most max_workers requests, plus one to refill, after the error
+    assert first[0] in sites[:5]
+    assert len(server.requests) <= 1 + 5
+
+
+RDB_IV = """\
+# ---------------------------------- WARNING ----------------------------------
+# Some of the data that you have obtained from this U.S. Geological Survey database
+#
+# Data provided for site 14211500
+#            TS   parameter     Description
+#         69928       00060     Discharge, cubic feet per second
+#         69929       00065     Gage height, feet
+#
+# Data-value qualification codes included in this output:
+#     A  Approved for publication -- Processed and reviewed by the USGS.
+#     P  Provisional data subject to revision.
+#     e  Value has been estimated.
+#
+agency_cd	site_no	datetime	tz_cd	69928_00060	69928_00060_cd	69929_00065	69929_00065_cd
+5s	15s	20d	6s	14n	10s	14n	10s
+USGS	14211500	2018-11-04 01:45	PDT	10.5	A	1.2	A
+USGS	14211500	2018-11-04 01:00	PST	11	P:e		
+USGS	14211500	2018-11-04 01:15	PST	Ice	P	1.4	P
+#
+# Data provided for site 14211010
+#            TS   parameter     Description
+#         70001       00060     Discharge, cubic feet per second
+#
+agency_cd	site_no	datetime	tz_cd	70001_00060	70001_00060_cd
+5s	15s	20d	6s	14n	10s
+USGS	14211010	2018-11-04 01:00	PST	3.5	A
+"""
+
+RDB_DV = """\
+# Data provided for site 14211500
+#    TS_ID  Parameter Statistic     Description
+#   153540      00060     00003     Discharge, cubic feet per second (Mean)
+#
+agency_cd	site_no	datetime	153540_00060_00003	153540_00060_00003_cd
+5s	15s	20d	14n	10s
+USGS	14211500	2018-01-01	100	A
+USGS	14211500	2018-01-02	101	A:e
+"""
+
+
+def test_read_nwis_rdb():
+    result = io.read_nwis_rdb(RDB_IV.encode("utf-8"), by_site=True)
+    assert list(result) == ["14211500", "14211010"]
+
+    df = result["14211500"]
+    assert df.columns.tolist() == [
+        ("Discharge, cubic feet per second", "qual"),
+        ("Discharge, cubic feet per second", "value"),
+        ("Gage height, feet", "qual"),
+        ("Gage height, feet", "value"),
+    ]
+    assert df.columns.names == ["param", "var"]
+    # mixed PDT/PST rows are converted to UTC
+    assert df.index.tolist() == [
+        Timestamp("2018-11-04 08:45", tz="UTC"),
+        Timestamp("2018-11-04 09:00", tz="UTC"),
+        Timestamp("2018-11-04 09:15", tz="UTC"),
+    ]
+    flow = df["Discharge, cubic feet per second"]
+    assert flow["qual"].tolist() == ["A", "P,e", "P,Ice"]
+    assert flow["value"].tolist()[:2] == [10.5, 11.0]
+    assert numpy.isnan(flow["value"].iloc[2])
+    assert df[("Gage height, feet", "qual")].isna().tolist() == [False, True, False]
+
+    other = result["14211010"]
+    assert str(other.index.tz) == "UTC-08:00"
+    assert other.iloc[0].tolist() == ["A", 3.5]
+
+
+def test_read_nwis_rdb_daily():
+    df = io.read_nwis_rdb(RDB_DV, daily=True)
+    assert df.columns.tolist() == [
+        ("Discharge, cubic feet per second", "Mean", "qual"),
+        ("Discharge, cubic feet per second", "Mean", "value"),
+    ]
+    assert df.index.tz is None
+    assert df.iloc[:, 0].tolist() == ["A", "A,e"]
+
+
+def test_read_nwis_rdb_matches_json(insta_ts_1, insta_ts_2):
+    ts = [
+        dict(t, sourceInfo={"siteCode": [{"value": "01"}]})
+        for t in (insta_ts_1, insta_ts_2)
+    ]
+    for i, t in enumerate(ts):
+        t["variable"] = dict(t["variable"], variableCode=[{"value": "00060"}])
+        t["values"] = [dict(t["values"][0], method=[{"methodID": i}])]
+    rows = [
+        "agency_cd\tsite_no\tdatetime\ttz_cd\t0_00060\t0_00060_cd\t1_00060\t1_00060_cd",
+        "5s\t15s\t20d\t6s\t14n\t10s\t14n\t10s",
+    ]
+    by_time = {}
+    for i, t in enumerate(ts):
+        for rec in t["values"][0]["value"]:
+            row = by_time.setdefault(rec["dateTime"], ["", "", "", ""])
+            row[2 * i : 2 * i + 2] = [rec["value"], ":".join(rec["qualifiers"])]
+    for stamp, cells in sorted(by_time.items()):
+        rows.append(
+            "\t".join(["USGS", "01", stamp[:16].replace("T", " "), "CDT", *cells])
+        )
+    rdb = "#    0 00060 {}\n#    1 00060 {}\n".format(
+        *[t["variable"]["variableName"] for t in ts]
+    ) + "\n".join(rows)
+
+    expected = io.read_nwis({"value": {"timeSeries": ts}})
+    pdtest.assert_frame_equal(io.read_nwis_rdb(rdb), expected)
+
+
+def test_read_nwis_rdb_empty():
+    assert io.read_nwis_rdb("# No sites found matching all criteria\n") is None
+    assert io.read_nwis_rdb("", by_site=True) == {}
+
+
+@pytest.mark.parametrize("encoded", [True, False])
+def test_download_nwis(tmp_path, insta_ts_1, insta_ts_2, encoded):
+    import gzip
+    from dockside.client import Client
+    from .util import FakeNWIS
+
+    site_json = _site_json(insta_ts_1, insta_ts_2)
+    body = json.dumps(site_json).encode("utf-8")
+    if encoded:
+        served = (200, gzip.compress(body), {"Content-Encoding": "gzip"})
+    else:
+        served = (200, body, None)
+
+    with FakeNWIS(default=served) as server:
+        with Client(base_url=server.url) as client:
+            fpath = io.download_nwis(
+                "A", "2012-10-01", "2012-10-02", tmp_path / "A.json.gz", client=client
+            )
+
+    assert fpath == tmp_path / "A.json.gz"
+    assert list(tmp_path.iterdir()) == [fpath]
+    if encoded:
+        # passed through without decompressing
+        assert fpath.read_bytes() == served[1]
+    assert gzip.decompress(fpath.read_bytes()) == body
+    pdtest.assert_frame_equal(io.read_nwis_file(fpath), io.read_nwis(site_json))
+
+
+@pytest.mark.parametrize("encoded", [True, False])
+def test_download_nwis_cached_client(tmp_path, insta_ts_1, encoded):
+    import gzip
+    from dockside.cache import ResponseCache
+    from dockside.client import Client
+    from .util import FakeNWIS
+
+    site_json = _site_json(insta_ts_1)
+    body = json.dumps(site_json).encode("utf-8")
+    if encoded:
+        served = (200, gzip.compress(body), {"Content-Encoding": "gzip"})
+    else:
+        served = (200, body, None)
+
+    cache = ResponseCache(tmp_path / "responses")
+    with FakeNWIS(default=served) as server:
+        with Client(base_url=server.url, cache=cache) as client:
+            first = io.download_nwis(
+                "A", "2012-10-01", "2012-10-02", tmp_path / "1.json.gz", client=client
+            )
+            io.fetch_nwis("A", "2012-10-01", "2012-10-02", client=client)
+            second = io.download_nwis(
+                "A", "2012-10-01", "2012-10-02", tmp_path / "2.json.gz", client=client
+            )
+
+    # the streamed download is not cached, the plain fetch is and serves the second
+    assert len(server.requests) == 2
+    for fpath in (first, second):
+        assert gzip.decompress(fpath.read_bytes()) == body
+        pdtest.assert_frame_equal(io.read_nwis_file(fpath), io.read_nwis(site_json))
+
+
+def test_download_nwis_error(tmp_path):
+    from dockside.client import Client
+    from .util import FakeNWIS
+
+    with FakeNWIS(default=(404, b"", None)) as server:
+        with Client(base_url=server.url) as client:
+            with pytest.raises(requests.HTTPError):
+                io.download_nwis(
+                    "A", "2012-10-01", "2012-10-02", tmp_path / "A.gz", client=client
+                )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_read_nwis_file(tmp_path, insta_ts_1):
+    site_json = _site_json(insta_ts_1)
+    plain = tmp_path / "plain.json"
+    plain.write_text(json.dumps(site_json, indent=2))
+    pdtest.assert_frame_equal(io.read_nwis_file(plain), io.read_nwis(site_json))
+
+    import gzip
+
+    rdb = tmp_path / "daily.rdb.gz"
+    rdb.write_bytes(gzip.compress(RDB_DV.encode("utf-8")))
+    pdtest.assert_frame_equal(
+        io.read_nwis_file(rdb, daily=True), io.read_nwis_rdb(RDB_DV, daily=True)
+    )
+
+
+@pytest.fixture
+def nwis_frame(insta_ts_1, insta_ts_2):
+    return io.read_nwis(_site_json(insta_ts_1, insta_ts_2), daily=False)
+
+
+@pytest.mark.parametrize("ext", [".parquet", ".feather"])
+@pytest.mark.parametrize("memory_map", [True, False])
+def test_cache_roundtrip_binary(tmp_path, nwis_frame, ext, memory_map):
+    pytest.importorskip("pyarrow")
+    fpath = io.write_cache(nwis_frame, tmp_path / ("cache" + ext))
+    result = io.read_cache(fpath, memory_map=memory_map)
+    pdtest.assert_frame_equal(result, nwis_frame)
+
+
+@pytest.mark.parametrize("daily", [True, False])
+def test_cache_roundtrip_csv_detects_header(tmp_path, daily_ts_1, nwis_frame, daily):
+    df = io.read_nwis(_site_json(daily_ts_1), daily=True) if daily else nwis_frame
+    fpath = io.write_cache(df, tmp_path / "cache.csv")
+    result = io.read_cache(fpath)
+    assert result.columns.nlevels == df.columns.nlevels
+    assert result.columns.tolist() == df.columns.tolist()
+    assert len(result) == len(df)
+
+
+@pytest.mark.parametrize(
+    ("fmt", "expected"),
+    [("parquet", "parquet"), ("feather", "feather"), ("csv", "csv")],
+)
+def test_cache_format_sniffs_contents(tmp_path, nwis_frame, fmt, expected):
+    pytest.importorskip("pyarrow")
+    fpath = io.write_cache(nwis_frame, tmp_path / "cache.dat", fmt=fmt)
+    assert io.cache_format(fpath) == expected
+    pdtest.assert_frame_equal(io.read_cache(fpath), io.read_cache(fpath))
+
+
+def test_write_cache_falls_back_to_csv(tmp_path, nwis_frame):
+    with mock.patch.object(io, "_import_pyarrow", return_value=None):
+        with pytest.warns(UserWarning):
+            fpath = io.write_cache(nwis_frame, tmp_path / "cache.parquet")
+    assert fpath == tmp_path / "cache.csv"
+    assert io.cache_format(fpath) == "csv"
+
+
+def test_write_cache_bad_format(tmp_path, nwis_frame):
+    with pytest.raises(ValueError):
+        io.write_cache(nwis_frame, tmp_path / "cache.xlsx", fmt="xlsx")
+
+
+@pytest.mark.parametrize("qual", ["category", "bitmask"])
+def test_read_nwis_compact_qual(insta_ts_1, insta_ts_2, qual):
+    insta_ts_1["values"][0]["value"][2]["qualifiers"] = ["P", "e"]
+    site_json = _site_json(insta_ts_1, insta_ts_2)
+    expected = io.read_nwis(site_json)
+    result = io.read_nwis(site_json, qual=qual)
+
+    column = result[("Streamflow, ft&#179;/s", "qual")]
+    if qual == "category":
+        assert isinstance(column.dtype, pandas.CategoricalDtype)
+        decoded = column.astype(str).tolist()
+    else:
+        assert column.dtype == numpy.uint32
+        decoded = io.decode_qualifiers(column)
+    assert decoded == expected[("Streamflow, ft&#179;/s", "qual")].tolist()
+    pdtest.assert_frame_equal(
+        result.xs("value", axis="columns", level="var"),
+        expected.xs("value", axis="columns", level="var"),
+    )
+
+
+def test_read_nwis_downcast(insta_ts_1):
+    result = io.read_nwis(_site_json(insta_ts_1), downcast=True)
+    column = result[("Streamflow, ft&#179;/s", "value")]
+    assert column.dtype == numpy.float32
+    numpy.testing.assert_allclose(
+        column, [1.79, 1.79, 1.79, 1.82, 1.79, 1.81], rtol=1e-6
+    )
+
+
+def test_read_nwis_bad_qual(insta_ts_1):
+    with pytest.raises(ValueError):
+        io.read_nwis(_site_json(insta_ts_1), qual="bits")
+
+
+def test_encode_qualifiers():
+    masks = io.encode_qualifiers(["A", "P,e", "", "Ice,P", "A"])
+    assert masks.dtype == numpy.uint32
+    assert masks[0] == masks[4] == 1
+    assert masks[1] == 0b110
+    assert masks[2] == 0
+    assert io.decode_qualifiers(masks) == ["A", "P,e", "", "P,Ice", "A"]
+
+
+def test_encode_qualifiers_unknown():
+    with pytest.warns(UserWarning, match="Zzz"):
+        masks = io.encode_qualifiers(["A,Zzz"])
+    assert masks[0] == 1 | io.QUALIFIER_OTHER
+
+
+@pytest.mark.parametrize("qual", ["category", "bitmask"])
+def test_read_nwis_memory_footprint(qual):
+    times = pandas.date_range("2018-01-01", periods=35040, freq="15min")
+    ts = _ts_json(
+        "Flow", times.strftime("%Y-%m-%dT%H:%M:%S.000-05:00"), numpy.arange(35040) / 3
+    )
+    for n, rec in enumerate(ts["values"][0]["value"]):
+        rec["qualifiers"] = ["P"] if n % 10 else ["P", "e"]
+    site_json = _site_json(ts)
+
+    default = io.read_nwis(site_json)["Flow"]
+    compact = io.read_nwis(site_json, qual=qual, downcast=True)["Flow"]
+
+    def nbytes(column):
+        return column.memory_usage(deep=True, index=False)
+
+    # per-row python strings are what `qual="object"` holds in older pandas
+    assert nbytes(compact["qual"]) < nbytes(default["qual"].astype(object)) / 10
+    assert nbytes(compact["qual"]) <= nbytes(default["qual"])
+    assert nbytes(compact["value"]) == nbytes(default["value"]) / 2
+
+
+@pytest.mark.parametrize("daily", [True, False])
+def test__nwis_request_series(daily):
+    _, params = io._nwis_request(
+        "https://nwis",
+        "A",
+        "2018-01-01",
+        "2018-01-31",
+        daily=daily,
+        parameters=[65, "00060"],
+        statistics="3",
+    )
+    assert params["parameterCd"] == "00060,00065"
+    assert params.get("statCd") == ("00003" if daily else None)
+
+
+def _coded(ts, param_cd, stat_cd=None):
+    ts["variable"]["variableCode"] = [{"value": param_cd}]
+    if stat_cd is not None:
+        ts["variable"]["options"]["option"][0]["optionCode"] = stat_cd
+    return ts
+
+
+def test_read_nwis_selects_series(insta_ts_1, insta_ts_2):
+    site_json = {
+        "value": {
+            "timeSeries": [_coded(insta_ts_1, "00060"), _coded(insta_ts_2, "00065")]
+        }
+    }
+    expected = io.read_nwis({"value": {"timeSeries": [insta_ts_1]}})
+    with mock.patch.object(io, "_parse_ts", wraps=io._parse_ts) as parse:
+        result = io.read_nwis(site_json, parameters=60)
+    parse.assert_called_once()
+    pdtest.assert_frame_equal(result, expected)
+
+    body = json.dumps(site_json).encode("utf-8")
+    streamed = io.read_nwis_stream(_chunked(body, 64), parameters="00060")
+    pdtest.assert_frame_equal(streamed, expected)
+
+
+def test_read_nwis_selects_statistics(daily_ts_1, daily_ts_2):
+    site_json = {
+        "value": {
+            "timeSeries": [
+                _coded(daily_ts_1, "00060", "00003"),
+                _coded(daily_ts_2, "00060", "00001"),
+            ]
+        }
+    }
+    result = io.read_nwis(site_json, daily=True, statistics=["00001"])
+    expected = io.read_nwis({"value": {"timeSeries": [daily_ts_2]}}, daily=True)
+    pdtest.assert_frame_equal(result, expected)
+    # statistic codes do not apply to instantaneous values
+    assert io.read_nwis(site_json, statistics=1).shape[1] == 4
+
+
+def test_read_nwis_rdb_selects_series():
+    df = io.read_nwis_rdb(RDB_IV, parameters="00065", by_site=True)
+    assert df["14211500"].columns.tolist() == [
+        ("Gage height, feet", "qual"),
+        ("Gage height, feet", "value"),
+    ]
+    assert df.get("14211010") is None
+    assert io.read_nwis_rdb(RDB_DV, daily=True, statistics="00001") is None
+
+
+@pytest.mark.parametrize(
+    ("info", "expected"),
+    [
+        (
+            {
+                "defaultTimeZone": {"zoneOffset": "-08:00"},
+                "siteUsesDaylightSavingsTime": True,
+            },
+            "America/Los_Angeles",
+        ),
+        (
+            {
+                "defaultTimeZone": {"zoneOffset": "-07:00"},
+                "siteUsesDaylightSavingsTime": False,
+            },
+            None,
+        ),
+        (None, None),
+    ],
+)
+def test__json_timezone(insta_ts_1, info, expected):
+    if info is not None:
+        insta_ts_1["sourceInfo"] = {"timeZoneInfo": info}
+    assert io._json_timezone({"value": {"timeSeries": [insta_ts_1]}}) == expected
@@ -1,5 +1,4 @@
 from pathlib import Path
-from pkg_resources import resource_filename
 from textwrap import dedent
 from tempfile import TemporaryDirectory
 
@@ -12,6 +11,9 @@ from dockside import nwis
 
 
 class FakeResponse:
+    def raise_for_status(self):
+        pass
+
     def json(self):
         return "fake json response"
 
@@ -40,7 +42,9 @@ def test_daily_json(fetch, station):
     data2 = station.daily_json
 
     assert data == data2 == "fake json response"
-    fetch.assert_called_once_with(station.site, station.start, station.end, daily=True)
+    fetch.assert_called_once_with(
+        station.site, station.start, station.end, daily=True, client=station.client
+    )
 
 
 @patch.object(nwis, "fetch_nwis", return_value=FakeResponse())
@@ -50,7 +54,9 @@ def test_insta_json(fetch, station):
     data2 = station.insta_json
 
     assert data == data2 == "fake json response"
-    fetch.assert_called_once_with(station.site, station.start, station.end, daily=False)
+    fetch.assert_called_once_with(
+        station.site, station.start, station.end, daily=False, client=station.client
+    )
 
 
 @patch.object(nwis, "read_nwis", return_value="fake data")
@@ -61,7 +67,9 @@ def test_daily_data(fetch, read, station):
     data2 = station.daily_data
 
     assert data == data2 == "fake data"
-    fetch.assert_called_once_with(station.site, station.start, station.end, daily=True)
+    fetch.assert_called_once_with(
+        station.site, station.start, station.end, daily=True, client=station.client
+    )
     read.assert_called_once_with("fake json response", daily=True)
 
 
@@ -73,10 +81,91 @@ def test_insta_data(fetch, read, station):
     data2 = station.insta_data
 
     assert data == data2 == "fake data"
-    fetch.assert_called_once_with(station.site, station.start, station.end, daily=False)
+    fetch.assert_called_once_with(
+        station.site, station.start, station.end, daily=False, client=station.client
+    )
     read.assert_called_once_with("fake json response", daily=False)
 
 
+@patch.object(nwis, "aggregate", return_value="fake daily data")
+@patch.object(nwis, "read_nwis", return_value="fake data")
+@patch.object(nwis, "fetch_nwis", return_value=FakeResponse())
+def test_daily_data_derived(fetch, read, aggregate):
+    station = nwis.Station(14211500, "2018-10-01", "2018-10-30", derive_daily=True)
+    assert station.daily_data == "fake daily data"
+    assert station.insta_data == "fake data"
+    fetch.assert_called_once_with(
+        station.site, station.start, station.end, daily=False, client=station.client
+    )
+    aggregate.assert_called_once_with("fake data", tz=None)
+
+
+def _dst_json():
+    # hourly values of 2018-03-10 through 2018-03-12 at a Pacific site
+    index = pandas.date_range(
+        "2018-03-10", "2018-03-12 23:00", freq="h", tz="America/Los_Angeles"
+    )
+    values = [
+        {
+            "value": str(t.hour),
+            "qualifiers": ["A"],
+            "dateTime": t.isoformat(timespec="milliseconds"),
+        }
+        for t in index
+    ]
+    info = {
+        "defaultTimeZone": {"zoneOffset": "-08:00"},
+        "siteUsesDaylightSavingsTime": True,
+    }
+    ts = {
+        "variable": {"variableName": "Flow"},
+        "sourceInfo": {"timeZoneInfo": info},
+        "values": [{"value": values}],
+    }
+    return {"value": {"timeSeries": [ts]}}
+
+
+@pytest.mark.parametrize("told", [True, False])
+@patch.object(nwis, "fetch_nwis")
+def test_daily_data_derived_across_dst(fetch, told):
+    fetch.return_value.json.return_value = _dst_json()
+    tz = "America/Los_Angeles" if told else None
+    station = nwis.Station(
+        14211500,
+        "2018-03-10",
+        "2018-03-12",
+        derive_daily=True,
+        frame_cache=False,
+        catalog=False,
+        tz=tz,
+    )
+    daily = station.daily_data
+    assert daily.index.strftime("%Y-%m-%d").tolist() == [
+        "2018-03-10",
+        "2018-03-11",
+        "2018-03-12",
+    ]
+    # local hours 0 through 23 every day, in UTC days they would wrap around
+    assert daily[("Flow", "Minimum", "value")].tolist() == [0, 0, 0]
+    assert daily[("Flow", "Maximum", "value")].tolist() == [23, 23, 23]
+
+
+@patch.object(nwis, "read_nwis_stream")
+@patch.object(nwis, "fetch_nwis")
+def test_daily_data_derived_needs_tz(fetch, read_stream):
+    read_stream.return_value = nwis.read_nwis(_dst_json())
+    station = nwis.Station(
+        14211500,
+        "2018-03-10",
+        "2018-03-12",
+        derive_daily=True,
+        stream=True,
+        frame_cache=False,
+    )
+    with pytest.raises(ValueError):
+        station.daily_data
+
+
 @pytest.mark.parametrize(
     ("daily", "fname"),
     [
@@ -89,18 +178,209 @@ def test_insta_data(fetch, read, station):
 @pytest.mark.parametrize("exists", [True, False])
 @patch.object(nwis, "read_cache", return_value="fake data")
 @patch.object(nwis, "read_nwis", return_value=pandas.DataFrame())
+@patch.object(nwis, "fetch_nwis", return_value=FakeResponse())
 def test_station_get_data(
-    nwis_reader, cache_reader, station, daily, fname, save, force, exists
+    fetch, nwis_reader, cache_reader, station, daily, fname, save, force, exists
 ):
     fpath = station.savepath / fname
     with patch("pathlib.Path.exists", return_value=exists):
         with patch("pandas.DataFrame.to_csv", return_value=None) as to_csv:
             data = station.get_data(daily=daily, save=save, force=force)
             if not exists or force:
-                nwis_reader.assert_called_once_with(
-                    station.site, station.start, station.end, daily=daily
+                fetch.assert_called_once_with(
+                    station.site,
+                    station.start,
+                    station.end,
+                    daily=daily,
+                    client=station.client,
+                    stream=False,
                 )
+                nwis_reader.assert_called_once_with("fake json response", daily=daily)
                 if save:
                     to_csv.assert_called_once_with(fpath, encoding="utf-8")
             else:
                 cache_reader.assert_called_once_with(fpath, daily=daily)
+
+
+@pytest.mark.parametrize("daily", [True, False])
+@patch.object(nwis, "fetch_many")
+def test_station_collection(fetch_many, daily):
+    frame = pandas.DataFrame(
+        {("Flow", "value"): [1.0, 2.0]},
+        index=pandas.date_range("2018-10-01", periods=2),
+    )
+    error = ValueError("boom")
+    fetch_many.return_value = ({"A": frame, "B": frame}, {"C": error})
+
+    sc = nwis.StationCollection(
+        ["A", "B", "C"], "2018-10-01", "2018-10-30", max_workers=4
+    )
+    data = sc.daily_data if daily else sc.insta_data
+    frames = sc.daily_frames if daily else sc.insta_frames
+    errors = sc.daily_errors if daily else sc.insta_errors
+
+    fetch_many.assert_called_once_with(
+        ["A", "B", "C"], sc.start, sc.end, daily=daily, max_workers=4, client=None
+    )
+    assert list(frames) == ["A", "B"]
+    assert errors == {"C": error}
+    assert data.columns.get_level_values(0).tolist() == ["A", "B"]
+
+
+@pytest.mark.parametrize(("chunk", "expected"), [(None, "MS"), ("YS", "YS")])
+@patch.object(nwis, "iter_nwis", return_value=iter([]))
+def test_station_iter_data(iter_nwis, chunk, expected):
+    station = nwis.Station(14211500, "2018-01-01", "2018-10-30", chunk="MS")
+    assert list(station.iter_data(daily=True, chunk=chunk)) == []
+    iter_nwis.assert_called_once_with(
+        station.site,
+        station.start,
+        station.end,
+        daily=True,
+        chunk=expected,
+        max_workers=4,
+        client=None,
+    )
+
+
+@patch.object(nwis, "fetch_many")
+@patch.object(nwis, "fetch_batched")
+def test_station_collection_batched(fetch_batched, fetch_many):
+    fetch_batched.return_value = ({"A": None}, {})
+    sc = nwis.StationCollection(["A"], "2018-10-01", "2018-10-30", batch_size=50)
+    assert sc.daily_data is None
+
+    fetch_batched.assert_called_once_with(
+        ["A"], sc.start, sc.end, daily=True, batch_size=50, max_workers=8, client=None
+    )
+    fetch_many.assert_not_called()
+
+
+@patch.object(nwis, "read_nwis_chunked", return_value="fake data")
+@patch.object(nwis, "fetch_nwis")
+def test_insta_data_chunked(fetch, read_chunked):
+    station = nwis.Station(14211500, "2018-01-01", "2018-10-30", chunk="MS")
+    data = station.insta_data
+    data2 = station.insta_data
+
+    assert data == data2 == "fake data"
+    fetch.assert_not_called()
+    read_chunked.assert_called_once_with(
+        station.site,
+        station.start,
+        station.end,
+        daily=False,
+        chunk="MS",
+        client=station.client,
+    )
+
+
+@pytest.mark.parametrize("daily", [True, False])
+@patch.object(nwis, "read_nwis_stream", return_value="fake data")
+@patch.object(nwis, "fetch_nwis")
+def test_station_stream(fetch, read_stream, daily):
+    station = nwis.Station(14211500, "2018-10-01", "2018-10-30", stream=True)
+    data = station.daily_data if daily else station.insta_data
+
+    assert data == "fake data"
+    fetch.assert_called_once_with(
+        station.site,
+        station.start,
+        station.end,
+        daily=daily,
+        client=station.client,
+        stream=True,
+    )
+    fetch.return_value.raise_for_status.assert_called_once_with()
+    read_stream.assert_called_once_with(fetch.return_value, daily=daily)
+
+
+@pytest.mark.parametrize("cache_format", ["parquet", "feather"])
+def test_station_get_data_binary_cache(cache_format):
+    pytest.importorskip("pyarrow")
+    df = pandas.DataFrame(
+        {("Flow", "qual"): ["A", "P"], ("Flow", "value"): [1.0, 2.0]},
+        index=pandas.date_range("2018-10-01", periods=2, tz="UTC", name="datetime"),
+    ).rename_axis(["param", "var"], axis="columns")
+
+    with TemporaryDirectory() as datadir:
+        savepath = Path(datadir) / "nested"
+        station = nwis.Station(
+            14211500, "2018-10-01", "2018-10-30", savepath, cache_format=cache_format
+        )
+        with patch.object(station, "_download", return_value=df) as download:
+            first = station.get_data(save=True)
+            second = station.get_data(save=True)
+
+        download.assert_called_once_with(daily=False)
+        assert station._make_fpath(daily=False).suffix == "." + cache_format
+        assert station._make_fpath(daily=False).exists()
+        pandas.testing.assert_frame_equal(first, second, check_freq=False)
+
+
+@patch.object(nwis, "read_nwis_file", return_value="fake data")
+@patch.object(nwis, "download_nwis")
+def test_station_get_data_raw(download, read_file):
+    with TemporaryDirectory() as datadir:
+        station = nwis.Station(14211500, "2018-10-01", "2018-10-30", datadir, raw=True)
+        fpath = station._make_fpath(daily=True)
+        assert fpath.name == "14211500_20181001_thru_20181030_daily.json.gz"
+
+        assert station.get_data(daily=True, save=True) == "fake data"
+        download.assert_called_once_with(
+            station.site,
+            station.start,
+            station.end,
+            fpath,
+            daily=True,
+            client=None,
+        )
+        read_file.assert_called_once_with(fpath, daily=True)
+
+        fpath.touch()
+        assert station.get_data(daily=True, save=True) == "fake data"
+        assert download.call_count == 1
+        assert read_file.call_count == 2
+
+
+@pytest.mark.parametrize(
+    ("daily", "expected", "query"),
+    [
+        (
+            True,
+            "14211500_20181001_thru_20181030_daily_p00060-00065_s00003.csv",
+            {"parameters": ["60", "00065"], "statistics": 3},
+        ),
+        (
+            False,
+            "14211500_20181001_thru_20181030_insta_p00060-00065.csv",
+            {"parameters": ["60", "00065"]},
+        ),
+    ],
+)
+@patch.object(nwis, "read_nwis", return_value="fake dataframe")
+@patch.object(nwis, "fetch_nwis", return_value=FakeResponse())
+def test_station_selects_series(fetch, read, daily, expected, query):
+    with TemporaryDirectory() as datadir:
+        station = nwis.Station(
+            14211500,
+            "2018-10-01",
+            "2018-10-30",
+            datadir,
+            parameters=["60", "00065"],
+            statistics=3,
+            frame_cache=False,
+        )
+        assert station._make_fpath(daily).name == expected
+        assert station.get_data(daily=daily) == "fake dataframe"
+
+    fetch.assert_called_once_with(
+        station.site,
+        station.start,
+        station.end,
+        daily=daily,
+        client=None,
+        stream=False,
+        **query,
+    )
+    read.assert_called_once_with("fake json response", daily=daily, **query)
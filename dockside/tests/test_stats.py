@@ -0,0 +1,120 @@
+import numpy
+import pandas
+import pytest
+
+from dockside import stats
+from dockside.io import combine_sites, read_nwis
+
+
+def _insta_json(param, times, values, quals):
+    return {
+        "variable": {"variableName": param},
+        "values": [
+            {
+                "value": [
+                    {"value": str(v), "qualifiers": q, "dateTime": t}
+                    for t, v, q in zip(times, values, quals)
+                ]
+            }
+        ],
+    }
+
+
+@pytest.fixture
+def insta():
+    times = [
+        "2018-01-01T00:00:00.000-08:00",
+        "2018-01-01T12:00:00.000-08:00",
+        "2018-01-01T23:45:00.000-08:00",
+        "2018-01-02T00:00:00.000-08:00",
+        "2018-01-04T06:00:00.000-08:00",
+    ]
+    flow = _insta_json(
+        "Flow", times, [1.0, 3.0, 5.0, 2.0, 7.0], [["A"], ["A"], ["P", "e"], ["P"], []]
+    )
+    # no value on Jan 2nd
+    stage = _insta_json(
+        "Stage", times[:3] + times[4:], [0.5, 0.7, 0.6, 0.9], [["P"]] * 4
+    )
+    return read_nwis({"value": {"timeSeries": [flow, stage]}})
+
+
+def test_aggregate_daily(insta):
+    daily = stats.aggregate(insta, stats=["Mean", "Minimum", "Maximum", "Count"])
+
+    assert daily.columns.names == ["param", "stat", "var"]
+    assert daily.columns.tolist()[:4] == [
+        ("Flow", "Count", "qual"),
+        ("Flow", "Count", "value"),
+        ("Flow", "Maximum", "qual"),
+        ("Flow", "Maximum", "value"),
+    ]
+    # Jan 3rd has no data
+    assert (
+        daily.index.tolist()
+        == pandas.to_datetime(["2018-01-01", "2018-01-02", "2018-01-04"]).tolist()
+    )
+    assert daily.index.name == "datetime"
+    assert daily.index.tz is None
+
+    flow = daily["Flow"]
+    assert flow[("Mean", "value")].tolist() == [3.0, 2.0, 7.0]
+    assert flow[("Minimum", "value")].tolist() == [1.0, 2.0, 7.0]
+    assert flow[("Maximum", "value")].tolist() == [5.0, 2.0, 7.0]
+    assert flow[("Count", "value")].tolist() == [3, 1, 1]
+    assert flow[("Mean", "qual")].tolist() == ["A,P,e", "P", ""]
+
+    stage = daily["Stage"]
+    assert stage[("Mean", "value")].iloc[0] == pytest.approx(0.6)
+    assert numpy.isnan(stage[("Mean", "value")].iloc[1])
+    assert pandas.isna(stage[("Mean", "qual")].iloc[1])
+    assert stage[("Count", "value")].tolist() == [3, 0, 1]
+
+
+def test_aggregate_matches_groupby(insta):
+    daily = stats.aggregate(insta, stats=["Mean"], min_count=2)
+    values = insta.xs("value", level="var", axis="columns")
+    local = values.index.tz_localize(None)
+    expected = values.groupby(local.floor("D")).mean()
+    counts = values.groupby(local.floor("D")).count()
+    expected = expected.where(counts >= 2).dropna(how="all")
+
+    result = daily.xs(("Mean", "value"), level=["stat", "var"], axis="columns")
+    assert result.loc[expected.index].equals(expected.rename_axis(columns="param"))
+
+
+def test_aggregate_period_and_tz(insta):
+    monthly = stats.aggregate(insta, freq="M", stats=["Count"])
+    assert monthly.index.tolist() == [pandas.Timestamp("2018-01-01")]
+    assert monthly[("Flow", "Count", "value")].tolist() == [5]
+
+    eastern = stats.aggregate(insta.tz_convert("UTC"), tz="US/Eastern")
+    # 23:45 PST on Jan 1st is Jan 2nd in the eastern time zone
+    assert eastern[("Flow", "Maximum", "value")].tolist() == [3.0, 5.0, 7.0]
+
+
+@pytest.mark.parametrize("qual", ["category", "bitmask"])
+def test_aggregate_qual(insta, qual):
+    daily = stats.aggregate(insta, stats=["Mean"], qual=qual)
+    column = daily[("Flow", "Mean", "qual")]
+    if qual == "bitmask":
+        assert column.dtype == numpy.uint32
+    else:
+        assert isinstance(column.dtype, pandas.CategoricalDtype)
+
+
+def test_aggregate_nothing():
+    # `read_nwis` returns None for responses without time series
+    assert stats.aggregate(read_nwis({"value": {"timeSeries": []}})) is None
+
+
+def test_aggregate_many_sites(insta):
+    both = combine_sites({"01": insta, "02": insta.copy()})
+    daily = stats.aggregate(both)
+    assert daily.columns.names == ["site", "param", "stat", "var"]
+    assert daily["01"].equals(daily["02"])
+
+
+def test_aggregate_unknown_stat(insta):
+    with pytest.raises(ValueError):
+        stats.aggregate(insta, stats=["Median"])
@@ -0,0 +1,237 @@
+from unittest import mock
+
+import numpy
+import pandas
+from pandas import Timestamp
+import pytest
+import pandas.testing as pdtest
+
+from dockside import nwis
+from dockside.io import read_nwis
+from dockside.store import ArrayStore
+
+
+def _insta(start, periods, offset="-08:00", value=0.0, params=("Flow",)):
+    times = pandas.date_range(start, periods=periods, freq="15min")
+    series = [
+        {
+            "variable": {"variableName": param},
+            "values": [
+                {
+                    "value": [
+                        {
+                            "value": str(value + i),
+                            "qualifiers": ["P", "e"] if i % 2 else ["P"],
+                            "dateTime": t.strftime("%Y-%m-%dT%H:%M:%S.000") + offset,
+                        }
+                        for i, t in enumerate(times)
+                    ]
+                }
+            ],
+        }
+        for param in params
+    ]
+    return read_nwis({"value": {"timeSeries": series}})
+
+
+def _daily(start, end, stat="Mean"):
+    index = pandas.date_range(start, end, freq="D", name="datetime")
+    columns = pandas.MultiIndex.from_tuples(
+        [("Flow", stat, "qual"), ("Flow", stat, "value")],
+        names=["param", "stat", "var"],
+    )
+    data = {columns[0]: "A", columns[1]: numpy.arange(len(index), dtype=float)}
+    return pandas.DataFrame(data, index=index, columns=columns)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArrayStore(tmp_path / "store")
+
+
+def test_roundtrip(store):
+    df = _insta("2018-01-01", 96 * 3, params=("Flow", "Stage"))
+    store.write("A", df)
+    result = store.read("A")
+    pdtest.assert_frame_equal(result, df, check_freq=False)
+    assert str(result.index.tz) == "UTC-08:00"
+
+
+def test_read_window(store):
+    df = _insta("2018-01-01", 96 * 3)
+    store.write("A", df)
+    result = store.read("A", "2018-01-02", "2018-01-02")
+    pdtest.assert_frame_equal(
+        result, df.loc["2018-01-02":"2018-01-02"], check_freq=False
+    )
+    assert store.read("A", "2018-02-01", "2018-02-02") is None
+    assert store.read("B") is None
+
+
+def test_read_is_memory_mapped(store):
+    store.write("A", _insta("2018-01-01", 96))
+    (arrays,) = store.arrays("A").values()
+    assert isinstance(arrays["time"], numpy.memmap)
+    assert not arrays["value"].flags.writeable
+
+    # a single time series is read without copying the values
+    store.qual = "bitmask"
+    values = store.read("A", "2018-01-01", "2018-01-01")[("Flow", "value")]
+    base = values.to_numpy()
+    while base is not None and not isinstance(base, numpy.memmap):
+        base = base.base
+    assert base is not None
+
+
+def test_append_only(store):
+    first = _insta("2018-01-01", 96)
+    second = _insta("2018-01-02", 96, value=96)
+    store.write("A", first)
+    (entry,) = store._manifest("A", False)["series"]
+    time_path = store._array_path("A", False, entry, "time")
+
+    store.write("A", second)
+    (entry,) = store._manifest("A", False)["series"]
+    assert entry["generation"] == 0
+    assert entry["rows"] == 192
+    assert time_path.stat().st_size == 192 * 8
+    pdtest.assert_frame_equal(
+        store.read("A"), pandas.concat([first, second]), check_freq=False
+    )
+
+
+def test_append_recovers_from_partial_write(store):
+    store.write("A", _insta("2018-01-01", 96))
+    (entry,) = store._manifest("A", False)["series"]
+    # an append that crashed before the manifest was saved
+    with store._array_path("A", False, entry, "time").open("ab") as fp:
+        fp.write(b"\x00" * 12)
+
+    store.write("A", _insta("2018-01-02", 96))
+    assert len(store.read("A")) == 192
+
+
+def test_rewrite_replaces_overlap(store):
+    store.write("A", _insta("2018-01-02", 96))
+    (old,) = store._manifest("A", False)["series"]
+    # earlier data plus a revision of the first stored day
+    store.write("A", _insta("2018-01-01", 192, value=1000))
+
+    (entry,) = store._manifest("A", False)["series"]
+    assert entry["generation"] == 1
+    assert entry["rows"] == 192
+    assert not store._array_path("A", False, old, "time").exists()
+    result = store.read("A")
+    assert result.index.is_monotonic_increasing
+    assert result[("Flow", "value")].iloc[-1] == 1191
+
+
+def test_mixed_offsets_are_utc(store):
+    store.write("A", _insta("2018-03-10", 4, offset="-08:00"))
+    store.write("A", _insta("2018-03-12", 4, offset="-07:00"))
+    result = store.read("A")
+    assert str(result.index.tz) == "UTC"
+    assert result.index[-1] == Timestamp("2018-03-12 07:45", tz="UTC")
+
+
+def test_get_downloads_only_gaps(store):
+    def fake(site, start, end, daily):
+        return _daily(start, end)
+
+    with mock.patch.object(store, "_download", side_effect=fake) as download:
+        first = store.get("A", "2018-01-01", "2018-01-31", daily=True)
+        again = store.get("A", "2018-01-10", "2018-01-20", daily=True)
+        extended = store.get("A", "2018-01-01", "2018-02-01", daily=True)
+
+    assert download.call_args_list == [
+        mock.call("A", Timestamp("2018-01-01"), Timestamp("2018-01-31"), True),
+        mock.call("A", Timestamp("2018-02-01"), Timestamp("2018-02-01"), True),
+    ]
+    assert len(first) == 31
+    assert first.index.tz is None
+    pdtest.assert_frame_equal(
+        again, first.loc["2018-01-10":"2018-01-20"], check_freq=False
+    )
+    assert len(extended) == 32
+    assert store.coverage("A", daily=True) == [
+        (Timestamp("2018-01-01"), Timestamp("2018-02-01"))
+    ]
+
+
+def test_station_reads_from_store(store):
+    with mock.patch.object(store, "_download", return_value=None) as download:
+        store.write("A", _insta("2018-01-01", 96 * 10))
+        station = nwis.Station(
+            "A", "2018-01-03", "2018-01-04", cache=store, frame_cache=False
+        )
+        assert len(station.insta_data) == 192
+        assert len(station.get_data()) == 192
+    # `write` does not record coverage, so the window is requested once
+    download.assert_called_once()
+
+
+def test_read_keeps_the_index_unit(store):
+    df = _insta("2018-01-01", 96)
+    df.index = df.index.as_unit("s")
+    store.write("A", df)
+    assert store.read("A").index.unit == "s"
+    assert store.read("A", "2018-01-01", "2018-01-01").index.unit == "s"
+
+
+def _across_dst():
+    # a response across a DST change is parsed to UTC
+    return pandas.concat(
+        [
+            _insta("2018-03-10", 96, offset="-08:00").tz_convert("UTC"),
+            _insta("2018-03-12", 96, offset="-07:00", value=96).tz_convert("UTC"),
+        ]
+    )
+
+
+def test_read_window_across_dst(store):
+    store.write("A", _across_dst())
+    with pytest.raises(ValueError):
+        store.read("A", "2018-03-12", "2018-03-12")
+
+    result = store.read("A", "2018-03-12", "2018-03-12", tz="America/Los_Angeles")
+    assert len(result) == 96
+    assert str(result.index.tz) == "UTC-07:00"
+    assert result.index[0] == Timestamp("2018-03-12", tz="-07:00")
+
+
+def test_get_across_dst(store):
+    def fake(site, start, end, daily):
+        return _across_dst()
+
+    with mock.patch.object(store, "_download", side_effect=fake) as download:
+        whole = store.get("A", "2018-03-10", "2018-03-12")
+        # the time zone is unknown, so the window is downloaded again
+        day = store.get("A", "2018-03-12", "2018-03-12")
+        assert download.call_count == 2
+        assert len(whole) == len(day) == 192
+
+        day = store.get("A", "2018-03-12", "2018-03-12", tz="America/Los_Angeles")
+        assert download.call_count == 2
+        assert len(day) == 96
+        assert store._manifest("A", False)["tz"] is None
+
+
+def test_rewrite_while_mapped_on_windows(store):
+    store.write("A", _insta("2018-01-02", 96))
+    (old,) = store._manifest("A", False)["series"]
+    old_path = store._array_path("A", False, old, "time")
+    real_unlink = type(old_path).unlink
+
+    def locked(path, missing_ok=False):
+        if path == old_path:
+            raise PermissionError(path)
+        return real_unlink(path, missing_ok=missing_ok)
+
+    with mock.patch.object(type(old_path), "unlink", locked):
+        store.write("A", _insta("2018-01-01", 192, value=1000))
+    assert old_path.exists()
+    assert len(store.read("A")) == 192
+
+    # removed by the next write once the file is no longer mapped
+    store.write("A", _insta("2018-01-03", 4))
+    assert not old_path.exists()
@@ -34,3 +34,69 @@ def requires(module, modulename):
         return inner_wrapper
 
     return outer_wrapper
+
+
+class FakeNWIS(object):
+    """Local stand-in for the NWIS web services.
+
+    Responses are served from a queue of ``(status, body, headers)`` tuples;
+    once the queue is empty, `default` is served. Every request's path and
+    query string is recorded in `requests` and the client address of every
+    connection in `connections`.
+    """
+
+    def __init__(self, default=(200, b"{}", None)):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        fake = self
+        self.default = default
+        self.responses = []
+        self.requests = []
+        self.connections = set()
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests.append(self.path)
+                    fake.connections.add(self.client_address)
+                    queued = fake.responses.pop(0) if fake.responses else None
+                status, body, headers = queued or fake.default
+                if callable(body):
+                    body = body(self.path)
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={"poll_interval": 0.01},
+            daemon=True,
+        )
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return "http://{}:{}".format(host, port)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
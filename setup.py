@@ -40,8 +40,10 @@ CLASSIFIERS = [
     "Programming Language :: Python :: 3.10",
     "Programming Language :: Python :: 3.11",
 ]
-INSTALL_REQUIRES = ["pandas", "requests"]
+INSTALL_REQUIRES = ["pandas>=2.0", "requests"]
+EXTRAS_REQUIRE = {"arrow": ["pyarrow"], "async": ["aiohttp"]}
 PACKAGE_DATA = {}
+ENTRY_POINTS = {"console_scripts": ["dockside = dockside.cli:main"]}
 
 setup(
     name=NAME,
@@ -56,4 +58,6 @@ setup(
     platforms=PLATFORMS,
     classifiers=CLASSIFIERS,
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
+    entry_points=ENTRY_POINTS,
 )